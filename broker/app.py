@@ -1,4 +1,10 @@
 from src import app, os
 
 if __name__ == "__main__":
-    app.run(host=os.environ["HOSTNAME"],port=5000)
\ No newline at end of file
+    if app.config["SERVER_MODE"] == "asgi":
+        import uvicorn
+        from src.asgi import asgi_app
+
+        uvicorn.run(asgi_app, host=os.environ["HOSTNAME"], port=5000)
+    else:
+        app.run(host=os.environ["HOSTNAME"],port=5000)
\ No newline at end of file
@@ -2,6 +2,72 @@ import os
 
 class Config:
     """Base config."""
+    # upper bound on the number of logs returned by a single consume request
+    CONSUME_MAX_MESSAGES = int(os.environ.get("CONSUME_MAX_MESSAGES", 1000))
+    # upper bound on how long a consume request may wait for new logs
+    CONSUME_MAX_WAIT_MS = int(os.environ.get("CONSUME_MAX_WAIT_MS", 30000))
+    # streaming consume: maximum number of open streams, credits granted
+    # when a stream is opened and interval of the heartbeats of idle streams
+    CONSUME_MAX_STREAMS = int(os.environ.get("CONSUME_MAX_STREAMS", 64))
+    CONSUME_STREAM_CREDITS = int(os.environ.get("CONSUME_STREAM_CREDITS", 1000))
+    CONSUME_STREAM_HEARTBEAT_MS = int(os.environ.get("CONSUME_STREAM_HEARTBEAT_MS", 15000))
+    # group commit of produced logs: how long the appender waits for more
+    # logs after the first one arrives and how many logs it writes at most
+    # in a single transaction
+    LOG_APPENDER_LINGER_MS = float(os.environ.get("LOG_APPENDER_LINGER_MS", 2))
+    LOG_APPENDER_MAX_BATCH = int(os.environ.get("LOG_APPENDER_MAX_BATCH", 500))
+    # durability window of consumer offsets: dirty offsets are written every
+    # interval or as soon as this many are pending, an interval of 0 writes
+    # every offset synchronously
+    OFFSET_CHECKPOINT_INTERVAL_MS = float(os.environ.get("OFFSET_CHECKPOINT_INTERVAL_MS", 1000))
+    OFFSET_CHECKPOINT_MAX_DIRTY = int(os.environ.get("OFFSET_CHECKPOINT_MAX_DIRTY", 1000))
+    # memory budget of the in-memory tail of recent logs, shared by all
+    # partitions and per partition (0 disables the cache)
+    TAIL_CACHE_MAX_BYTES = int(os.environ.get("TAIL_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+    TAIL_CACHE_PARTITION_MAX_BYTES = int(os.environ.get("TAIL_CACHE_PARTITION_MAX_BYTES", 4 * 1024 * 1024))
+    # upper bound on the size of a request body, messages themselves are
+    # not limited by the log table
+    MAX_CONTENT_LENGTH = int(os.environ.get("MAX_CONTENT_LENGTH", 16 * 1024 * 1024))
+    # shared secret of the managers: requests carrying it in their
+    # X-Trusted-Hop header were validated by a manager and are not
+    # validated again (empty to validate every request)
+    TRUSTED_HOP_TOKEN = os.environ.get("TRUSTED_HOP_TOKEN", "")
+    # storage engine of the logs: "postgres" (a row of the log table per
+    # log) or "segment" (append-only segment files per partition)
+    LOG_STORAGE = os.environ.get("LOG_STORAGE", "postgres")
+    SEGMENT_DIR = os.environ.get("SEGMENT_DIR", "/app/segments")
+    SEGMENT_MAX_BYTES = int(os.environ.get("SEGMENT_MAX_BYTES", 64 * 1024 * 1024))
+    SEGMENT_INDEX_INTERVAL_BYTES = int(os.environ.get("SEGMENT_INDEX_INTERVAL_BYTES", 4096))
+    SEGMENT_FSYNC = os.environ.get("SEGMENT_FSYNC", "1") == "1"
+    # partition the log table per topic and partition index (needs
+    # Postgres 11 or newer, only used by the "postgres" log storage)
+    LOG_TABLE_PARTITIONING = os.environ.get("LOG_TABLE_PARTITIONING", "0") == "1"
+    # default retention of the topics (0 keeps logs forever), the reaper
+    # enforces it every RETENTION_CHECK_INTERVAL_MS and deletes at most
+    # RETENTION_DELETE_BATCH logs per transaction
+    RETENTION_MS = int(os.environ.get("RETENTION_MS", 0))
+    RETENTION_BYTES = int(os.environ.get("RETENTION_BYTES", 0))
+    RETENTION_MESSAGES = int(os.environ.get("RETENTION_MESSAGES", 0))
+    RETENTION_CHECK_INTERVAL_MS = float(os.environ.get("RETENTION_CHECK_INTERVAL_MS", 60000))
+    RETENTION_DELETE_BATCH = int(os.environ.get("RETENTION_DELETE_BATCH", 10000))
+    # optional snapshot of the in-memory state of the broker, used to speed
+    # up restarts (an empty path disables it)
+    STATE_SNAPSHOT_PATH = os.environ.get("STATE_SNAPSHOT_PATH", "")
+    STATE_SNAPSHOT_INTERVAL_MS = float(os.environ.get("STATE_SNAPSHOT_INTERVAL_MS", 60000))
+    # reads of logs the slave has not replayed yet: "master" reads them from
+    # the master, "wait" waits up to REPLICA_WAIT_MS for the slave first and
+    # "slave" always reads from the slave; the replay position of the slave
+    # is polled every REPLICA_POLL_MS while logs wait to be replayed
+    REPLICA_READ_POLICY = os.environ.get("REPLICA_READ_POLICY", "wait")
+    REPLICA_WAIT_MS = float(os.environ.get("REPLICA_WAIT_MS", 50))
+    REPLICA_POLL_MS = float(os.environ.get("REPLICA_POLL_MS", 10))
+    # "flask" (threaded Werkzeug server) or "asgi" (asyncio server backed by
+    # asyncpg pools of the given size)
+    SERVER_MODE = os.environ.get("SERVER_MODE", "flask")
+    ASYNC_DB_POOL_MIN_SIZE = int(os.environ.get("ASYNC_DB_POOL_MIN_SIZE", 2))
+    ASYNC_DB_POOL_MAX_SIZE = int(os.environ.get("ASYNC_DB_POOL_MAX_SIZE", 20))
+    # prepare the hot-path SQL statements server-side once per connection
+    SQL_PREPARED_STATEMENTS = os.environ.get("SQL_PREPARED_STATEMENTS", "1") == "1"
 
 write_db_name = os.environ["WRITE_DB_NAME"]
 read_db_name = os.environ["READ_DB_NAME"]
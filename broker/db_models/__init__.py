@@ -1,3 +1,4 @@
 from db_models.consumers import Consumer as ConsumerDB
 from db_models.logs import Log as LogDB
+from db_models.producers import Producer as ProducerDB
 from db_models.topics import Topic as TopicDB
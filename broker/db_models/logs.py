@@ -1,22 +1,32 @@
-from src import db
+from src import db, app
 
 
 class Log(db.Model):
     __tablename__ = "log"
-    id = db.Column(db.Integer, primary_key=True)
+    id = db.Column(db.Integer, nullable=False)
     topic_name = db.Column(
         db.String(256),
         nullable=False,
-        primary_key=True,
     )
-    partition_index = db.Column(db.Integer,primary_key=True)
+    partition_index = db.Column(db.Integer, nullable=False)
     producer_id = db.Column(
         db.String(32),nullable=False
     )
-    message = db.Column(db.String(256), nullable=False)
+    # the body of the log, or the compressed batch of count logs starting at
+    # id (see src.compression)
+    message = db.Column(db.LargeBinary, nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=1)
+    codec = db.Column(db.String(8), nullable=False, default="none")
     timestamp = db.Column(db.Float, nullable=False)
-    __table_args__ = tuple(
-        db.UniqueConstraint("id", "topic_name", "partition_index",name="log_id_constraint")
+    # every query filters on the partition first and then on the id, so the
+    # primary key is ordered accordingly
+    __table_args__ = (
+        db.PrimaryKeyConstraint("topic_name", "partition_index", "id", name="log_pkey"),
+        # the table is partitioned per topic, and every topic per partition
+        # index (see PostgresLogStorage.add_partition)
+        {"postgresql_partition_by": "LIST (topic_name)"}
+        if app.config["LOG_TABLE_PARTITIONING"]
+        else {},
     )
     ___table_args__ = (db.ForeignKeyConstraint([topic_name, partition_index],
-                                           ["topic.name", "topic.partition_index"]), {})
\ No newline at end of file
+                                           ["topic.name", "topic.partition_index"]), {})
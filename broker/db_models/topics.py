@@ -5,6 +5,12 @@ class Topic(db.Model):
     __tablename__ = "topic"
     name = db.Column(db.String(256), primary_key=True, index=True)
     partition_index = db.Column(db.Integer, primary_key = True)
+    # retention of the logs of the topic, unlimited if null
+    retention_ms = db.Column(db.BigInteger, nullable=True)
+    retention_bytes = db.Column(db.BigInteger, nullable=True)
+    retention_messages = db.Column(db.BigInteger, nullable=True)
+    # id of the first log not removed by retention
+    log_start_offset = db.Column(db.Integer, nullable=False, default=0)
     __table_args__ = tuple(
         db.UniqueConstraint("name", "partition_index", name="topic_name_constraint")
     )
\ No newline at end of file
@@ -2,10 +2,16 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 
 from src.json_validator import expects_json
+from src.wire import WireJSONProvider, WireRequest
 import config
 import os
+import atexit
+import signal
+import sys
 
 app = Flask(__name__)
+app.request_class = WireRequest
+app.json = WireJSONProvider(app)
 app.config.from_object(config.DevConfig)
 db = SQLAlchemy(app)
 read_engine = None
@@ -36,7 +42,28 @@ with app.app_context():
 
     print("\033[94mInitializing master queue from database...\033[0m")
     master_queue.init_from_db()
-    print("\033[94mMaster queue initialized from database.\033[0m")
+    print(
+        "\033[94mMaster queue initialized from database in %.1f ms.\033[0m"
+        % master_queue.get_metrics()["startup"]["startup_ms"]
+    )
+
+    print("\033[94mStarting log appender...\033[0m")
+    master_queue.start_appender()
+
+    print("\033[94mStarting offset checkpointer...\033[0m")
+    master_queue.start_checkpointer()
+
+    print("\033[94mStarting retention reaper...\033[0m")
+    master_queue.start_reaper()
+
+    print("\033[94mStarting state snapshot...\033[0m")
+    master_queue.start_snapshot()
+    # flush the pending consumer offsets and write the snapshot on shutdown,
+    # docker stops the broker with SIGTERM which would otherwise skip the
+    # atexit handlers
+    atexit.register(master_queue.write_snapshot)
+    atexit.register(master_queue.checkpoint_offsets)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
     # print the master queue for debugging purposes
     if app.config["FLASK_ENV"] == "development":
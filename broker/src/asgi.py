@@ -0,0 +1,324 @@
+"""
+Asyncio serving mode of the broker (SERVER_MODE=asgi).
+
+The same routes as views.py, served by an ASGI app on a single event loop.
+Consumes wait for new logs and read the storage without holding a thread,
+produces are resumed once the log appender committed their logs. The rare
+metadata writes (topics, consumers) still go through the SQLAlchemy session
+and run in the thread pool.
+"""
+
+import json
+from functools import wraps
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+from src import app, master_queue, wire
+from src.async_db import AsyncDatabase
+from src.compression import check_batch, from_bytes, to_bytes
+from src.json_validator import compile_validator, is_trusted_hop
+from src.models import LogBatch
+from src.schemas import (
+    RETENTION_KEYS,
+    TOPIC_SCHEMA,
+    CONSUMER_REGISTER_SCHEMA,
+    PRODUCER_REGISTER_SCHEMA,
+    MAP_VERSION_SCHEMA,
+    PRODUCE_SCHEMA,
+    PRODUCE_BATCH_SCHEMA,
+    CONSUME_SCHEMA,
+    STREAM_SCHEMA,
+    STREAM_CREDITS_SCHEMA,
+    SIZE_SCHEMA,
+)
+
+async_db = AsyncDatabase(
+    app.config["SQLALCHEMY_DATABASE_URI"],
+    app.config["SQLALCHEMY_BINDS"]["read"],
+    app.config["ASYNC_DB_POOL_MIN_SIZE"],
+    app.config["ASYNC_DB_POOL_MAX_SIZE"],
+)
+
+
+def respond(request, content, status_code=200):
+    """Return content in the format the request accepts (see wire.py)."""
+    mimetype = wire.preferred_mimetype(parse_accept_header(request.headers.get("accept"), MIMEAccept))
+    return Response(wire.dumps(content, mimetype), status_code, media_type=mimetype)
+
+
+def failure(request, message, status_code=400):
+    return respond(request, {"status": "failure", "message": message}, status_code)
+
+
+def expects_json(schema):
+    """Validate the body of the request (JSON or msgpack, by its
+    Content-Type) against schema and pass it to the endpoint."""
+    validate = compile_validator(schema)
+
+    def decorator(f):
+        @wraps(f)
+        async def endpoint(request):
+            mimetype = request.headers.get("content-type", "").split(";")[0].strip()
+            try:
+                data = wire.loads(await request.body(), mimetype)
+            except Exception:
+                return failure(request, "Please send valid JSON data with request.")
+            if not is_trusted_hop(request.headers, app.config["TRUSTED_HOP_TOKEN"]):
+                error = validate(data)
+                if error is not None:
+                    return failure(request, error.message)
+            return await f(request, data)
+        return endpoint
+    return decorator
+
+
+def in_app_context(f, *args):
+    """Run f in the flask app context, for calls using the SQLAlchemy
+    session."""
+    with app.app_context():
+        return f(*args)
+
+
+async def index(request):
+    return PlainTextResponse("Welcome to Connectify Distributed Queue API!")
+
+
+@expects_json(TOPIC_SCHEMA)
+async def topics(request, data):
+    """Add a topic."""
+    topic_name = data["name"]
+    retention = {key: data[key] for key in RETENTION_KEYS if key in data}
+    await run_in_threadpool(
+        in_app_context, master_queue.add_topic, topic_name, data["partition_index"], retention
+    )
+    return respond(
+        request, {"status": "success", "message": f"Topic '{topic_name}' created successfully."}
+    )
+
+
+@expects_json(CONSUMER_REGISTER_SCHEMA)
+async def register_consumer(request, data):
+    """Register a consumer for a topic."""
+    await run_in_threadpool(
+        in_app_context, master_queue.add_consumer, data["topic"], data["partition_index"], data["consumer_id"]
+    )
+    return respond(request, {"status": "success"})
+
+
+@expects_json(PRODUCER_REGISTER_SCHEMA)
+async def register_producer(request, data):
+    """Register a producer for a topic, so that it may produce to the
+    partition directly."""
+    await run_in_threadpool(
+        in_app_context, master_queue.add_producer, data["topic"], data["partition_index"], data["producer_id"]
+    )
+    return respond(request, {"status": "success"})
+
+
+@expects_json(MAP_VERSION_SCHEMA)
+async def map_version(request, data):
+    """Record the version of the partition map of the primary manager."""
+    master_queue.set_map_version(data["map_version"])
+    return respond(request, {"status": "success"})
+
+
+def direct_produce_failure(request, data):
+    """Return the failure response of a produce sent straight by a client
+    that the broker rejects, None if it is not rejected (see views.py)."""
+    if is_trusted_hop(request.headers, app.config["TRUSTED_HOP_TOKEN"]):
+        return None
+    rejection = master_queue.check_direct_produce(
+        data["topic"], data["partition_index"], data["producer_id"], data.get("map_version")
+    )
+    if rejection is None:
+        return None
+    status_code, message = rejection
+    return respond(
+        request,
+        {"status": "failure", "message": message, "map_version": master_queue.get_map_version()},
+        status_code,
+    )
+
+
+@expects_json(PRODUCE_SCHEMA)
+async def produce(request, data):
+    """Add a log to a topic."""
+    rejected = direct_produce_failure(request, data)
+    if rejected is not None:
+        return rejected
+    encoding = data.get("encoding", "utf-8")
+    try:
+        message = to_bytes(data["message"], encoding)
+    except Exception:
+        return failure(request, f"Message is not valid {encoding}.")
+    await master_queue.add_logs_async(
+        data["topic"], data["partition_index"], data["producer_id"], LogBatch([message])
+    )
+    return respond(request, {"status": "success"})
+
+
+@expects_json(PRODUCE_BATCH_SCHEMA)
+async def produce_batch(request, data):
+    """Add a batch of logs to a partition of a topic, either a list of
+    messages or a payload of messages compressed as a unit."""
+    rejected = direct_produce_failure(request, data)
+    if rejected is not None:
+        return rejected
+    try:
+        if "messages" in data:
+            encoding = data.get("encoding", "utf-8")
+            batch = LogBatch([to_bytes(message, encoding) for message in data["messages"]])
+        else:
+            batch = LogBatch(
+                codec=data["codec"], payload=to_bytes(data["payload"], "base64"), count=data["count"]
+            )
+    except Exception:
+        return failure(request, "Batch is not validly encoded.")
+    if batch.is_compressed():
+        try:
+            # decompressing a large batch would hold up the event loop
+            await run_in_threadpool(check_batch, batch.codec, batch.count, batch.payload)
+        except Exception as e:
+            return failure(request, str(e))
+    offsets = await master_queue.add_logs_async(
+        data["topic"], data["partition_index"], data["producer_id"], batch
+    )
+    return respond(request, {"status": "success", "offsets": offsets})
+
+
+@expects_json(CONSUME_SCHEMA)
+async def consume(request, data):
+    """Consume a log (or a batch of logs) from a topic, optionally waiting
+    for new logs."""
+    partition_index = data["partition_index"]
+    max_messages = data.get("max_messages")
+    max_bytes = data.get("max_bytes")
+    encoding = data.get("encoding", "utf-8")
+    wait_ms = min(data.get("wait_ms", 0), app.config["CONSUME_MAX_WAIT_MS"])
+    batch = max_messages is not None or max_bytes is not None
+    if max_messages is None:
+        max_messages = app.config["CONSUME_MAX_MESSAGES"] if batch else 1
+    try:
+        _, logs = await master_queue.consume_logs_async(
+            data["topic"],
+            partition_index,
+            data["consumer_id"],
+            min(max_messages, app.config["CONSUME_MAX_MESSAGES"]),
+            max_bytes,
+            wait_ms,
+        )
+    except Exception as e:
+        return failure(request, str(e))
+    if len(logs) == 0:
+        return respond(request, {"status": "failure", "message": "No logs available to pull."})
+    logs = [from_bytes(log, encoding) for log in logs]
+    if batch:
+        return respond(request, {"status": "success", "messages": logs, "partition_read": partition_index})
+    return respond(request, {"status": "success", "message": logs[0], "partition_read": partition_index})
+
+
+@expects_json(STREAM_SCHEMA)
+async def stream(request, data):
+    """Push the logs of a partition to a consumer as server-sent events."""
+    topic_name = data["topic"]
+    consumer_id = data["consumer_id"]
+    partition_index = data["partition_index"]
+    batch_size = min(
+        data.get("batch_size", app.config["CONSUME_MAX_MESSAGES"]),
+        app.config["CONSUME_MAX_MESSAGES"],
+    )
+    encoding = data.get("encoding", "utf-8")
+    heartbeat_ms = app.config["CONSUME_STREAM_HEARTBEAT_MS"]
+    try:
+        consumer_stream = master_queue.open_stream(
+            topic_name,
+            partition_index,
+            consumer_id,
+            data.get("credits", app.config["CONSUME_STREAM_CREDITS"]),
+        )
+    except Exception as e:
+        return failure(request, str(e))
+
+    async def events():
+        try:
+            yield f"event: open\ndata: {json.dumps({'stream_id': consumer_stream.stream_id})}\n\n"
+            while True:
+                count = await consumer_stream.take_credits_async(batch_size, heartbeat_ms / 1000)
+                offset, logs = (0, [])
+                if count > 0:
+                    offset, logs = await master_queue.consume_logs_async(
+                        topic_name, partition_index, consumer_id, count, wait_ms=heartbeat_ms
+                    )
+                    consumer_stream.add_credits(count - len(logs))
+                if len(logs) == 0:
+                    yield ": heartbeat\n\n"
+                    continue
+                data = json.dumps(
+                    {"offset": offset, "messages": [from_bytes(log, encoding) for log in logs]}
+                )
+                yield f"id: {offset + len(logs)}\ndata: {data}\n\n"
+        finally:
+            master_queue.close_stream(consumer_stream.stream_id)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@expects_json(STREAM_CREDITS_SCHEMA)
+async def stream_credits(request, data):
+    """Grant credits to an open stream."""
+    try:
+        master_queue.add_stream_credits(data["stream_id"], data["credits"])
+    except Exception as e:
+        return failure(request, str(e))
+    return respond(request, {"status": "success"})
+
+
+@expects_json(SIZE_SCHEMA)
+async def size(request, data):
+    """Return the number of log messages in the requested topic for this consumer."""
+    partition_index = None
+    try:
+        partition_index = int(data["partition_index"])
+    except:
+        pass
+    sizes = master_queue.get_size(data["consumer_id"], data["topic"], partition_index)
+    return respond(request, {"status": "success", "sizes": sizes})
+
+
+async def metrics(request):
+    """Return the internal metrics of the broker."""
+    return respond(request, {"status": "success", "metrics": master_queue.get_metrics()})
+
+
+async def connect_async_db():
+    await async_db.connect()
+    master_queue.attach_async_database(async_db)
+
+
+asgi_app = Starlette(
+    routes=[
+        Route("/", index),
+        Route("/topics", topics, methods=["POST"]),
+        Route("/consumer/register", register_consumer, methods=["POST"]),
+        Route("/producer/register", register_producer, methods=["POST"]),
+        Route("/metadata/version", map_version, methods=["POST"]),
+        Route("/producer/produce", produce, methods=["POST"]),
+        Route("/producer/produce_batch", produce_batch, methods=["POST"]),
+        Route("/consumer/consume", consume, methods=["GET"]),
+        Route("/consumer/stream", stream, methods=["GET"]),
+        Route("/consumer/stream/credits", stream_credits, methods=["POST"]),
+        Route("/size", size, methods=["GET"]),
+        Route("/metrics", metrics, methods=["GET"]),
+    ],
+    on_startup=[connect_async_db],
+    on_shutdown=[async_db.close],
+)
@@ -0,0 +1,38 @@
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    import asyncpg
+
+
+class AsyncDatabase:
+    """
+    asyncpg connection pools to the master and slave databases of the
+    broker, used when it is served by the asgi server. asyncpg is only
+    imported once the pools are opened.
+    """
+
+    def __init__(self, write_dsn: str, read_dsn: str, min_size: int, max_size: int) -> None:
+        self._write_dsn = write_dsn
+        self._read_dsn = read_dsn
+        self._min_size = min_size
+        self._max_size = max_size
+        self.write_pool: Optional["asyncpg.Pool"] = None
+        self.read_pool: Optional["asyncpg.Pool"] = None
+
+    async def connect(self) -> None:
+        """Open the connection pools."""
+        import asyncpg
+
+        self.write_pool = await asyncpg.create_pool(
+            self._write_dsn, min_size=self._min_size, max_size=self._max_size
+        )
+        self.read_pool = await asyncpg.create_pool(
+            self._read_dsn, min_size=self._min_size, max_size=self._max_size
+        )
+
+    async def close(self) -> None:
+        """Close the connection pools."""
+        if self.write_pool is not None:
+            await self.write_pool.close()
+        if self.read_pool is not None:
+            await self.read_pool.close()
@@ -0,0 +1,128 @@
+"""
+Encoding of the message bodies and compression of the batches of logs.
+
+Messages are handled as bytes by the broker. On the wire they are text,
+or base64 when the request asks for the "base64" encoding. A producer may
+send a batch of messages compressed as a unit: the messages are framed
+(each one prefixed by its length) and the frame is compressed with one of
+CODECS. The broker stores the compressed batch as it is, it is only
+decompressed when its logs are read.
+"""
+
+import base64
+import struct
+import zlib
+from typing import List
+
+# id of every codec in the storage, by position
+CODECS = ("none", "zlib", "zstd", "lz4")
+ENCODINGS = ("utf-8", "base64")
+
+# length of a message in a framed batch
+MESSAGE_LENGTH = struct.Struct(">I")
+
+
+def frame_messages(messages: List[bytes]) -> bytes:
+    """Return the messages as one frame, each prefixed by its length."""
+    return b"".join(MESSAGE_LENGTH.pack(len(message)) + message for message in messages)
+
+
+def unframe_messages(frame: bytes) -> List[bytes]:
+    """Return the messages of a frame built by frame_messages."""
+    messages = []
+    pos = 0
+    while pos + MESSAGE_LENGTH.size <= len(frame):
+        (length,) = MESSAGE_LENGTH.unpack_from(frame, pos)
+        pos += MESSAGE_LENGTH.size
+        messages.append(frame[pos:pos + length])
+        pos += length
+    return messages
+
+
+def compress(codec: str, data: bytes) -> bytes:
+    """Compress data with the codec."""
+    if codec == "none":
+        return data
+    if codec == "zlib":
+        return zlib.compress(data)
+    if codec == "zstd":
+        return _zstd().ZstdCompressor().compress(data)
+    if codec == "lz4":
+        return _lz4().compress(data)
+    raise Exception(f"Unknown codec '{codec}'.")
+
+
+def decompress(codec: str, data: bytes) -> bytes:
+    """Decompress data compressed with the codec."""
+    if codec == "none":
+        return data
+    if codec == "zlib":
+        return zlib.decompress(data)
+    if codec == "zstd":
+        return _zstd().ZstdDecompressor().decompress(data)
+    if codec == "lz4":
+        return _lz4().decompress(data)
+    raise Exception(f"Unknown codec '{codec}'.")
+
+
+def decode_batch(codec: str, count: int, payload: bytes) -> List[bytes]:
+    """Return the messages of a stored batch of count logs. An uncompressed
+    batch is a single message."""
+    if codec == "none" and count == 1:
+        return [bytes(payload)]
+    return unframe_messages(decompress(codec, bytes(payload)))
+
+
+def check_batch(codec: str, count: int, payload: bytes) -> None:
+    """Raise if the payload of a batch received from a producer does not
+    decompress, or does not frame exactly count messages. The batch is
+    only decompressed again when its logs are read, so it is checked once
+    before it is stored."""
+    try:
+        frame = decompress(codec, payload)
+    except Exception as e:
+        raise Exception(f"Batch payload does not decompress with codec '{codec}': {e}")
+    pos = 0
+    frames = 0
+    while pos < len(frame):
+        if pos + MESSAGE_LENGTH.size > len(frame):
+            raise Exception("Batch payload is not a valid frame.")
+        (length,) = MESSAGE_LENGTH.unpack_from(frame, pos)
+        pos += MESSAGE_LENGTH.size + length
+        frames += 1
+    if pos != len(frame):
+        raise Exception("Batch payload is not a valid frame.")
+    if frames != count:
+        raise Exception(f"Batch payload holds {frames} messages, not {count}.")
+
+
+def to_bytes(message: str, encoding: str = "utf-8") -> bytes:
+    """Return the body of a message received in the given encoding."""
+    if encoding == "base64":
+        return base64.b64decode(message, validate=True)
+    return message.encode()
+
+
+def from_bytes(message: bytes, encoding: str = "utf-8") -> str:
+    """Return the body of a message in the given encoding. Binary bodies
+    are only returned intact in the "base64" encoding."""
+    if encoding == "base64":
+        return base64.b64encode(message).decode()
+    return message.decode(errors="replace")
+
+
+def _zstd():
+    # optional dependencies, only needed by the codecs in use
+    try:
+        import zstandard
+    except ImportError:
+        raise Exception("Codec 'zstd' needs the zstandard package.")
+    return zstandard
+
+
+def _lz4():
+    try:
+        import lz4.frame
+    except ImportError:
+        raise Exception("Codec 'lz4' needs the lz4 package.")
+    return lz4.frame
@@ -1,3 +1,5 @@
 from src.datastructures.thread_safe_log_queue import ThreadSafeLogQueue
 from src.datastructures.thread_safe_producer_set import ThreadSafeProducerSet
-from src.datastructures.thread_safe_consumer_dict import ThreadSafeConsumerDict
\ No newline at end of file
+from src.datastructures.thread_safe_consumer_dict import ThreadSafeConsumerDict
+from src.datastructures.thread_safe_watermark import ThreadSafeWatermark
+from src.datastructures.thread_safe_signal import ThreadSafeSignal
@@ -1,7 +1,37 @@
 import threading
-from typing import Dict, Tuple
+from array import array
+from typing import Dict, Iterable, List, Tuple
 
-from src.datastructures.thread_safe_counter import ThreadSafeCounter
+
+class ConsumerIds:
+    """
+    Interns consumer ids to small integers, shared by the consumer
+    dictionaries of every partition so that each id string is stored once.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._ids: Dict[str, int] = {}
+        self._names: List[str] = []
+
+    def intern(self, consumer_id: str) -> int:
+        """Return the integer of the consumer id, assigning one if needed."""
+        number = self._ids.get(consumer_id)
+        if number is not None:
+            return number
+        with self._lock:
+            if consumer_id not in self._ids:
+                self._ids[consumer_id] = len(self._names)
+                self._names.append(consumer_id)
+            return self._ids[consumer_id]
+
+    def lookup(self, consumer_id: str) -> int:
+        """Return the integer of an interned consumer id, -1 if unknown."""
+        return self._ids.get(consumer_id, -1)
+
+    def name(self, number: int) -> str:
+        """Return the consumer id of an integer."""
+        return self._names[number]
 
 
 class ThreadSafeConsumerDict:
@@ -9,39 +39,148 @@ class ThreadSafeConsumerDict:
     A thread-safe dictionary class to store the offsets of a consumer in
     a partition (map of consumer_id, partition_index to offset) in the queue.
 
+    Every (consumer, partition) gets a slot: its offset is an element of a
+    contiguous array of 64-bit integers, and the slot is found from the
+    interned consumer id. Offsets are updated under one of STRIPES locks
+    shared by all the dictionaries, picked by dictionary and slot, so that
+    consumers rarely contend and a partition costs no locks of its own.
+    Lookups take no lock, the slot map is only locked when a consumer is
+    added.
+
     Note: It is the users responsibility to ensure that the key being
     passed to the get_and_increment method is present in the dictionary.
     """
 
+    STRIPES = 1024
+    # consumer ids and offset locks of all the dictionaries
+    _consumer_ids = ConsumerIds()
+    _stripes = [threading.Lock() for _ in range(STRIPES)]
+
     def __init__(self) -> None:
         self._lock = threading.Lock()
-        self._dict: Dict[Tuple[str,int], ThreadSafeCounter] = {}
+        # the slots of the dictionaries start at different stripes
+        self._first_stripe = hash(self) % self.STRIPES
+        # slot of every (consumer, partition), keyed by _key
+        self._slots: Dict[int, int] = {}
+        # key and offset of every slot
+        self._keys = array("q")
+        self._offsets = array("q")
+
+    @staticmethod
+    def _key(consumer: int, partition_index: int) -> int:
+        return (consumer << 32) | partition_index
+
+    def _slot(self, consumer_id: str, partition_index: int) -> int:
+        consumer = self._consumer_ids.lookup(consumer_id)
+        if consumer < 0:
+            raise KeyError((consumer_id, partition_index))
+        return self._slots[self._key(consumer, partition_index)]
+
+    def _stripe(self, slot: int) -> threading.Lock:
+        return self._stripes[(self._first_stripe + slot) % self.STRIPES]
 
     def add(self, consumer_id: str, partition_index: int, offset: int = 0) -> None:
         """Add a consumer to the dictionary with given offset."""
+        self.restore([(consumer_id, partition_index, offset)])
+
+    def restore(self, offsets: Iterable[Tuple[str, int, int]]) -> None:
+        """Add the (consumer_id, partition_index, offset) of many consumers
+        at once."""
         with self._lock:
-            self._dict[(consumer_id, partition_index)] = ThreadSafeCounter(offset)
+            for consumer_id, partition_index, offset in offsets:
+                key = self._key(self._consumer_ids.intern(consumer_id), partition_index)
+                slot = self._slots.get(key)
+                if slot is not None:
+                    with self._stripe(slot):
+                        self._offsets[slot] = offset
+                    continue
+                self._keys.append(key)
+                self._offsets.append(offset)
+                self._slots[key] = len(self._offsets) - 1
 
     def contains(self, consumer_id: str, partition_index: int) -> bool:
         """Return whether the dictionary contains the given consumer."""
-        with self._lock:
-            return (consumer_id, partition_index) in self._dict
+        consumer = self._consumer_ids.lookup(consumer_id)
+        return consumer >= 0 and self._key(consumer, partition_index) in self._slots
 
     def get_offset(self, consumer_id: str, partition_index: int) -> int:
         """Return the current offset value."""
-        return self._dict[(consumer_id, partition_index)].get()
+        return self._offsets[self._slot(consumer_id, partition_index)]
 
     def get_offset_and_increment(
         self, consumer_id: str, partition_index: int, threshold: int
     ) -> int:
         """Get the current offset value and increment it by 1 if it is less
         than the threshold."""
-        return self._dict[(consumer_id, partition_index)].get_and_increment(threshold)
+        slot = self._slot(consumer_id, partition_index)
+        with self._stripe(slot):
+            current_value = self._offsets[slot]
+            if current_value < threshold:
+                self._offsets[slot] = current_value + 1
+        return current_value
+
+    def get_offset_and_advance(
+        self, consumer_id: str, partition_index: int, count: int, threshold: int
+    ) -> Tuple[int, int]:
+        """Advance the offset by up to count without crossing the threshold.
+        Return the (old, new) offsets, the range [old, new) is reserved for
+        the caller."""
+        slot = self._slot(consumer_id, partition_index)
+        with self._stripe(slot):
+            current_value = self._offsets[slot]
+            if current_value < threshold:
+                self._offsets[slot] = min(current_value + count, threshold)
+            return current_value, self._offsets[slot]
+
+    def release_offset(
+        self, consumer_id: str, partition_index: int, expected: int, offset: int
+    ) -> bool:
+        """Move the offset back to the given value if nobody advanced it
+        since it was set to expected. Return whether it was moved back."""
+        slot = self._slot(consumer_id, partition_index)
+        with self._stripe(slot):
+            if self._offsets[slot] != expected:
+                return False
+            self._offsets[slot] = offset
+            return True
+
+    def advance_offsets(self, offset: int) -> List[Tuple[str, int]]:
+        """Move the offsets of all consumers behind offset forward to it.
+        Return the (consumer_id, partition_index) of the moved consumers."""
+        slots = len(self._offsets)
+        moved = []
+        for first_slot in range(min(self.STRIPES, slots)):
+            with self._stripe(first_slot):
+                for slot in range(first_slot, slots, self.STRIPES):
+                    if self._offsets[slot] < offset:
+                        self._offsets[slot] = offset
+                        moved.append(slot)
+        return [self._split(self._keys[slot]) for slot in moved]
+
+    def _split(self, key: int) -> Tuple[str, int]:
+        return self._consumer_ids.name(key >> 32), key & 0xFFFFFFFF
+
+    def snapshot(self) -> Tuple[List[Tuple[str, int]], array]:
+        """Return the (consumer_id, partition_index) of every consumer and
+        an array of their offsets, in the same order."""
+        with self._lock:
+            keys = self._keys[:]
+            offsets = self._offsets[:]
+        return [self._split(key) for key in keys], offsets
+
+    def items(self) -> List[Tuple[str, int, int]]:
+        """Return the (consumer_id, partition_index, offset) of every
+        consumer in the dictionary."""
+        consumers, offsets = self.snapshot()
+        return [
+            (consumer_id, partition_index, offset)
+            for (consumer_id, partition_index), offset in zip(consumers, offsets)
+        ]
 
     def __str__(self) -> str:
         """Return the string representation of the dictionary."""
         string = "ThreadSafeConsumerDict("
-        for key, value in self._dict.items():
-            string += f"{key}: {value}, "
+        for consumer_id, partition_index, offset in self.items():
+            string += f"{(consumer_id, partition_index)}: {offset}, "
         string += ")"
-        return string
\ No newline at end of file
+        return string
@@ -1,41 +1,97 @@
+import sys
 import threading
-from typing import List
-
-from src.models import Log
+from typing import List, Optional
 
 
 class ThreadSafeLogQueue:
     """
-    A thread-safe logs queue.
-    Note: It is the users responsibility to ensure that the index being
-    accessed is within the bounds of the queue. This class does not
-    perform any bounds checking.
+    A thread-safe, byte-bounded queue holding the most recent logs (the
+    tail) of a partition, indexed by log id.
+
+    The queue holds the logs with ids in [start, end). Logs must be appended
+    in id order, appending a log that does not directly follow the end of
+    the queue restarts the queue from that log. When the queue grows over
+    max_bytes, logs are dropped from its head.
     """
 
-    def __init__(self) -> None:
-        self._queue: List[Log] = []
+    def __init__(self, max_bytes: int) -> None:
+        self._max_bytes = max_bytes
+        self._logs: List[bytes] = []
+        self._sizes: List[int] = []
+        # position of the first live log in self._logs, dropped logs are
+        # only compacted away once they make up half of the list
+        self._head = 0
+        self._start = 0
+        self._bytes = 0
         self._lock = threading.Lock()
 
-    def append(self, log: Log) -> int:
-        """Append a log to the queue and return the index of insertion."""
+    def append(self, index: int, messages: List[bytes]) -> int:
+        """Append the logs starting at id index to the queue and return the
+        change in the number of bytes held."""
+        with self._lock:
+            old_bytes = self._bytes
+            if index != self._start + len(self._logs) - self._head:
+                self._clear()
+                self._start = index
+            for message in messages:
+                size = sys.getsizeof(message)
+                self._logs.append(message)
+                self._sizes.append(size)
+                self._bytes += size
+            self._trim(self._bytes - self._max_bytes)
+            return self._bytes - old_bytes
+
+    def get_range(self, start: int, end: int) -> Optional[List[bytes]]:
+        """Return the logs with ids in [start, end) if all of them are held
+        by the queue, otherwise return None."""
+        with self._lock:
+            if start < self._start or end > self._start + len(self._logs) - self._head:
+                return None
+            offset = self._head - self._start
+            return self._logs[start + offset:end + offset]
+
+    def trim(self, nbytes: int) -> int:
+        """Drop logs from the head until at least nbytes are freed (or the
+        queue is empty) and return the number of bytes freed."""
         with self._lock:
-            index = len(self._queue)
-            self._queue.append(log)
-        return index
+            return self._trim(nbytes)
+
+    def clear(self) -> int:
+        """Drop all logs and return the number of bytes freed."""
+        with self._lock:
+            return self._clear()
+
+    def _trim(self, nbytes: int) -> int:
+        freed = 0
+        while freed < nbytes and self._head < len(self._logs):
+            freed += self._sizes[self._head]
+            self._head += 1
+            self._start += 1
+        if self._head > len(self._logs) // 2:
+            del self._logs[:self._head]
+            del self._sizes[:self._head]
+            self._head = 0
+        self._bytes -= freed
+        return freed
+
+    def _clear(self) -> int:
+        freed = self._bytes
+        self._start += len(self._logs) - self._head
+        self._logs, self._sizes = [], []
+        self._head = 0
+        self._bytes = 0
+        return freed
 
     def __len__(self) -> int:
         """Return the length of the queue."""
         with self._lock:
-            return len(self._queue)
-
-    def __getitem__(self, index: int) -> Log:
-        """Return the log at the given index."""
-        return self._queue[index]
+            return len(self._logs) - self._head
 
     def __str__(self) -> str:
         """Return the string representation of the queue."""
-        string = "ThreadSafeLogQueue("
-        for log in self._queue:
-            string += f"{log}, "
-        string += ")"
-        return string
\ No newline at end of file
+        with self._lock:
+            return "ThreadSafeLogQueue(start=%d, length=%d, bytes=%d)" % (
+                self._start,
+                len(self._logs) - self._head,
+                self._bytes,
+            )
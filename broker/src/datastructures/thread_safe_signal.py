@@ -0,0 +1,57 @@
+import asyncio
+import threading
+from typing import Callable, List, Tuple
+
+
+class ThreadSafeSignal:
+    """
+    A condition that threads as well as asyncio tasks can wait on. The state
+    the waiters check is guarded by its owner, notify is called after every
+    change of that state.
+    """
+
+    def __init__(self) -> None:
+        self._condition = threading.Condition()
+        # asyncio waiters, resolved on their own event loop when notified
+        self._futures: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def notify(self) -> None:
+        """Wake up all waiters."""
+        with self._condition:
+            self._condition.notify_all()
+            futures, self._futures = self._futures, []
+        for loop, future in futures:
+            loop.call_soon_threadsafe(_resolve, future)
+
+    def wait_for(self, predicate: Callable[[], bool], timeout: float) -> bool:
+        """Block until predicate holds or timeout seconds passed. Return the
+        last value of predicate."""
+        with self._condition:
+            return self._condition.wait_for(predicate, timeout)
+
+    async def wait_for_async(self, predicate: Callable[[], bool], timeout: float) -> bool:
+        """Wait until predicate holds or timeout seconds passed without
+        blocking the event loop. Return the last value of predicate."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            with self._condition:
+                if predicate():
+                    return True
+                future = loop.create_future()
+                self._futures.append((loop, future))
+            remaining = deadline - loop.time()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                await asyncio.wait_for(future, remaining)
+            except asyncio.TimeoutError:
+                with self._condition:
+                    if (loop, future) in self._futures:
+                        self._futures.remove((loop, future))
+                    return predicate()
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
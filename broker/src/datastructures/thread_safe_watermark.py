@@ -0,0 +1,37 @@
+import threading
+from typing import Dict
+
+
+class ThreadSafeWatermark:
+    """
+    A thread-safe high-watermark of a partition, i.e. the number of logs
+    whose ids form a contiguous committed prefix.
+
+    Ids are reserved in increasing order but the transactions writing them
+    may commit out of order, so ranges committed above the watermark are
+    parked until the ranges below them have committed too.
+    """
+
+    def __init__(self, value: int = 0) -> None:
+        self._value = value
+        # start -> end of committed ranges above the watermark
+        self._pending: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self) -> int:
+        """Return the current value of the watermark."""
+        with self._lock:
+            return self._value
+
+    def commit(self, start: int, end: int) -> int:
+        """Mark the ids in [start, end) as committed and return the new value
+        of the watermark."""
+        with self._lock:
+            self._pending[start] = end
+            while self._value in self._pending:
+                self._value = self._pending.pop(self._value)
+            return self._value
+
+    def __str__(self) -> str:
+        """Return the string representation of the watermark."""
+        return f"Watermark({self._value}, pending={self._pending})"
@@ -1,3 +1,9 @@
-from src.models.log import Log
+from src.models.log import Log, LogBatch
+from src.models.tail_cache import TailCache
 from src.models.topic import Topic
+from src.models.log_appender import LogAppender
+from src.models.offset_checkpointer import OffsetCheckpointer
+from src.models.state_snapshot import StateSnapshot
+from src.models.consumer_stream import ConsumerStream
+from src.models.retention_reaper import RetentionReaper
 from src.models.master_queue import MasterQueue
\ No newline at end of file
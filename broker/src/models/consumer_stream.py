@@ -0,0 +1,52 @@
+import threading
+
+from src.datastructures import ThreadSafeSignal
+
+
+class ConsumerStream:
+    """
+    Flow control of a stream of logs pushed to a consumer.
+
+    The consumer grants credits, one per log it is ready to receive. Logs
+    are only pushed while the stream has credits left, a stream without
+    credits idles until the consumer grants more.
+    """
+
+    def __init__(
+        self, stream_id: str, topic_name: str, partition_index: int, consumer_id: str, credits: int
+    ) -> None:
+        self.stream_id = stream_id
+        self.topic_name = topic_name
+        self.partition_index = partition_index
+        self.consumer_id = consumer_id
+        self._credits = credits
+        self._lock = threading.Lock()
+        self._granted = ThreadSafeSignal()
+
+    def add_credits(self, credits: int) -> None:
+        """Grant credits to the stream."""
+        with self._lock:
+            self._credits += credits
+        self._granted.notify()
+
+    def take_credits(self, max_credits: int, timeout: float) -> int:
+        """Take up to max_credits credits, waiting up to timeout seconds for
+        the consumer to grant some. Return the number of credits taken."""
+        self._granted.wait_for(lambda: self.get_credits() > 0, timeout)
+        return self._take(max_credits)
+
+    async def take_credits_async(self, max_credits: int, timeout: float) -> int:
+        """Awaitable version of take_credits."""
+        await self._granted.wait_for_async(lambda: self.get_credits() > 0, timeout)
+        return self._take(max_credits)
+
+    def _take(self, max_credits: int) -> int:
+        with self._lock:
+            taken = min(self._credits, max_credits)
+            self._credits -= taken
+            return taken
+
+    def get_credits(self) -> int:
+        """Return the number of credits left."""
+        with self._lock:
+            return self._credits
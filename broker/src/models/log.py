@@ -1,3 +1,6 @@
+from typing import List, Optional, Tuple
+
+
 class Log:
     """
     Class representing a log message.
@@ -15,4 +18,34 @@ class Log:
             self.producer_id,
             self.message,
             self.timestamp,
-        )
\ No newline at end of file
+        )
+
+class LogBatch:
+    """
+    Logs produced together by a request. A plain batch holds its messages,
+    a compressed batch holds count messages framed and compressed as one
+    payload (see src.compression), stored as a single record.
+    """
+
+    def __init__(
+        self,
+        messages: Optional[List[bytes]] = None,
+        codec: str = "none",
+        payload: bytes = b"",
+        count: int = 0,
+    ) -> None:
+        self.messages = messages
+        self.codec = codec
+        self.payload = payload
+        self.count = len(messages) if messages is not None else count
+
+    def is_compressed(self) -> bool:
+        """Return whether the batch is stored as one compressed record."""
+        return self.messages is None
+
+    def rows(self, start: int) -> List[Tuple[int, int, str, bytes]]:
+        """Return the (id, count, codec, message) of the records of the
+        batch, its logs taking the ids from start on."""
+        if self.is_compressed():
+            return [(start, self.count, self.codec, self.payload)]
+        return [(start + i, 1, "none", message) for i, message in enumerate(self.messages)]
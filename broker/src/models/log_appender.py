@@ -0,0 +1,134 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Tuple, Union
+
+from src import app
+from src.models import LogBatch
+
+# (topic_name, partition_index, producer_id, batch, timestamp)
+LogEntry = Tuple[str, int, str, LogBatch, float]
+
+
+class LogAppender:
+    """
+    Group-commit writer for the logs of the broker.
+
+    Request threads enqueue their logs and block on a future. A dedicated
+    appender thread drains the queue once linger_ms has passed since the
+    first waiting entry (or as soon as max_batch logs are waiting), writes
+    everything through write_batch in one transaction and then resolves all
+    the futures. write_batch returns the offsets of every entry, or the
+    error of an entry it did not write.
+    """
+
+    def __init__(
+        self,
+        write_batch: Callable[[List[LogEntry]], List[Union[List[int], Exception]]],
+        linger_ms: float,
+        max_batch: int,
+    ) -> None:
+        self._write_batch = write_batch
+        self._linger = linger_ms / 1000
+        self._max_batch = max_batch
+        self._queue: "queue.Queue[Tuple[LogEntry, Future]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="log-appender", daemon=True)
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._logs = 0
+        self._last_batch_size = 0
+        self._max_batch_size = 0
+        self._commit_seconds = 0.0
+        self._last_commit_seconds = 0.0
+        self._max_commit_seconds = 0.0
+
+    def start(self) -> None:
+        """Start the appender thread."""
+        self._thread.start()
+
+    def append(
+        self, topic_name: str, partition_index: int, producer_id: str, batch: LogBatch
+    ) -> List[int]:
+        """Enqueue the logs and block until they are committed. Return the
+        offsets assigned to them."""
+        return self.submit(topic_name, partition_index, producer_id, batch).result()
+
+    def submit(
+        self, topic_name: str, partition_index: int, producer_id: str, batch: LogBatch
+    ) -> Future:
+        """Enqueue the logs and return a future resolved with the offsets
+        assigned to them once they are committed."""
+        future: Future = Future()
+        self._queue.put(
+            ((topic_name, partition_index, producer_id, batch, time.time()), future)
+        )
+        return future
+
+    def _next_batch(self) -> List[Tuple[LogEntry, Future]]:
+        """Block until an entry is available, then collect entries until the
+        linger time expires or the batch is full."""
+        batch = [self._queue.get()]
+        size = batch[0][0][3].count
+        deadline = time.monotonic() + self._linger
+        while size < self._max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                if timeout > 0:
+                    item = self._queue.get(timeout=timeout)
+                else:
+                    # linger expired, still take whatever is already queued
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += item[0][3].count
+        return batch
+
+    def _run(self) -> None:
+        with app.app_context():
+            while True:
+                batch = self._next_batch()
+                started = time.monotonic()
+                try:
+                    results = self._write_batch([entry for entry, _ in batch])
+                except Exception as e:
+                    for _, future in batch:
+                        future.set_exception(e)
+                    continue
+                self._record(sum(entry[3].count for entry, _ in batch), time.monotonic() - started)
+                for (_, future), offsets in zip(batch, results):
+                    # an entry that could not be written fails on its own
+                    if isinstance(offsets, Exception):
+                        future.set_exception(offsets)
+                    else:
+                        future.set_result(offsets)
+
+    def _record(self, batch_size: int, commit_seconds: float) -> None:
+        """Record the size and commit latency of a written batch."""
+        with self._stats_lock:
+            self._batches += 1
+            self._logs += batch_size
+            self._last_batch_size = batch_size
+            self._max_batch_size = max(self._max_batch_size, batch_size)
+            self._commit_seconds += commit_seconds
+            self._last_commit_seconds = commit_seconds
+            self._max_commit_seconds = max(self._max_commit_seconds, commit_seconds)
+
+    def get_stats(self) -> Dict[str, float]:
+        """Return the batch size and commit latency statistics."""
+        with self._stats_lock:
+            batches = max(self._batches, 1)
+            return {
+                "linger_ms": self._linger * 1000,
+                "max_batch": self._max_batch,
+                "queued": self._queue.qsize(),
+                "batches": self._batches,
+                "logs": self._logs,
+                "last_batch_size": self._last_batch_size,
+                "avg_batch_size": self._logs / batches,
+                "max_batch_size": self._max_batch_size,
+                "last_commit_ms": self._last_commit_seconds * 1000,
+                "avg_commit_ms": self._commit_seconds / batches * 1000,
+                "max_commit_ms": self._max_commit_seconds * 1000,
+            }
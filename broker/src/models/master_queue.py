@@ -1,11 +1,25 @@
+import asyncio
 import threading
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 import uuid
 import time
 
-from src.models import Topic, Log
+from src.models import (
+    Topic,
+    Log,
+    LogBatch,
+    TailCache,
+    LogAppender,
+    OffsetCheckpointer,
+    StateSnapshot,
+    ConsumerStream,
+    RetentionReaper,
+)
+from src.models.log_appender import LogEntry
+from src.storage import create_log_storage
+from src.async_db import AsyncDatabase
 from src import db, app
-from src import TopicDB, ConsumerDB, LogDB
+from src import TopicDB, ConsumerDB, LogDB, ProducerDB
 
 
 class MasterQueue:
@@ -16,44 +30,134 @@ class MasterQueue:
     def __init__(self) -> None:
         self._lock = threading.Lock()
         self._topics: Dict[(str,int), Topic] = {}
+        self._storage = create_log_storage()
+        self._tail_cache = TailCache(
+            app.config["TAIL_CACHE_MAX_BYTES"],
+            app.config["TAIL_CACHE_PARTITION_MAX_BYTES"],
+        )
+        self._appender = LogAppender(
+            self._write_logs,
+            app.config["LOG_APPENDER_LINGER_MS"],
+            app.config["LOG_APPENDER_MAX_BATCH"],
+        )
+        self._checkpointer = OffsetCheckpointer(
+            app.config["OFFSET_CHECKPOINT_INTERVAL_MS"],
+            app.config["OFFSET_CHECKPOINT_MAX_DIRTY"],
+        )
+        self._snapshot = StateSnapshot(
+            app.config["STATE_SNAPSHOT_PATH"],
+            app.config["STATE_SNAPSHOT_INTERVAL_MS"],
+        )
+        self._startup_stats: Dict[str, float] = {}
+        # open streams pushing logs to consumers, by stream id
+        self._streams: Dict[str, ConsumerStream] = {}
+        # latest version of the partition map of the primary manager, sent
+        # with its health checks
+        self._map_version = 0
+        # logs and bytes produced and consumed since the broker started,
+        # read by the primary manager to place new partitions
+        self._load_lock = threading.Lock()
+        self._load = {"produced_logs": 0, "produced_bytes": 0, "consumed_logs": 0, "consumed_bytes": 0}
+        self._reaper = RetentionReaper(
+            self._get_partitions,
+            self._apply_retention,
+            app.config["RETENTION_CHECK_INTERVAL_MS"],
+        )
 
     def init_from_db(self) -> None:
-        """Initialize the master queue from the db."""
+        """Initialize the master queue from the db. The lengths of all
+        partitions are loaded at once (checked against the state snapshot if
+        there is one) and the consumer offsets with a single query."""
+        started = time.monotonic()
+        self._storage.setup()
         topics = TopicDB.query.all()
+        partitions = [(topic.name, topic.partition_index) for topic in topics]
+
+        snapshot = self._snapshot.load()
+        expected_lengths: Dict[Tuple[str, int], int] = {}
+        snapshot_offsets: Dict[Tuple[str, str, int], int] = {}
+        if snapshot is not None:
+            for topic_name, partition_index, length in snapshot["partitions"]:
+                expected_lengths[(topic_name, partition_index)] = length
+            for topic_name, partition_index, consumer_ids, offsets in snapshot["consumers"]:
+                for consumer_id, offset in zip(consumer_ids, StateSnapshot.decode_offsets(offsets)):
+                    snapshot_offsets[(consumer_id, topic_name, partition_index)] = offset
+
+        lengths = self._storage.get_lengths(partitions, expected_lengths)
         for topic in topics:
-            length = LogDB.query.filter_by(topic_name = topic.name, partition_index = topic.partition_index).count()
-            self._topics[(topic.name,topic.partition_index)] = Topic(topic.name, topic.partition_index, length)
-            # get consumers with topic_name=topic.name
-            consumers = ConsumerDB.query.filter_by(topic_name=topic.name, partition_index = topic.partition_index ).all()
-            for consumer in consumers:
-                self._topics[(topic.name,topic.partition_index)].add_consumer(
-                    consumer.id, topic.partition_index, consumer.offset
-                )
-            # get logs with topic_name=topic.name and ordered by their ids - deprecated
-            # no longer storing logs in memory
-            # logs = (
-            #     LogDB.query.filter_by(topic_name=topic.name,partition_index = topic.partition_index)
-            #     .order_by(LogDB.id)
-            #     .all()
-            # )
-            # for log in logs:
-            #     self._topics[(topic.name,topic.partition_index)].add_log(
-            #         Log(log.producer_id, log.message, log.timestamp)
-            #     )
+            key = (topic.name, topic.partition_index)
+            self._topics[key] = Topic(
+                topic.name,
+                topic.partition_index,
+                self._storage,
+                self._tail_cache,
+                lengths[key],
+                topic.log_start_offset or 0,
+                {
+                    "retention_ms": topic.retention_ms,
+                    "retention_bytes": topic.retention_bytes,
+                    "retention_messages": topic.retention_messages,
+                },
+            )
+
+        consumers = ConsumerDB.query.all()
+        # offsets of the consumers of every partition, added at once
+        offsets: Dict[Tuple[str, int], List[Tuple[str, int, int]]] = {}
+        for consumer in consumers:
+            key = (consumer.topic_name, consumer.partition_index)
+            if key not in self._topics:
+                continue
+            offset = consumer.offset
+            # the snapshot may hold offsets the checkpointer had not written
+            # yet when the broker stopped
+            snapshot_offset = min(
+                snapshot_offsets.get((consumer.id,) + key, 0), lengths[key]
+            )
+            if snapshot_offset > offset:
+                offset = snapshot_offset
+                self._checkpointer.mark(consumer.id, consumer.partition_index, offset)
+            # consumers stay at or after the start of the log
+            if offset < self._topics[key].get_log_start():
+                offset = self._topics[key].get_log_start()
+                self._checkpointer.mark(consumer.id, consumer.partition_index, offset)
+            offsets.setdefault(key, []).append((consumer.id, consumer.partition_index, offset))
+        for key, topic_offsets in offsets.items():
+            self._topics[key].restore_consumers(topic_offsets)
+
+        producers = ProducerDB.query.all()
+        for producer in producers:
+            key = (producer.topic_name, producer.partition_index)
+            if key in self._topics:
+                self._topics[key].add_producer(producer.id)
+
+        self._startup_stats = {
+            "startup_ms": (time.monotonic() - started) * 1000,
+            "partitions": len(partitions),
+            "consumers": len(consumers),
+            "producers": len(producers),
+            "snapshot_loaded": snapshot is not None,
+        }
 
     def _contains(self, topic_name: str, partition_index: int) -> bool:
         """Return whether the master queue contains the given topic."""
         with self._lock:
             return (topic_name,partition_index) in self._topics
 
-    def add_topic(self, topic_name: str, partition_index:int) -> None:
-        """Add a topic to the master queue."""
+    def add_topic(
+        self, topic_name: str, partition_index: int, retention: Optional[Dict[str, int]] = None
+    ) -> None:
+        """Add a topic to the master queue. retention may hold the
+        retention_ms, retention_bytes and retention_messages of the topic."""
+        retention = retention or {}
         with self._lock:
-            self._topics[(topic_name,partition_index)] = Topic(topic_name, partition_index)
+            self._topics[(topic_name,partition_index)] = Topic(
+                topic_name, partition_index, self._storage, self._tail_cache, retention=retention
+            )
 
         # add to db
-        db.session.add(TopicDB(name=topic_name, partition_index = partition_index))
+        db.session.add(TopicDB(name=topic_name, partition_index = partition_index, **retention))
         db.session.commit()
+        self._storage.add_partition(topic_name, partition_index)
 
     def get_size(self, consumer_id: str, topic_name: str, partition_index:int = None) -> List[Dict[str,int]]:
         """Return the number of log messages in the requested partition for
@@ -76,48 +180,364 @@ class MasterQueue:
         consumer_offset = self._topics[(topic_name,partition_index)].get_consumer_offset(consumer_id, partition_index)
         return {"partition_number": partition_index, "size": total_length - consumer_offset}
 
-    def get_log(self, topic_name: str, partition_index: int, consumer_id: str) -> str:
+    def get_log(
+        self, topic_name: str, partition_index: int, consumer_id: str, wait_ms: float = 0
+    ) -> bytes:
         """Return the log if consumer registered with topic and has a log
-        available to pull."""
-        current_length = self._topics[(topic_name, partition_index)].get_length()
-        index_to_fetch = self._topics[(topic_name, partition_index)].get_and_increment_consumer_offset(consumer_id, partition_index, current_length)
-        if index_to_fetch == current_length:
+        available to pull, waiting up to wait_ms for one."""
+        logs = self.get_logs(topic_name, partition_index, consumer_id, wait_ms=wait_ms)
+        if len(logs) == 0:
             return None
+        return logs[0]
+
+    def get_logs(
+        self,
+        topic_name: str,
+        partition_index: int,
+        consumer_id: str,
+        max_messages: int = 1,
+        max_bytes: Optional[int] = None,
+        wait_ms: float = 0,
+    ) -> List[bytes]:
+        """Return up to max_messages logs available to pull for the consumer
+        and commit the new offset once. If max_bytes is given, logs after the
+        first are only returned while their total size fits in it. If no log
+        is available, wait up to wait_ms for new logs to be committed."""
+        return self.consume_logs(
+            topic_name, partition_index, consumer_id, max_messages, max_bytes, wait_ms
+        )[1]
+
+    def consume_logs(
+        self,
+        topic_name: str,
+        partition_index: int,
+        consumer_id: str,
+        max_messages: int = 1,
+        max_bytes: Optional[int] = None,
+        wait_ms: float = 0,
+    ) -> Tuple[int, List[bytes]]:
+        """Same as get_logs, but also return the offset of the first log."""
+        topic = self._topics[(topic_name, partition_index)]
+        deadline = time.monotonic() + wait_ms / 1000
+        while True:
+            start, end = self._reserve_logs(topic, consumer_id, partition_index, max_messages)
+            if start < end:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not topic.wait_for_logs(start, remaining):
+                return start, []
+        try:
+            ids, logs = topic.get_logs(start, end)
+        except Exception:
+            # hand the range back so that its logs are not skipped
+            topic.release_consumer_offset(consumer_id, partition_index, end, start)
+            raise
+        return start, self._complete_consume(topic, consumer_id, partition_index, end, ids, logs, max_bytes)
 
-        # db update with index_to_fetch + 1
-        db.session.execute(
-            f"""
-            UPDATE consumer 
-            SET "offset" = GREATEST("offset", {index_to_fetch + 1}) 
-            where id = '{consumer_id}' and partition_index = '{partition_index}'
-            """
+    async def consume_logs_async(
+        self,
+        topic_name: str,
+        partition_index: int,
+        consumer_id: str,
+        max_messages: int = 1,
+        max_bytes: Optional[int] = None,
+        wait_ms: float = 0,
+    ) -> Tuple[int, List[bytes]]:
+        """Awaitable version of consume_logs."""
+        topic = self._topics[(topic_name, partition_index)]
+        deadline = time.monotonic() + wait_ms / 1000
+        while True:
+            start, end = self._reserve_logs(topic, consumer_id, partition_index, max_messages)
+            if start < end:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not await topic.wait_for_logs_async(start, remaining):
+                return start, []
+        try:
+            ids, logs = await topic.get_logs_async(start, end)
+        except Exception:
+            # hand the range back so that its logs are not skipped
+            topic.release_consumer_offset(consumer_id, partition_index, end, start)
+            raise
+        return start, self._complete_consume(topic, consumer_id, partition_index, end, ids, logs, max_bytes)
+
+    def _reserve_logs(
+        self, topic: Topic, consumer_id: str, partition_index: int, max_messages: int
+    ) -> Tuple[int, int]:
+        """Reserve up to max_messages committed logs for the consumer."""
+        return topic.get_and_advance_consumer_offset(
+            consumer_id, partition_index, max_messages, topic.get_length()
         )
-        db.session.commit()
-        return self._topics[(topic_name, partition_index)].get_log(index_to_fetch)
 
-    def add_log(self, topic_name: str, partition_index:int, producer_id: str, message: str) -> None:
-        """Add a log to the topic"""
-        timestamp = time.time()
+    def _complete_consume(
+        self,
+        topic: Topic,
+        consumer_id: str,
+        partition_index: int,
+        end: int,
+        ids: Sequence[int],
+        logs: List[bytes],
+        max_bytes: Optional[int],
+    ) -> List[bytes]:
+        """Trim the logs (with the given ids) read for the reserved range
+        ending at end to max_bytes and mark the new offset of the
+        consumer."""
+        if max_bytes is not None and len(logs) > 0:
+            count, total_bytes = 1, len(logs[0])
+            while count < len(logs) and total_bytes + len(logs[count]) <= max_bytes:
+                total_bytes += len(logs[count])
+                count += 1
+            # hand the logs that did not fit back to the consumer, unless a
+            # concurrent request of the same consumer already moved past them.
+            # The ids of failed writes are missing, so the offset follows the
+            # id of the last log kept.
+            if count < len(logs) and topic.release_consumer_offset(
+                consumer_id, partition_index, end, ids[count - 1] + 1
+            ):
+                logs, end = logs[:count], ids[count - 1] + 1
 
-        # no longer storing logs in memory
-        # index = self._topics[(topic_name,partition_index)].add_log(
-        #     Log(producer_id, message, timestamp)
-        # )
+        # the new offset is written to the db by the checkpointer
+        self._checkpointer.mark(consumer_id, partition_index, end)
+        self._record_load("consumed", len(logs), sum(len(log) for log in logs))
+        return logs
 
-        index = self._topics[(topic_name,partition_index)].increment_length()
+    def _record_load(self, direction: str, logs: int, size: int) -> None:
+        """Count logs produced or consumed, and their bytes."""
+        with self._load_lock:
+            self._load[direction + "_logs"] += logs
+            self._load[direction + "_bytes"] += size
 
-        # add to db
-        db.session.add(
-            LogDB(
-                id=index,
-                topic_name=topic_name,
-                partition_index=partition_index,
-                producer_id=producer_id,
-                message=message,
-                timestamp=timestamp,
+    def get_load(self) -> Dict[str, int]:
+        """Return the logs and bytes produced and consumed since the broker
+        started, and the number of logs kept in all its partitions."""
+        with self._load_lock:
+            load = dict(self._load)
+        load["stored_logs"] = sum(
+            topic.get_length() - topic.get_log_start() for topic in self._get_partitions()
+        )
+        return load
+
+    def open_stream(
+        self, topic_name: str, partition_index: int, consumer_id: str, credits: int
+    ) -> ConsumerStream:
+        """Open a stream pushing the logs of the partition to the consumer,
+        with the given initial credits."""
+        topic = self._topics.get((topic_name, partition_index))
+        if topic is None or not topic.check_consumer(consumer_id, partition_index):
+            raise Exception(f"Consumer '{consumer_id}' is not registered with the partition.")
+        with self._lock:
+            if len(self._streams) >= app.config["CONSUME_MAX_STREAMS"]:
+                raise Exception("Too many open streams.")
+            stream = ConsumerStream(
+                uuid.uuid4().hex, topic_name, partition_index, consumer_id, credits
             )
+            self._streams[stream.stream_id] = stream
+        return stream
+
+    def add_stream_credits(self, stream_id: str, credits: int) -> None:
+        """Grant credits to an open stream."""
+        with self._lock:
+            stream = self._streams.get(stream_id)
+        if stream is None:
+            raise Exception(f"Stream '{stream_id}' is not open.")
+        stream.add_credits(credits)
+
+    def close_stream(self, stream_id: str) -> None:
+        """Forget a stream once its consumer disconnected."""
+        with self._lock:
+            self._streams.pop(stream_id, None)
+
+    def add_log(self, topic_name: str, partition_index:int, producer_id: str, message: bytes) -> int:
+        """Add a log to the topic and return its offset."""
+        return self.add_logs(topic_name, partition_index, producer_id, [message])[0]
+
+    def add_logs(self, topic_name: str, partition_index: int, producer_id: str, messages: List[bytes]) -> List[int]:
+        """Add a batch of logs to the topic and return the offsets assigned
+        to them (in the order given). The logs are committed together with
+        the logs of concurrent requests by the log appender."""
+        self._check_partition(topic_name, partition_index)
+        return self._appender.append(topic_name, partition_index, producer_id, LogBatch(messages))
+
+    def add_compressed_logs(
+        self, topic_name: str, partition_index: int, producer_id: str, codec: str, payload: bytes, count: int
+    ) -> List[int]:
+        """Add a batch of count logs compressed with codec as one payload and
+        return the offsets assigned to them. The batch is stored as it is."""
+        self._check_partition(topic_name, partition_index)
+        return self._appender.append(
+            topic_name, partition_index, producer_id, LogBatch(codec=codec, payload=payload, count=count)
         )
-        db.session.commit()
+
+    async def add_logs_async(
+        self, topic_name: str, partition_index: int, producer_id: str, batch: LogBatch
+    ) -> List[int]:
+        """Awaitable version of add_logs (and add_compressed_logs), the
+        caller is resumed once the log appender committed the logs."""
+        self._check_partition(topic_name, partition_index)
+        return await asyncio.wrap_future(
+            self._appender.submit(topic_name, partition_index, producer_id, batch)
+        )
+
+    def _check_partition(self, topic_name: str, partition_index: int) -> None:
+        """Raise if the partition is not in the master queue, before its logs
+        are handed to the log appender."""
+        if not self._contains(topic_name, partition_index):
+            raise Exception("Topic partition does not exist.")
+
+    def attach_async_database(self, async_db: AsyncDatabase) -> None:
+        """Serve the asynchronous reads of the storage from the pools of
+        async_db."""
+        self._storage.attach_async_database(async_db)
+
+    def _get_partitions(self) -> List[Topic]:
+        """Return all partitions of the master queue."""
+        with self._lock:
+            return list(self._topics.values())
+
+    def _apply_retention(self, topic: Topic) -> int:
+        """Move the start of the log of the partition forward as its
+        retention requires, then remove the logs before it from the storage.
+        Return the number of logs removed. Only called by the reaper."""
+        retention = topic.get_retention()
+        max_ms = retention.get("retention_ms") or app.config["RETENTION_MS"]
+        max_bytes = retention.get("retention_bytes") or app.config["RETENTION_BYTES"]
+        max_messages = retention.get("retention_messages") or app.config["RETENTION_MESSAGES"]
+        if max_ms <= 0 and max_bytes <= 0 and max_messages <= 0:
+            return 0
+
+        name, partition_index = topic.get_name(), topic.get_partition_index()
+        log_start = old_log_start = topic.get_log_start()
+        length = topic.get_length()
+        if max_messages > 0:
+            log_start = max(log_start, length - max_messages)
+        if max_ms > 0 and log_start < length:
+            log_start = self._storage.find_offset_by_time(
+                name, partition_index, log_start, length, time.time() - max_ms / 1000
+            )
+        if max_bytes > 0 and log_start < length:
+            log_start = self._storage.find_offset_by_bytes(
+                name, partition_index, log_start, length, max_bytes
+            )
+
+        if log_start > old_log_start:
+            # the new start is stored before any log is removed, so that it
+            # never moves back after a restart
+            TopicDB.query.filter_by(name=name, partition_index=partition_index).update(
+                {"log_start_offset": log_start}
+            )
+            db.session.commit()
+            for consumer_id, consumer_partition in topic.advance_log_start(log_start):
+                self._checkpointer.mark(consumer_id, consumer_partition, log_start)
+        # removes leftovers of an interrupted run as well
+        return self._storage.delete_before(name, partition_index, log_start)
+
+    def start_reaper(self) -> None:
+        """Start the retention reaper thread."""
+        self._reaper.start()
+
+    def start_appender(self) -> None:
+        """Start the log appender thread."""
+        self._appender.start()
+
+    def start_checkpointer(self) -> None:
+        """Start the consumer offset checkpointer thread."""
+        self._checkpointer.start()
+
+    def checkpoint_offsets(self) -> None:
+        """Write the dirty consumer offsets to the db."""
+        self._checkpointer.flush()
+
+    def start_snapshot(self) -> None:
+        """Start writing the state snapshot periodically."""
+        self._snapshot.start(self._capture_state)
+
+    def write_snapshot(self) -> None:
+        """Write the state snapshot."""
+        self._snapshot.write()
+
+    def _capture_state(self) -> Dict[str, Any]:
+        """Return the state of the master queue saved by the snapshot."""
+        with self._lock:
+            topics = list(self._topics.items())
+        partitions = []
+        consumers = []
+        for (topic_name, partition_index), topic in topics:
+            partitions.append([topic_name, partition_index, topic.get_length()])
+            # the offsets of a partition are saved as one array
+            keys, offsets = topic.get_consumer_snapshot()
+            consumers.append([
+                topic_name,
+                partition_index,
+                [consumer_id for consumer_id, _ in keys],
+                StateSnapshot.encode_offsets(offsets),
+            ])
+        return {"partitions": partitions, "consumers": consumers}
+
+    def _write_logs(self, entries: List[LogEntry]) -> List[Union[List[int], Exception]]:
+        """Write the given batches of logs to the storage at once and return
+        the offsets assigned to each batch, or the error of a batch naming a
+        partition that does not exist. Only called by the log appender."""
+        # reserve a contiguous range of ids for every batch
+        ranges: List[Tuple[Topic, int, int]] = []
+        rows: List[Dict[str, Any]] = []
+        results: List[Union[Tuple[Topic, int, int], Exception]] = []
+        try:
+            for topic_name, partition_index, producer_id, batch, timestamp in entries:
+                topic = self._topics.get((topic_name, partition_index))
+                if topic is None:
+                    results.append(Exception("Topic partition does not exist."))
+                    continue
+                start = topic.increment_length(batch.count)
+                ranges.append((topic, start, start + batch.count))
+                results.append(ranges[-1])
+                rows.extend(
+                    {
+                        "id": log_id,
+                        "count": count,
+                        "codec": codec,
+                        "topic_name": topic_name,
+                        "partition_index": partition_index,
+                        "producer_id": producer_id,
+                        "message": message,
+                        "timestamp": timestamp,
+                    }
+                    for log_id, count, codec, message in batch.rows(start)
+                )
+
+            self._storage.append(rows)
+            self._record_load(
+                "produced",
+                sum(entry[3].count for entry, result in zip(entries, results) if not isinstance(result, Exception)),
+                sum(len(row["message"]) for row in rows),
+            )
+            # keep the new logs in memory for consumers reading near the
+            # head, compressed batches are only decompressed when read
+            for result, entry in zip(results, entries):
+                if not isinstance(result, Exception) and not entry[3].is_compressed():
+                    result[0].add_logs(result[1], entry[3].messages)
+        finally:
+            # a failed range is resolved as well so that the watermark does
+            # not stall behind it, its ids are left as a gap in the log
+            for topic, start, end in ranges:
+                topic.commit_logs(start, end)
+        return [
+            result if isinstance(result, Exception) else list(range(result[1], result[2]))
+            for result in results
+        ]
+
+    def get_metrics(self) -> Dict[str, Dict[str, float]]:
+        """Return the metrics of the master queue."""
+        return {
+            "log_appender": self._appender.get_stats(),
+            "offset_checkpointer": self._checkpointer.get_stats(),
+            "tail_cache": self._tail_cache.get_stats(),
+            "storage": self._storage.get_stats(),
+            "retention": self._reaper.get_stats(),
+            "state_snapshot": self._snapshot.get_stats(),
+            "startup": self._startup_stats,
+            "streams": {"open": len(self._streams)},
+            "load": self.get_load(),
+        }
 
     def get_topics(self) -> List[Tuple[str,int]]:
         """Return the topic names."""
@@ -125,10 +545,53 @@ class MasterQueue:
             return list(self._topics.keys())
 
     def add_consumer(self, topic_name: str, partition_index:int, consumer_id: str) -> None:
-        """Add a consumer to the topic"""
-        self._topics[(topic_name,partition_index)].add_consumer(consumer_id, partition_index)
+        """Add a consumer to the topic, starting at the first log kept. A
+        consumer registered already keeps its offset, so that registrations
+        may be retried."""
+        if self._topics[(topic_name,partition_index)].check_consumer(consumer_id, partition_index):
+            return
+        offset = self._topics[(topic_name,partition_index)].get_log_start()
+        self._topics[(topic_name,partition_index)].add_consumer(consumer_id, partition_index, offset)
         # add to db
         db.session.add(
-            ConsumerDB(id=consumer_id, topic_name=topic_name, partition_index = partition_index,offset=0)
+            ConsumerDB(id=consumer_id, topic_name=topic_name, partition_index = partition_index,offset=offset)
         )
         db.session.commit()
+
+    def add_producer(self, topic_name: str, partition_index: int, producer_id: str) -> None:
+        """Register a producer of the topic, allowed to produce to the
+        partition directly."""
+        topic = self._topics[(topic_name, partition_index)]
+        if topic.check_producer(producer_id):
+            return
+        topic.add_producer(producer_id)
+        # add to db
+        db.session.add(ProducerDB(id=producer_id, topic_name=topic_name, partition_index=partition_index))
+        db.session.commit()
+
+    def set_map_version(self, map_version: int) -> None:
+        """Record the version of the partition map of the primary manager."""
+        with self._lock:
+            self._map_version = max(self._map_version, map_version)
+
+    def get_map_version(self) -> int:
+        with self._lock:
+            return self._map_version
+
+    def check_direct_produce(
+        self, topic_name: str, partition_index: int, producer_id: str, map_version: Optional[int]
+    ) -> Optional[Tuple[int, str]]:
+        """Check a produce sent by a client straight to the broker, with the
+        version of the partition map it picked the broker from. Return the
+        status code and message of the rejection, None if the produce may go
+        on. Stale maps, and partitions not on this broker, are rejected with
+        409 so that the client refreshes its map."""
+        if map_version is None:
+            return 400, "Missing partition map version."
+        if map_version < self.get_map_version():
+            return 409, "Stale partition map."
+        if not self._contains(topic_name, partition_index):
+            return 409, "Partition is not on this broker."
+        if not self._topics[(topic_name, partition_index)].check_producer(producer_id):
+            return 400, "Producer not registered with topic."
+        return None
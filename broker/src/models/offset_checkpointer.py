@@ -0,0 +1,107 @@
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from src import db, app
+from src.queries import CONSUMER_OFFSETS_UPDATE
+
+
+class OffsetCheckpointer:
+    """
+    Coalesces the consumer offset updates of the broker.
+
+    The authoritative offsets live in memory (ThreadSafeConsumerDict of every
+    topic), consumes only mark the new offset of a consumer as dirty here.
+    Dirty offsets are written to the consumer table in bulk every interval_ms
+    or as soon as max_dirty of them are pending, and once more on shutdown.
+    After a crash consumers may be redelivered the logs they consumed within
+    the last interval. An interval of 0 writes every offset synchronously.
+    """
+
+    # maximum number of offsets written by a single UPDATE statement
+    CHUNK_SIZE = 1000
+
+    def __init__(self, interval_ms: float, max_dirty: int) -> None:
+        self._interval = interval_ms / 1000
+        self._max_dirty = max_dirty
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._dirty: Dict[Tuple[str, int], int] = {}
+        self._thread = threading.Thread(target=self._run, name="offset-checkpointer", daemon=True)
+        self._flushes = 0
+        self._offsets_flushed = 0
+        self._last_flush_seconds = 0.0
+
+    def start(self) -> None:
+        """Start the checkpointer thread (unless offsets are written
+        synchronously)."""
+        if self._interval > 0:
+            self._thread.start()
+
+    def mark(self, consumer_id: str, partition_index: int, offset: int) -> None:
+        """Mark the offset of the consumer in the partition as dirty."""
+        with self._lock:
+            key = (consumer_id, partition_index)
+            self._dirty[key] = max(self._dirty.get(key, 0), offset)
+            dirty = len(self._dirty)
+        if self._interval <= 0:
+            self.flush()
+        elif dirty >= self._max_dirty:
+            self._wake.set()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self._interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                app.logger.warning(f"Unable to checkpoint consumer offsets: {e}")
+
+    def flush(self) -> None:
+        """Write all dirty offsets to the database."""
+        with self._flush_lock:
+            with self._lock:
+                dirty, self._dirty = self._dirty, {}
+            if len(dirty) == 0:
+                return
+            started = time.monotonic()
+            items = list(dirty.items())
+            try:
+                with app.app_context():
+                    for i in range(0, len(items), self.CHUNK_SIZE):
+                        self._update(items[i:i + self.CHUNK_SIZE])
+                    db.session.commit()
+            except Exception:
+                # keep the offsets dirty so that the next flush retries them
+                with self._lock:
+                    for key, offset in dirty.items():
+                        self._dirty[key] = max(self._dirty.get(key, 0), offset)
+                raise
+            with self._lock:
+                self._flushes += 1
+                self._offsets_flushed += len(items)
+                self._last_flush_seconds = time.monotonic() - started
+
+    def _update(self, items: List[Tuple[Tuple[str, int], int]]) -> None:
+        """Write the given offsets with a single UPDATE statement."""
+        CONSUMER_OFFSETS_UPDATE.execute(
+            {
+                "ids": [consumer_id for (consumer_id, _), _ in items],
+                "partition_indices": [partition_index for (_, partition_index), _ in items],
+                "offsets": [offset for _, offset in items],
+            }
+        )
+
+    def get_stats(self) -> Dict[str, float]:
+        """Return the checkpointing statistics."""
+        with self._lock:
+            return {
+                "interval_ms": self._interval * 1000,
+                "max_dirty": self._max_dirty,
+                "dirty": len(self._dirty),
+                "flushes": self._flushes,
+                "offsets_flushed": self._offsets_flushed,
+                "last_flush_ms": self._last_flush_seconds * 1000,
+            }
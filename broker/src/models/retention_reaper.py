@@ -0,0 +1,70 @@
+import threading
+import time
+from typing import Callable, Dict, List
+
+from src import app
+from src.models.topic import Topic
+
+
+class RetentionReaper:
+    """
+    Background enforcement of the retention of the topics.
+
+    Every interval_ms the reaper calls apply_retention on every partition of
+    the broker, which moves the start of its log forward as its retention
+    requires and removes the logs before it from the storage. apply_retention
+    returns the number of logs removed. An interval of 0 disables the reaper.
+    """
+
+    def __init__(
+        self,
+        get_topics: Callable[[], List[Topic]],
+        apply_retention: Callable[[Topic], int],
+        interval_ms: float,
+    ) -> None:
+        self._get_topics = get_topics
+        self._apply_retention = apply_retention
+        self._interval = interval_ms / 1000
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="retention-reaper", daemon=True)
+        self._runs = 0
+        self._logs_removed = 0
+        self._last_run_seconds = 0.0
+
+    def start(self) -> None:
+        """Start the reaper thread."""
+        if self._interval > 0:
+            self._thread.start()
+
+    def _run(self) -> None:
+        with app.app_context():
+            while True:
+                time.sleep(self._interval)
+                self.run_once()
+
+    def run_once(self) -> None:
+        """Apply the retention of every partition once."""
+        started = time.monotonic()
+        removed = 0
+        for topic in self._get_topics():
+            try:
+                removed += self._apply_retention(topic)
+            except Exception as e:
+                app.logger.warning(
+                    f"Unable to apply the retention of partition {topic.get_partition_index()}"
+                    f" of topic {topic.get_name()}: {e}"
+                )
+        with self._lock:
+            self._runs += 1
+            self._logs_removed += removed
+            self._last_run_seconds = time.monotonic() - started
+
+    def get_stats(self) -> Dict[str, float]:
+        """Return the retention statistics."""
+        with self._lock:
+            return {
+                "interval_ms": self._interval * 1000,
+                "runs": self._runs,
+                "logs_removed": self._logs_removed,
+                "last_run_ms": self._last_run_seconds * 1000,
+            }
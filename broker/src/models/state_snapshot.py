@@ -0,0 +1,111 @@
+import base64
+import json
+import os
+import sys
+import threading
+import time
+from array import array
+from typing import Any, Callable, Dict, Optional
+
+from src import app
+
+
+class StateSnapshot:
+    """
+    Optional on-disk snapshot of the in-memory state of the master queue:
+    the length of every partition and the offsets of its consumers.
+
+    The snapshot is written every interval_ms and on shutdown. At startup it
+    only serves as a hint, the lengths are checked against the storage and
+    the consumer offsets are merged with the ones of the database. An empty
+    path disables the snapshot. The offsets of the consumers of a partition
+    are saved as one array of 64-bit little-endian integers in base64.
+    """
+
+    VERSION = 2
+
+    def __init__(self, path: str, interval_ms: float) -> None:
+        self._path = path
+        self._interval = interval_ms / 1000
+        self._lock = threading.Lock()
+        self._capture: Optional[Callable[[], Dict[str, Any]]] = None
+        self._thread = threading.Thread(target=self._run, name="state-snapshot", daemon=True)
+        self._writes = 0
+        self._last_write_seconds = 0.0
+
+    @staticmethod
+    def encode_offsets(offsets: array) -> str:
+        """Return an array of offsets as saved in the snapshot."""
+        if sys.byteorder != "little":
+            offsets = array("q", offsets)
+            offsets.byteswap()
+        return base64.b64encode(offsets.tobytes()).decode()
+
+    @staticmethod
+    def decode_offsets(data: str) -> array:
+        """Return an array of offsets saved by encode_offsets."""
+        offsets = array("q")
+        offsets.frombytes(base64.b64decode(data))
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        return offsets
+
+    def enabled(self) -> bool:
+        """Return whether the snapshot is enabled."""
+        return self._path != ""
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """Return the last snapshot written, or None if there is none or it
+        can not be read."""
+        if not self.enabled() or not os.path.exists(self._path):
+            return None
+        try:
+            with open(self._path) as file:
+                state = json.load(file)
+        except Exception as e:
+            app.logger.warning(f"Ignoring unreadable state snapshot {self._path}: {e}")
+            return None
+        if state.get("version") != self.VERSION:
+            return None
+        return state
+
+    def start(self, capture: Callable[[], Dict[str, Any]]) -> None:
+        """Start writing the state returned by capture periodically."""
+        self._capture = capture
+        if self.enabled() and self._interval > 0:
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self._interval)
+            try:
+                self.write()
+            except Exception as e:
+                app.logger.warning(f"Unable to write state snapshot: {e}")
+
+    def write(self) -> None:
+        """Capture the state and replace the snapshot with it atomically."""
+        if not self.enabled() or self._capture is None:
+            return
+        with self._lock:
+            started = time.monotonic()
+            state = self._capture()
+            state["version"] = self.VERSION
+            temp_path = self._path + ".tmp"
+            with open(temp_path, "w") as file:
+                json.dump(state, file)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_path, self._path)
+            self._writes += 1
+            self._last_write_seconds = time.monotonic() - started
+
+    def get_stats(self) -> Dict[str, float]:
+        """Return the snapshot statistics."""
+        with self._lock:
+            return {
+                "enabled": self.enabled(),
+                "interval_ms": self._interval * 1000,
+                "writes": self._writes,
+                "last_write_ms": self._last_write_seconds * 1000,
+            }
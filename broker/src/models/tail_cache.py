@@ -0,0 +1,73 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from src.datastructures import ThreadSafeLogQueue
+
+
+class TailCache:
+    """
+    In-memory cache of the most recent logs of every partition.
+
+    Each partition keeps its tail in a ThreadSafeLogQueue of at most
+    partition_max_bytes. The queues share a global budget of max_bytes:
+    whenever it is exceeded, the tails of the least recently used
+    partitions are evicted. A max_bytes of 0 disables the cache.
+    """
+
+    def __init__(self, max_bytes: int, partition_max_bytes: int) -> None:
+        self._max_bytes = max_bytes
+        self._partition_max_bytes = min(partition_max_bytes, max_bytes)
+        self._lock = threading.Lock()
+        # queues ordered from least to most recently used
+        self._queues: "OrderedDict[ThreadSafeLogQueue, None]" = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def new_queue(self) -> ThreadSafeLogQueue:
+        """Return a new (empty) tail queue for a partition."""
+        return ThreadSafeLogQueue(self._partition_max_bytes)
+
+    def append(self, queue: ThreadSafeLogQueue, index: int, messages: List[bytes]) -> None:
+        """Append committed logs starting at id index to the tail of the
+        partition."""
+        if self._max_bytes <= 0:
+            return
+        with self._lock:
+            self._bytes += queue.append(index, messages)
+            self._queues[queue] = None
+            self._queues.move_to_end(queue)
+            # evict the coldest partitions until the cache fits its budget
+            while self._bytes > self._max_bytes and len(self._queues) > 1:
+                cold_queue, _ = self._queues.popitem(last=False)
+                self._bytes -= cold_queue.clear()
+                self._evictions += 1
+
+    def get(self, queue: ThreadSafeLogQueue, start: int, end: int) -> Optional[List[bytes]]:
+        """Return the logs with ids in [start, end) if all of them are
+        cached, otherwise return None."""
+        logs = queue.get_range(start, end)
+        with self._lock:
+            if logs is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            if queue in self._queues:
+                self._queues.move_to_end(queue)
+        return logs
+
+    def get_stats(self) -> Dict[str, float]:
+        """Return the size and hit/miss statistics of the cache."""
+        with self._lock:
+            return {
+                "max_bytes": self._max_bytes,
+                "partition_max_bytes": self._partition_max_bytes,
+                "bytes": self._bytes,
+                "partitions": len(self._queues),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": self._hits / max(self._hits + self._misses, 1),
+                "evictions": self._evictions,
+            }
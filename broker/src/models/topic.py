@@ -1,64 +1,128 @@
 import threading
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
 
 from src.datastructures import (
     ThreadSafeLogQueue,
     ThreadSafeConsumerDict,
     ThreadSafeProducerSet,
+    ThreadSafeWatermark,
+    ThreadSafeSignal,
 )
-from src.models import Log
-from src import execute_read_query
+from src.models import Log, TailCache
+from src.storage import LogStorage
 
 class Topic:
     """
     A topic is a collection of log messages that are related to each other.
     """
 
-    def __init__(self, name: str, partition_index: int, length: int = 0):
+    def __init__(
+        self,
+        name: str,
+        partition_index: int,
+        storage: LogStorage,
+        tail_cache: TailCache,
+        length: int = 0,
+        log_start: int = 0,
+        retention: Optional[Dict[str, int]] = None,
+    ):
         self._name = name
         self._partition_index = partition_index
-        # self._logs = ThreadSafeLogQueue() # deprecated - no longer storing logs in memory
-        self._len = length # counter of logs inserted till now
+        self._storage = storage
+        # only the most recent logs are held in memory, older logs are read
+        # from the storage
+        self._tail_cache = tail_cache
+        self._logs = tail_cache.new_queue()
+        self._len = length # counter of log ids reserved till now
+        # number of logs committed as a contiguous prefix of ids, this is the
+        # length visible to consumers
+        self._committed = ThreadSafeWatermark(length)
+        # id of the first log kept by retention, only ever moves forward
+        self._log_start = log_start
+        # retention_ms, retention_bytes and retention_messages of the topic
+        self._retention = retention or {}
+        # notified whenever logs are committed, consumers waiting for new
+        # logs park on it
+        self._new_logs = ThreadSafeSignal()
         self._producers = ThreadSafeProducerSet()
         self._consumers = ThreadSafeConsumerDict()
         self._lock = threading.Lock()
 
     def get_length(self) -> int:
         """Return the length of the topic."""
-        # return len(self._logs) # deprecated
-        # note that this might not be same as self._len because the slave might
-        # be running behind the master
-        return execute_read_query(
-            f"""
-            SELECT COUNT(*) 
-            FROM log WHERE topic_name = '{self._name}' 
-            AND partition_index = '{self._partition_index}'
-            """
-        ).scalar()
-
-    def get_log(self, index: int) -> str:
-        """Return the log at the given index."""
-        # return self._logs[index] # deprecated
-        return execute_read_query(
-            f"""
-            SELECT *
-            FROM log WHERE topic_name = '{self._name}'
-            AND partition_index = '{self._partition_index}'
-            AND id = '{index}'
-            """
-        ).fetchone()['message']
-
-    # deprecated - no longer storing logs in memory
-    # def add_log(self, log: Log) -> int:
-    #     """Add a log to the topic and return its index."""
-    #     return self._logs.append(log)
-
-    def increment_length(self) -> int:
-        """Increment the length of the and return old length."""
+        return self._committed.get()
+
+    def get_name(self) -> str:
+        """Return the name of the topic."""
+        return self._name
+
+    def get_partition_index(self) -> int:
+        """Return the partition index of the topic."""
+        return self._partition_index
+
+    def get_retention(self) -> Dict[str, int]:
+        """Return the retention settings of the topic."""
+        return self._retention
+
+    def get_log_start(self) -> int:
+        """Return the id of the first log kept by retention."""
+        with self._lock:
+            return self._log_start
+
+    def advance_log_start(self, log_start: int) -> List[Tuple[str, int]]:
+        """Move the start of the log forward to log_start, along with the
+        consumers behind it. Return the (consumer_id, partition_index) of
+        the moved consumers."""
+        with self._lock:
+            self._log_start = max(self._log_start, log_start)
+        return self._consumers.advance_offsets(log_start)
+
+    def get_logs(self, start: int, end: int) -> Tuple[Sequence[int], List[bytes]]:
+        """Return the ids and the logs with indices in [start, end) in
+        order. The ids of failed writes are missing."""
+        logs = self._tail_cache.get(self._logs, start, end)
+        if logs is not None:
+            return range(start, end), logs
+        ids: List[int] = []
+        return ids, self._storage.read(self._name, self._partition_index, start, end, ids)
+
+    async def get_logs_async(self, start: int, end: int) -> Tuple[Sequence[int], List[bytes]]:
+        """Awaitable version of get_logs."""
+        logs = self._tail_cache.get(self._logs, start, end)
+        if logs is not None:
+            return range(start, end), logs
+        ids: List[int] = []
+        return ids, await self._storage.read_async(self._name, self._partition_index, start, end, ids)
+
+    def add_logs(self, start: int, messages: List[bytes]) -> None:
+        """Add committed logs starting at index start to the in-memory tail
+        of the topic. Logs must be added in order of their indices."""
+        self._tail_cache.append(self._logs, start, messages)
+
+    def increment_length(self, count: int = 1) -> int:
+        """Increment the length of the topic by count and return old length.
+        The ids [old length, old length + count) are reserved for the caller."""
         with self._lock:
             old_len = self._len
-            self._len += 1
+            self._len += count
         return old_len
 
+    def commit_logs(self, start: int, end: int) -> int:
+        """Mark the logs with indices in [start, end) as committed and return
+        the new length of the topic."""
+        length = self._committed.commit(start, end)
+        self._new_logs.notify()
+        return length
+
+    def wait_for_logs(self, offset: int, timeout: float) -> bool:
+        """Wait up to timeout seconds for the length of the topic to grow
+        past offset. Return whether it did."""
+        return self._new_logs.wait_for(lambda: self.get_length() > offset, timeout)
+
+    async def wait_for_logs_async(self, offset: int, timeout: float) -> bool:
+        """Awaitable version of wait_for_logs."""
+        return await self._new_logs.wait_for_async(lambda: self.get_length() > offset, timeout)
 
     def add_producer(self, producer_id: str) -> None:
         """Add a producer to the topic."""
@@ -68,6 +132,11 @@ class Topic:
         """Add a consumer to the topic with given offset."""
         self._consumers.add(consumer_id, partition_index, offset)
 
+    def restore_consumers(self, offsets: List[Tuple[str, int, int]]) -> None:
+        """Add the (consumer_id, partition_index, offset) of many consumers
+        at once."""
+        self._consumers.restore(offsets)
+
     def check_producer(self, producer_id: str) -> bool:
         """Return whether the producer is in the topic."""
         return self._producers.contains(producer_id)
@@ -85,3 +154,27 @@ class Topic:
     ) -> int:
         """Return the consumer offset and increment it by one."""
         return self._consumers.get_offset_and_increment(consumer_id, partition_index, threshold)
+
+    def get_and_advance_consumer_offset(
+        self, consumer_id: str, partition_index: int, count: int, threshold: int
+    ) -> Tuple[int, int]:
+        """Reserve up to count logs for the consumer and return the reserved
+        range of indices [start, end)."""
+        return self._consumers.get_offset_and_advance(consumer_id, partition_index, count, threshold)
+
+    def release_consumer_offset(
+        self, consumer_id: str, partition_index: int, expected: int, offset: int
+    ) -> bool:
+        """Give back the reserved logs after offset if the consumer offset is
+        still at expected."""
+        return self._consumers.release_offset(consumer_id, partition_index, expected, offset)
+
+    def get_consumer_offsets(self) -> List[Tuple[str, int, int]]:
+        """Return the (consumer_id, partition_index, offset) of every consumer
+        of the topic."""
+        return self._consumers.items()
+
+    def get_consumer_snapshot(self) -> Tuple[List[Tuple[str, int]], array]:
+        """Return the (consumer_id, partition_index) of every consumer of the
+        topic and an array of their offsets, in the same order."""
+        return self._consumers.snapshot()
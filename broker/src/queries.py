@@ -0,0 +1,201 @@
+import re
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Result
+
+from src import db, app
+
+if TYPE_CHECKING:
+    import asyncpg
+
+
+class Statement:
+    """
+    A named SQL statement with bound parameters, compiled once.
+
+    The statement text never changes between calls, so Postgres and
+    SQLAlchemy can cache it. When SQL_PREPARED_STATEMENTS is enabled, the
+    statement is also prepared server-side (PREPARE) the first time it is
+    used on a connection and run with EXECUTE afterwards, which skips
+    parsing and planning. psycopg2 has no protocol-level prepared
+    statements, so the SQL PREPARE/EXECUTE commands are used instead.
+    """
+
+    def __init__(self, name: str, sql: str, params: List[Tuple[str, str]]) -> None:
+        """params lists the (name, postgres type) of the parameters used as
+        :name in sql."""
+        self.name = name
+        self._query = text(sql)
+        positions = {param: i + 1 for i, (param, _) in enumerate(params)}
+        prepared_sql = re.sub(r":(\w+)", lambda match: f"${positions[match.group(1)]}", sql)
+        # asyncpg takes the positional form and prepares it by itself
+        self._positional_sql = prepared_sql
+        self._param_names = [param for param, _ in params]
+        if len(params) > 0:
+            self._prepare = text(
+                f"PREPARE {name} ({', '.join(pg_type for _, pg_type in params)}) AS {prepared_sql}"
+            )
+            self._execute = text(
+                f"EXECUTE {name} ({', '.join(':' + param for param, _ in params)})"
+            )
+        else:
+            self._prepare = text(f"PREPARE {name} AS {prepared_sql}")
+            self._execute = text(f"EXECUTE {name}")
+
+    def execute(self, params: Optional[Dict[str, Any]] = None, read: bool = False) -> Result:
+        """Run the statement in the current session, on the slave database if
+        read is set and on the master database otherwise."""
+        params = params or {}
+        connection = db.session.connection(
+            bind_arguments={"bind": db.engines["read"]} if read else None
+        )
+        if not app.config["SQL_PREPARED_STATEMENTS"]:
+            return connection.execute(self._query, params)
+        # the names of the statements prepared on a database connection are
+        # kept with it in the connection pool
+        prepared = connection.connection.info.setdefault("prepared_statements", set())
+        if self.name not in prepared:
+            connection.execute(self._prepare)
+            prepared.add(self.name)
+        return connection.execute(self._execute, params)
+
+    async def fetch_async(self, pool: "asyncpg.Pool", params: Optional[Dict[str, Any]] = None) -> List[Any]:
+        """Run the statement on a connection of the asyncpg pool and return
+        the rows."""
+        params = params or {}
+        return await pool.fetch(self._positional_sql, *[params[name] for name in self._param_names])
+
+
+# the records holding the logs [first, last], starting from the record of
+# the compressed batch first belongs to
+LOG_RANGE = Statement(
+    "log_range",
+    """
+    SELECT id, count, codec, message
+    FROM log WHERE topic_name = :topic_name
+    AND partition_index = :partition_index
+    AND id BETWEEN COALESCE((
+        SELECT MAX(id) FROM log WHERE topic_name = :topic_name
+        AND partition_index = :partition_index AND id <= :first
+    ), :first) AND :last
+    ORDER BY id
+    """,
+    [("topic_name", "text"), ("partition_index", "integer"), ("first", "integer"), ("last", "integer")],
+)
+
+# one past the last log of the partition
+LOG_END = Statement(
+    "log_end",
+    """
+    SELECT id + count
+    FROM log WHERE topic_name = :topic_name
+    AND partition_index = :partition_index
+    ORDER BY id DESC LIMIT 1
+    """,
+    [("topic_name", "text"), ("partition_index", "integer")],
+)
+
+LOG_ENDS = Statement(
+    "log_ends",
+    """
+    SELECT topic_name, partition_index, MAX(id + count)
+    FROM log GROUP BY topic_name, partition_index
+    """,
+    [],
+)
+
+LOG_MIN_ID = Statement(
+    "log_min_id",
+    """
+    SELECT MIN(id)
+    FROM log WHERE topic_name = :topic_name
+    AND partition_index = :partition_index
+    """,
+    [("topic_name", "text"), ("partition_index", "integer")],
+)
+
+# first record written at or after a point in time, only the records
+# before it are scanned
+LOG_FIRST_SINCE = Statement(
+    "log_first_since",
+    """
+    SELECT id
+    FROM log WHERE topic_name = :topic_name
+    AND partition_index = :partition_index
+    AND id >= COALESCE((
+        SELECT MAX(id) FROM log WHERE topic_name = :topic_name
+        AND partition_index = :partition_index AND id <= :first
+    ), :first) AND timestamp >= :since
+    ORDER BY id LIMIT 1
+    """,
+    [("topic_name", "text"), ("partition_index", "integer"), ("first", "integer"), ("since", "double precision")],
+)
+
+# end of the newest record past max_bytes of messages counted from the end
+# of the partition, the running sum stops the index scan as soon as it is
+# found
+LOG_FIRST_OVER_BYTES = Statement(
+    "log_first_over_bytes",
+    """
+    SELECT id + count FROM (
+        SELECT id, count, SUM(octet_length(message)) OVER (ORDER BY id DESC) AS total
+        FROM log WHERE topic_name = :topic_name
+        AND partition_index = :partition_index
+        AND id < :end
+    ) AS tail
+    WHERE total > :max_bytes
+    ORDER BY id DESC LIMIT 1
+    """,
+    [("topic_name", "text"), ("partition_index", "integer"), ("end", "integer"), ("max_bytes", "bigint")],
+)
+
+# records in [first, last) holding only logs before log_start
+LOG_DELETE_RANGE = Statement(
+    "log_delete_range",
+    """
+    DELETE FROM log WHERE topic_name = :topic_name
+    AND partition_index = :partition_index
+    AND id >= :first AND id < :last AND id + count <= :log_start
+    RETURNING count
+    """,
+    [
+        ("topic_name", "text"),
+        ("partition_index", "integer"),
+        ("first", "integer"),
+        ("last", "integer"),
+        ("log_start", "integer"),
+    ],
+)
+
+# partitions whose expected length is wrong: a log exists past it, or the
+# last record before it does not end at it
+LOG_STALE_LENGTHS = Statement(
+    "log_stale_lengths",
+    """
+    SELECT v.topic_name, v.partition_index
+    FROM unnest(:topic_names, :partition_indices, :lengths) AS v(topic_name, partition_index, length)
+    WHERE EXISTS (
+        SELECT 1 FROM log WHERE log.topic_name = v.topic_name
+        AND log.partition_index = v.partition_index AND log.id >= v.length
+    ) OR (v.length > 0 AND (
+        SELECT log.id + log.count FROM log WHERE log.topic_name = v.topic_name
+        AND log.partition_index = v.partition_index AND log.id < v.length
+        ORDER BY log.id DESC LIMIT 1
+    ) IS DISTINCT FROM v.length)
+    """,
+    [("topic_names", "text[]"), ("partition_indices", "integer[]"), ("lengths", "integer[]")],
+)
+
+# the offsets are passed as arrays so that the text of the statement does
+# not depend on the number of offsets written
+CONSUMER_OFFSETS_UPDATE = Statement(
+    "consumer_offsets_update",
+    """
+    UPDATE consumer
+    SET "offset" = GREATEST(consumer."offset", v."offset")
+    FROM unnest(:ids, :partition_indices, :offsets) AS v(id, partition_index, "offset")
+    WHERE consumer.id = v.id AND consumer.partition_index = v.partition_index
+    """,
+    [("ids", "text[]"), ("partition_indices", "integer[]"), ("offsets", "integer[]")],
+)
@@ -0,0 +1,129 @@
+"""JSON schemas of the request bodies accepted by the broker."""
+
+from src.compression import CODECS, ENCODINGS
+
+# encoding of the message bodies in a request or response, "base64" for
+# binary bodies
+ENCODING_SCHEMA = {"type": "string", "enum": list(ENCODINGS)}
+
+TOPIC_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string"},
+        "partition_index": {"type": "number"},
+        "retention_ms": {"type": "integer", "minimum": 1},
+        "retention_bytes": {"type": "integer", "minimum": 1},
+        "retention_messages": {"type": "integer", "minimum": 1},
+    },
+    "required": ["name","partition_index"],
+}
+
+# optional retention settings of a topic
+RETENTION_KEYS = ("retention_ms", "retention_bytes", "retention_messages")
+
+CONSUMER_REGISTER_SCHEMA = {
+    "type": "object",
+    "properties": {"topic": {"type": "string"}, "consumer_id":{"type":"string"},"partition_index":{"type":"number"}},
+    "required": ["topic","consumer_id","partition_index"],
+}
+
+PRODUCER_REGISTER_SCHEMA = {
+    "type": "object",
+    "properties": {"topic": {"type": "string"}, "producer_id": {"type": "string"}, "partition_index": {"type": "number"}},
+    "required": ["topic", "producer_id", "partition_index"],
+}
+
+# version of the partition map of the primary manager that a client sending
+# its produces straight to the broker picked the broker from
+MAP_VERSION = {"type": "integer", "minimum": 0}
+
+MAP_VERSION_SCHEMA = {
+    "type": "object",
+    "properties": {"map_version": MAP_VERSION},
+    "required": ["map_version"],
+}
+
+PRODUCE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "topic": {"type": "string"},
+        "producer_id": {"type": "string"},
+        "message": {"type": "string"},
+        "encoding": ENCODING_SCHEMA,
+        "partition_index":{"type":"number"},
+        "map_version": MAP_VERSION,
+    },
+    "required": ["topic", "producer_id", "message","partition_index"],
+}
+
+PRODUCE_BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "topic": {"type": "string"},
+        "producer_id": {"type": "string"},
+        "messages": {
+            "type": "array",
+            "items": {"type": "string"},
+            "minItems": 1,
+        },
+        "encoding": ENCODING_SCHEMA,
+        # a batch compressed as a unit: count messages framed and compressed
+        # with codec, sent in base64
+        "codec": {"type": "string", "enum": [codec for codec in CODECS if codec != "none"]},
+        "payload": {"type": "string"},
+        "count": {"type": "integer", "minimum": 1},
+        "partition_index":{"type":"number"},
+        "map_version": MAP_VERSION,
+    },
+    "required": ["topic", "producer_id", "partition_index"],
+    "oneOf": [
+        {"required": ["messages"]},
+        {"required": ["codec", "payload", "count"]},
+    ],
+}
+
+CONSUME_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "topic": {"type": "string"},
+        "consumer_id": {"type": "string"},
+        "partition_index": {"type": "number"},
+        "max_messages": {"type": "integer", "minimum": 1},
+        "max_bytes": {"type": "integer", "minimum": 1},
+        "wait_ms": {"type": "integer", "minimum": 0},
+        "encoding": ENCODING_SCHEMA,
+    },
+    "required": ["topic", "consumer_id", "partition_index"],
+}
+
+STREAM_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "topic": {"type": "string"},
+        "consumer_id": {"type": "string"},
+        "partition_index": {"type": "number"},
+        "credits": {"type": "integer", "minimum": 0},
+        "batch_size": {"type": "integer", "minimum": 1},
+        "encoding": ENCODING_SCHEMA,
+    },
+    "required": ["topic", "consumer_id", "partition_index"],
+}
+
+STREAM_CREDITS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "stream_id": {"type": "string"},
+        "credits": {"type": "integer", "minimum": 1},
+    },
+    "required": ["stream_id", "credits"],
+}
+
+SIZE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "topic": {"type": "string"},
+        "consumer_id": {"type": "string"},
+        "partition_index": {"type": "number"}
+    },
+    "required": ["topic", "consumer_id"],
+}
@@ -0,0 +1,19 @@
+from src.storage.base import LogStorage
+from src.storage.postgres import PostgresLogStorage
+from src.storage.segment import SegmentLogStorage
+
+from src import app
+
+
+def create_log_storage() -> LogStorage:
+    """Return the log storage engine selected by the config of the broker."""
+    if app.config["LOG_STORAGE"] == "postgres":
+        return PostgresLogStorage()
+    if app.config["LOG_STORAGE"] == "segment":
+        return SegmentLogStorage(
+            app.config["SEGMENT_DIR"],
+            app.config["SEGMENT_MAX_BYTES"],
+            app.config["SEGMENT_INDEX_INTERVAL_BYTES"],
+            app.config["SEGMENT_FSYNC"],
+        )
+    raise Exception(f"Unknown log storage '{app.config['LOG_STORAGE']}'.")
@@ -0,0 +1,89 @@
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from src.async_db import AsyncDatabase
+
+
+class LogStorage:
+    """
+    Interface of the storage engines holding the logs of the partitions of
+    a broker. Topics and consumers are always kept in the database, only the
+    logs themselves go through the storage engine.
+    """
+
+    def setup(self) -> None:
+        """Prepare the storage when the broker starts."""
+
+    def add_partition(self, topic_name: str, partition_index: int) -> None:
+        """Prepare the storage of a newly created partition."""
+        raise NotImplementedError
+
+    def get_length(self, topic_name: str, partition_index: int) -> int:
+        """Return one past the id of the last log stored in the partition."""
+        raise NotImplementedError
+
+    def get_lengths(
+        self,
+        partitions: List[Tuple[str, int]],
+        expected: Optional[Dict[Tuple[str, int], int]] = None,
+    ) -> Dict[Tuple[str, int], int]:
+        """Return the lengths of the given (topic_name, partition_index)
+        partitions. expected may hold lengths known from an earlier run,
+        engines that can check them cheaply only recompute the wrong ones."""
+        return {
+            (topic_name, partition_index): self.get_length(topic_name, partition_index)
+            for topic_name, partition_index in partitions
+        }
+
+    def append(self, rows: List[Dict[str, Any]]) -> None:
+        """Store the given records. Each row holds the id, topic_name,
+        partition_index, producer_id, message and timestamp of a record, and
+        the number of logs (count) and the codec of its message: a record of
+        a compressed batch holds the logs [id, id + count). Raise if the
+        records could not be stored."""
+        raise NotImplementedError
+
+    def read(
+        self, topic_name: str, partition_index: int, start: int, end: int, ids: Optional[List[int]] = None
+    ) -> List[bytes]:
+        """Return the messages of the logs with ids in [start, end) in order,
+        decompressing the batches they are stored in. Missing ids are
+        skipped, the id of every returned message is added to ids if
+        given."""
+        raise NotImplementedError
+
+    def find_offset_by_time(
+        self, topic_name: str, partition_index: int, start: int, end: int, timestamp: float
+    ) -> int:
+        """Return the id of the first log in [start, end) written at or after
+        timestamp, or end if there is none."""
+        raise NotImplementedError
+
+    def find_offset_by_bytes(
+        self, topic_name: str, partition_index: int, start: int, end: int, max_bytes: int
+    ) -> int:
+        """Return the smallest offset (at least start) such that the logs in
+        [offset, end) hold at most max_bytes."""
+        raise NotImplementedError
+
+    def delete_before(self, topic_name: str, partition_index: int, offset: int) -> int:
+        """Remove the logs with ids before offset that the storage can remove
+        and return their number (if known)."""
+        raise NotImplementedError
+
+    async def read_async(
+        self, topic_name: str, partition_index: int, start: int, end: int, ids: Optional[List[int]] = None
+    ) -> List[bytes]:
+        """Awaitable version of read, engines without asynchronous reads
+        read synchronously."""
+        return self.read(topic_name, partition_index, start, end, ids)
+
+    def attach_async_database(self, async_db: "AsyncDatabase") -> None:
+        """Use the connection pools of async_db for asynchronous reads."""
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return the statistics of the storage."""
+        return {}
+
+    def close(self) -> None:
+        """Release the resources held by the storage."""
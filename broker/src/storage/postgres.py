@@ -0,0 +1,305 @@
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from src import db, app
+from src import LogDB
+from src.async_db import AsyncDatabase
+from src.compression import decode_batch
+from src.queries import (
+    LOG_DELETE_RANGE,
+    LOG_FIRST_OVER_BYTES,
+    LOG_FIRST_SINCE,
+    LOG_END,
+    LOG_ENDS,
+    LOG_MIN_ID,
+    LOG_RANGE,
+    LOG_STALE_LENGTHS,
+)
+from src.storage.base import LogStorage
+from src.storage.replica_tracker import ReplicaTracker, parse_lsn
+
+
+class PostgresLogStorage(LogStorage):
+    """
+    Stores every log as a row of the log table. Writes go to the master
+    database and reads to the slave once it replayed the logs read (see
+    ReplicaTracker).
+
+    With LOG_TABLE_PARTITIONING the log table is list partitioned by topic,
+    and the table of every topic by partition index, so that each partition
+    of the broker has its own table and index.
+    """
+
+    def __init__(self) -> None:
+        self._async_db: Optional[AsyncDatabase] = None
+        self._replica = ReplicaTracker(
+            app.config["REPLICA_READ_POLICY"],
+            app.config["REPLICA_WAIT_MS"],
+            app.config["REPLICA_POLL_MS"],
+            self._poll_replay_lsn,
+        )
+        # the WAL functions were renamed in Postgres 10
+        self._current_lsn_function = "pg_current_xlog_location"
+        self._replay_lsn_function = "pg_last_xlog_replay_location"
+
+    def setup(self) -> None:
+        """Add the index the log reads are served from if needed: reads rely
+        on the primary key, an index is only added for log tables created
+        before the primary key was reordered. The messages are not covered
+        by the index, as binary bodies and compressed batches may not fit
+        in an index entry. Start tracking the replay position of the
+        slave."""
+        version = int(db.session.execute(text("SHOW server_version_num")).scalar())
+        if version >= 100000:
+            self._current_lsn_function = "pg_current_wal_lsn"
+            self._replay_lsn_function = "pg_last_wal_replay_lsn"
+        first_key_column = db.session.execute(
+            text(
+                """
+                SELECT a.attname FROM pg_index i
+                JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+                WHERE i.indrelid = 'log'::regclass AND i.indisprimary
+                """
+            )
+        ).scalar()
+        if first_key_column != "topic_name":
+            db.session.execute(
+                text(
+                    "CREATE INDEX IF NOT EXISTS log_partition_id_idx"
+                    " ON log (topic_name, partition_index, id)"
+                )
+            )
+        db.session.commit()
+        self._replica.start()
+
+    def _poll_replay_lsn(self) -> Optional[int]:
+        """Return the WAL position replayed by the slave, or None if it is
+        not a standby."""
+        with app.app_context():
+            lsn = db.session.execute(
+                text(f"SELECT {self._replay_lsn_function}()::text"),
+                bind_arguments={"bind": db.engines["read"]},
+            ).scalar()
+        return None if lsn is None else parse_lsn(lsn)
+
+    @staticmethod
+    def partition_table(topic_name: str, partition_index: int = None) -> str:
+        """Return the name of the table holding the logs of a topic, or of
+        one of its partitions, when the log table is partitioned. Topic
+        names are hashed as they may not be valid identifiers."""
+        table = "log_" + hashlib.md5(topic_name.encode()).hexdigest()[:16]
+        if partition_index is None:
+            return table
+        return f"{table}_{int(partition_index)}"
+
+    def add_partition(self, topic_name: str, partition_index: int) -> None:
+        """Create the tables of the partition if the log table is
+        partitioned, otherwise all partitions share the log table."""
+        if not app.config["LOG_TABLE_PARTITIONING"]:
+            return
+        topic_table = self.partition_table(topic_name)
+        try:
+            db.session.execute(
+                text(
+                    f"CREATE TABLE IF NOT EXISTS {topic_table} PARTITION OF log"
+                    " FOR VALUES IN (:topic_name) PARTITION BY LIST (partition_index)"
+                ),
+                {"topic_name": topic_name},
+            )
+            db.session.execute(
+                text(
+                    f"CREATE TABLE IF NOT EXISTS {self.partition_table(topic_name, partition_index)}"
+                    f" PARTITION OF {topic_table} FOR VALUES IN ({int(partition_index)})"
+                )
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def get_length(self, topic_name: str, partition_index: int) -> int:
+        """Return one past the id of the last log stored in the partition."""
+        end = LOG_END.execute(
+            {"topic_name": topic_name, "partition_index": partition_index}
+        ).scalar()
+        return 0 if end is None else end
+
+    def get_lengths(
+        self,
+        partitions: List[Tuple[str, int]],
+        expected: Optional[Dict[Tuple[str, int], int]] = None,
+    ) -> Dict[Tuple[str, int], int]:
+        """Return the lengths of the given partitions. Expected lengths are
+        checked with two index probes per partition in a single query, the
+        lengths are otherwise computed by one aggregate over the log table."""
+        lengths = {key: 0 for key in partitions}
+        known = [key for key in partitions if expected is not None and key in expected]
+        if len(known) > 0:
+            stale = LOG_STALE_LENGTHS.execute(
+                {
+                    "topic_names": [topic_name for topic_name, _ in known],
+                    "partition_indices": [partition_index for _, partition_index in known],
+                    "lengths": [expected[key] for key in known],
+                }
+            ).fetchall()
+            stale = set((row[0], row[1]) for row in stale)
+            unknown = [key for key in partitions if key not in expected or key in stale]
+            if len(unknown) <= len(partitions) // 2:
+                for key in known:
+                    lengths[key] = expected[key]
+                for topic_name, partition_index in unknown:
+                    lengths[(topic_name, partition_index)] = self.get_length(topic_name, partition_index)
+                return lengths
+        for topic_name, partition_index, end in LOG_ENDS.execute().fetchall():
+            if (topic_name, partition_index) in lengths:
+                lengths[(topic_name, partition_index)] = end
+        return lengths
+
+    def append(self, rows: List[Dict[str, Any]]) -> None:
+        """Insert the logs in a single transaction, executemany is turned
+        into multi-row INSERTs by psycopg2."""
+        try:
+            db.session.execute(LogDB.__table__.insert(), rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        if self._replica.tracking():
+            # the position of the master after the commit, the slave has
+            # the logs once it replayed up to it. The logs are committed
+            # already, so a failed lookup only leaves their lsn unknown.
+            try:
+                lsn: Optional[int] = parse_lsn(
+                    db.session.execute(text(f"SELECT {self._current_lsn_function}()::text")).scalar()
+                )
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                app.logger.warning(f"Unable to read the WAL position after an append, reading its logs from the master: {e}")
+                lsn = None
+            ranges: Dict[Tuple[str, int], List[int]] = {}
+            for row in rows:
+                key = (row["topic_name"], row["partition_index"])
+                if key in ranges:
+                    ranges[key][0] = min(ranges[key][0], row["id"])
+                    ranges[key][1] = max(ranges[key][1], row["id"] + row["count"])
+                else:
+                    ranges[key] = [row["id"], row["id"] + row["count"]]
+            self._replica.committed(
+                [(key, start, end) for key, (start, end) in ranges.items()], lsn
+            )
+
+    def find_offset_by_time(
+        self, topic_name: str, partition_index: int, start: int, end: int, timestamp: float
+    ) -> int:
+        """Return the id of the first record in [start, end) written at or
+        after timestamp (at least start), or end if there is none."""
+        first = LOG_FIRST_SINCE.execute(
+            {"topic_name": topic_name, "partition_index": partition_index, "first": start, "since": timestamp}
+        ).scalar()
+        return end if first is None else max(start, min(first, end))
+
+    def find_offset_by_bytes(
+        self, topic_name: str, partition_index: int, start: int, end: int, max_bytes: int
+    ) -> int:
+        """Return the smallest record boundary (at least start) such that
+        the stored messages of the logs in [offset, end) hold at most
+        max_bytes."""
+        over = LOG_FIRST_OVER_BYTES.execute(
+            {"topic_name": topic_name, "partition_index": partition_index, "end": end, "max_bytes": max_bytes}
+        ).scalar()
+        return start if over is None else max(start, over)
+
+    def delete_before(self, topic_name: str, partition_index: int, offset: int) -> int:
+        """Delete the records holding only logs before offset, a range of
+        RETENTION_DELETE_BATCH ids per transaction so that locks and WAL
+        bursts stay bounded."""
+        params = {"topic_name": topic_name, "partition_index": partition_index}
+        first = LOG_MIN_ID.execute(params).scalar()
+        deleted = 0
+        batch = app.config["RETENTION_DELETE_BATCH"]
+        while first is not None and first < offset:
+            last = min(first + batch, offset)
+            try:
+                deleted += sum(
+                    count for count, in LOG_DELETE_RANGE.execute(
+                        dict(params, first=first, last=last, log_start=offset)
+                    ).fetchall()
+                )
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            first = last
+        return deleted
+
+    def attach_async_database(self, async_db: AsyncDatabase) -> None:
+        """Use the connection pools of async_db for asynchronous reads."""
+        self._async_db = async_db
+
+    async def read_async(
+        self, topic_name: str, partition_index: int, start: int, end: int, ids: Optional[List[int]] = None
+    ) -> List[bytes]:
+        """Awaitable version of read, through the asyncpg pools."""
+        if self._async_db is None:
+            return self.read(topic_name, partition_index, start, end, ids)
+        params = {
+            "topic_name": topic_name,
+            "partition_index": partition_index,
+            "first": start,
+            "last": end - 1,
+        }
+        if await self._replica.use_slave_async((topic_name, partition_index), end):
+            messages = self._messages(
+                await LOG_RANGE.fetch_async(self._async_db.read_pool, params), start, end
+            )
+            if len(messages) == end - start:
+                if ids is not None:
+                    ids.extend(range(start, end))
+                return messages
+            self._replica.count_short_read()
+        # the slave has not replayed the logs yet (or misses some of them)
+        return self._messages(await LOG_RANGE.fetch_async(self._async_db.write_pool, params), start, end, ids)
+
+    def read(
+        self, topic_name: str, partition_index: int, start: int, end: int, ids: Optional[List[int]] = None
+    ) -> List[bytes]:
+        """Return the messages of the logs with ids in [start, end) in order,
+        adding their ids to ids if given."""
+        params = {
+            "topic_name": topic_name,
+            "partition_index": partition_index,
+            "first": start,
+            "last": end - 1,
+        }
+        if self._replica.use_slave((topic_name, partition_index), end):
+            messages = self._messages(LOG_RANGE.execute(params, read=True).fetchall(), start, end)
+            if len(messages) == end - start:
+                if ids is not None:
+                    ids.extend(range(start, end))
+                return messages
+            self._replica.count_short_read()
+        # the slave has not replayed the logs yet (or misses some of them)
+        return self._messages(LOG_RANGE.execute(params).fetchall(), start, end, ids)
+
+    @staticmethod
+    def _messages(rows: List[Any], start: int, end: int, ids: Optional[List[int]] = None) -> List[bytes]:
+        """Return the messages of the logs in [start, end) held by the rows
+        of LOG_RANGE, decompressing the batches, and add their ids to ids
+        if given."""
+        messages: List[bytes] = []
+        for row in rows:
+            batch = decode_batch(row["codec"], row["count"], row["message"])
+            first = max(start - row["id"], 0)
+            kept = batch[first:max(end - row["id"], 0)]
+            messages.extend(kept)
+            if ids is not None:
+                ids.extend(range(row["id"] + first, row["id"] + first + len(kept)))
+        return messages
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return the replication lag and read routing statistics."""
+        return {"replica": self._replica.get_stats()}
+
@@ -0,0 +1,196 @@
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from src import app
+from src.datastructures import ThreadSafeSignal
+
+
+def parse_lsn(lsn: str) -> int:
+    """Return the WAL position of a Postgres LSN ("16/B374D848") as an
+    integer."""
+    high, low = lsn.split("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+class ReplicaTracker:
+    """
+    Tracks which logs the slave database has replayed.
+
+    Every append records the WAL position (LSN) of the master after its
+    commit, per partition. A thread polls the replay position of the slave
+    and marks the logs committed before it as replicated. Reads of logs the
+    slave has not replayed yet are routed according to the policy:
+    "master" reads them from the master, "wait" waits up to wait_ms for the
+    slave and reads from the master if it is still behind, and "slave"
+    always reads from the slave (falling back to the master only for short
+    reads).
+    """
+
+    POLICIES = ("master", "wait", "slave")
+
+    def __init__(
+        self,
+        policy: str,
+        wait_ms: float,
+        poll_ms: float,
+        poll_replay_lsn: Callable[[], Optional[int]],
+    ) -> None:
+        if policy not in self.POLICIES:
+            raise Exception(f"Unknown replica read policy '{policy}'.")
+        self._policy = policy
+        self._wait = wait_ms / 1000
+        self._poll_interval = poll_ms / 1000
+        self._poll_replay_lsn = poll_replay_lsn
+        self._lock = threading.Lock()
+        self._replayed = ThreadSafeSignal()
+        self._wake = threading.Event()
+        # commits not replayed yet as (end, lsn), per partition and in order
+        self._pending: Dict[Tuple[str, int], Deque[Tuple[int, Optional[int]]]] = {}
+        # partitions with pending commits whose lsn is not known yet
+        self._unknown: Set[Tuple[str, int]] = set()
+        # end of the logs known to be replayed, per partition with pending
+        # commits
+        self._replicated: Dict[Tuple[str, int], int] = {}
+        self._master_lsn = 0
+        self._replay_lsn = 0
+        self._thread = threading.Thread(target=self._run, name="replica-tracker", daemon=True)
+        self._slave_reads = 0
+        self._master_reads = 0
+        self._waits = 0
+        self._wait_timeouts = 0
+        self._short_reads = 0
+
+    def tracking(self) -> bool:
+        """Return whether the policy needs the replay position."""
+        return self._policy != "slave"
+
+    def start(self) -> None:
+        """Start polling the replay position of the slave."""
+        if self.tracking():
+            self._thread.start()
+
+    def committed(self, ranges: List[Tuple[Tuple[str, int], int, int]], lsn: Optional[int]) -> None:
+        """Record that the logs [start, end) of the given partitions were
+        committed on the master before WAL position lsn. A commit whose lsn
+        is unknown (None) takes the lsn of the next known one, its logs are
+        read from the master until then."""
+        with self._lock:
+            if lsn is not None:
+                self._master_lsn = max(self._master_lsn, lsn)
+                # the commits of unknown lsn precede this one in the WAL
+                for key in self._unknown:
+                    self._pending[key] = deque(
+                        (end, lsn if commit_lsn is None else commit_lsn) for end, commit_lsn in self._pending[key]
+                    )
+                self._unknown.clear()
+            for key, start, end in ranges:
+                if key not in self._pending:
+                    self._pending[key] = deque()
+                    self._replicated[key] = start
+                self._pending[key].append((end, lsn))
+                if lsn is None:
+                    self._unknown.add(key)
+        self._wake.set()
+
+    def _advance(self, replay_lsn: int) -> None:
+        """Mark the commits before replay_lsn as replicated."""
+        with self._lock:
+            self._replay_lsn = max(self._replay_lsn, replay_lsn)
+            for key in list(self._pending.keys()):
+                commits = self._pending[key]
+                while len(commits) > 0 and commits[0][1] is not None and commits[0][1] <= self._replay_lsn:
+                    self._replicated[key] = max(self._replicated[key], commits.popleft()[0])
+                if len(commits) == 0:
+                    del self._pending[key]
+                    del self._replicated[key]
+        self._replayed.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                pending = len(self._pending) > 0
+            # poll quickly while commits wait to be replayed
+            self._wake.wait(self._poll_interval if pending else 1)
+            self._wake.clear()
+            try:
+                replay_lsn = self._poll_replay_lsn()
+            except Exception as e:
+                app.logger.warning(f"Unable to poll the replay position of the slave: {e}")
+                time.sleep(self._poll_interval)
+                continue
+            with self._lock:
+                if replay_lsn is None:
+                    # the slave is not replaying WAL (it is not a standby)
+                    replay_lsn = self._master_lsn
+            self._advance(replay_lsn)
+
+    def is_replicated(self, key: Tuple[str, int], end: int) -> bool:
+        """Return whether the logs of the partition before end are replayed
+        by the slave."""
+        with self._lock:
+            return key not in self._pending or end <= self._replicated[key]
+
+    def use_slave(self, key: Tuple[str, int], end: int) -> bool:
+        """Return whether the logs of the partition before end should be
+        read from the slave, waiting for it according to the policy."""
+        if self._policy == "slave":
+            return self._count(True)
+        if self.is_replicated(key, end):
+            return self._count(True)
+        if self._policy == "wait":
+            return self._count(
+                self._count_wait(self._replayed.wait_for(lambda: self.is_replicated(key, end), self._wait))
+            )
+        return self._count(False)
+
+    async def use_slave_async(self, key: Tuple[str, int], end: int) -> bool:
+        """Awaitable version of use_slave."""
+        if self._policy == "slave":
+            return self._count(True)
+        if self.is_replicated(key, end):
+            return self._count(True)
+        if self._policy == "wait":
+            replicated = await self._replayed.wait_for_async(
+                lambda: self.is_replicated(key, end), self._wait
+            )
+            return self._count(self._count_wait(replicated))
+        return self._count(False)
+
+    def _count(self, slave: bool) -> bool:
+        with self._lock:
+            if slave:
+                self._slave_reads += 1
+            else:
+                self._master_reads += 1
+        return slave
+
+    def _count_wait(self, replicated: bool) -> bool:
+        with self._lock:
+            self._waits += 1
+            if not replicated:
+                self._wait_timeouts += 1
+        return replicated
+
+    def count_short_read(self) -> None:
+        """Count a read from the slave that missed logs and was retried on
+        the master."""
+        with self._lock:
+            self._short_reads += 1
+
+    def get_stats(self) -> Dict[str, float]:
+        """Return the replication lag and read routing statistics."""
+        with self._lock:
+            reads = self._slave_reads + self._master_reads
+            return {
+                "policy": self._policy,
+                "lag_bytes": max(self._master_lsn - self._replay_lsn, 0) if self.tracking() else 0,
+                "lagging_partitions": len(self._pending),
+                "slave_reads": self._slave_reads,
+                "master_reads": self._master_reads,
+                "fallback_rate": self._master_reads / reads if reads > 0 else 0.0,
+                "waits": self._waits,
+                "wait_timeouts": self._wait_timeouts,
+                "short_reads": self._short_reads,
+            }
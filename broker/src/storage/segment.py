@@ -0,0 +1,436 @@
+import bisect
+import mmap
+import os
+import shutil
+import struct
+import threading
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+from src.compression import CODECS, decode_batch
+from src.storage.base import LogStorage
+
+# crc32 of the rest of the record, followed by its fields
+RECORD_CRC = struct.Struct(">I")
+# id, number of logs, timestamp, codec, length of the producer id, length
+# of the message
+RECORD_FIELDS = struct.Struct(">qIdBHI")
+RECORD_HEADER = struct.Struct(">IqIdBHI")
+# id of a log, position of its record in the segment
+INDEX_ENTRY = struct.Struct(">qQ")
+
+# (id, count, codec, timestamp, producer_id, message), a record of a
+# compressed batch holds the logs [id, id + count)
+Record = Tuple[int, int, str, float, str, bytes]
+# size, next offset, number of index entries and bytes since the last index
+# entry of a segment, to roll it back to
+SegmentMark = Tuple[int, int, int, int]
+
+
+class Segment:
+    """
+    An append-only segment file of a partition together with its sparse
+    offset index. The segment is named after the id of its first log, its
+    index holds the position of one record every index_interval bytes.
+    """
+
+    def __init__(self, directory: str, base_offset: int, index_interval: int, fsync: bool) -> None:
+        self.base_offset = base_offset
+        path = os.path.join(directory, "%020d" % base_offset)
+        self._index_interval = index_interval
+        self._fsync = fsync
+        self._log = open(path + ".log", "a+b")
+        self._index = open(path + ".index", "a+b")
+        self._index_ids: List[int] = []
+        self._index_positions: List[int] = []
+        self._bytes_since_index = 0
+        self._mmap: Optional[mmap.mmap] = None
+        self._mapped_size = 0
+        self.size = 0
+        self.next_offset = base_offset
+        self._recover()
+
+    def _recover(self) -> None:
+        """Load the index and scan the records after its last entry to find
+        the end of the segment. A torn record at the end (left by a crash
+        in the middle of a write) is truncated away."""
+        self._index.seek(0)
+        index_data = self._index.read()
+        log_size = os.fstat(self._log.fileno()).st_size
+        for pos in range(0, len(index_data) - INDEX_ENTRY.size + 1, INDEX_ENTRY.size):
+            log_id, position = INDEX_ENTRY.unpack_from(index_data, pos)
+            if position >= log_size:
+                break
+            self._index_ids.append(log_id)
+            self._index_positions.append(position)
+        indexed = len(self._index_ids)
+
+        pos = self._index_positions[-1] if indexed > 0 else 0
+        if log_size > 0:
+            data = mmap.mmap(self._log.fileno(), log_size, access=mmap.ACCESS_READ)
+            while pos + RECORD_HEADER.size <= log_size:
+                crc, log_id, count, _, _, producer_length, message_length = RECORD_HEADER.unpack_from(data, pos)
+                end = pos + RECORD_HEADER.size + producer_length + message_length
+                if end > log_size or zlib.crc32(data[pos + RECORD_CRC.size:end]) != crc:
+                    break
+                if indexed > 0 and pos == self._index_positions[-1]:
+                    # the record the scan started from is indexed already
+                    self._bytes_since_index += end - pos
+                else:
+                    self._maybe_index(log_id, pos, end - pos)
+                self.next_offset = log_id + count
+                pos = end
+            data.close()
+        self.size = pos
+
+        if self.size < log_size:
+            self._log.truncate(self.size)
+        if len(self._index_ids) != indexed or len(index_data) != indexed * INDEX_ENTRY.size:
+            # rewrite the index if entries were dropped or rebuilt
+            self._index.truncate(0)
+            self._index.write(
+                b"".join(
+                    INDEX_ENTRY.pack(log_id, position)
+                    for log_id, position in zip(self._index_ids, self._index_positions)
+                )
+            )
+            self._index.flush()
+
+    def _maybe_index(self, log_id: int, position: int, record_size: int) -> bool:
+        """Add an index entry for the record if enough bytes were written
+        since the last entry. Return whether an entry was added."""
+        added = False
+        if len(self._index_ids) == 0 or self._bytes_since_index >= self._index_interval:
+            self._index_ids.append(log_id)
+            self._index_positions.append(position)
+            self._bytes_since_index = 0
+            added = True
+        self._bytes_since_index += record_size
+        return added
+
+    def mark(self) -> SegmentMark:
+        """Return the current end of the segment, to roll back to."""
+        return self.size, self.next_offset, len(self._index_ids), self._bytes_since_index
+
+    def rollback(self, mark: SegmentMark) -> None:
+        """Truncate the segment back to a mark, dropping the records
+        appended after it."""
+        size, next_offset, indexed, bytes_since_index = mark
+        self._log.truncate(size)
+        self._index.truncate(indexed * INDEX_ENTRY.size)
+        if self._fsync:
+            os.fsync(self._log.fileno())
+        del self._index_ids[indexed:]
+        del self._index_positions[indexed:]
+        self._bytes_since_index = bytes_since_index
+        if self._mapped_size > size:
+            # do not leave the mapping past the end of the file
+            self._mmap.close()
+            self._mmap = None
+            self._mapped_size = 0
+        self.size = size
+        self.next_offset = next_offset
+
+    def append(self, records: List[Record]) -> None:
+        """Append the records to the segment, on failure the segment is left
+        as it was."""
+        old_mark = self.mark()
+        _, old_next_offset, old_indexed, _ = old_mark
+        chunks = []
+        position = self.size
+        try:
+            for log_id, count, codec, timestamp, producer_id, message in records:
+                producer_bytes = producer_id.encode()
+                body = RECORD_FIELDS.pack(
+                    log_id, count, timestamp, CODECS.index(codec), len(producer_bytes), len(message)
+                ) + producer_bytes + message
+                record = RECORD_CRC.pack(zlib.crc32(body)) + body
+                self._maybe_index(log_id, position, len(record))
+                chunks.append(record)
+                position += len(record)
+            self._log.write(b"".join(chunks))
+            self._log.flush()
+            self._index.write(
+                b"".join(
+                    INDEX_ENTRY.pack(log_id, pos)
+                    for log_id, pos in zip(self._index_ids[old_indexed:], self._index_positions[old_indexed:])
+                )
+            )
+            self._index.flush()
+            if self._fsync:
+                os.fsync(self._log.fileno())
+        except Exception:
+            self.rollback(old_mark)
+            raise
+        self.size = position
+        self.next_offset = records[-1][0] + records[-1][1] if len(records) > 0 else old_next_offset
+
+    def read(self, start: int, end: int, messages: List[bytes], ids: Optional[List[int]] = None) -> None:
+        """Append the messages of the logs with ids in [start, end) held by
+        this segment to messages, decompressing the batches, and their ids
+        to ids if given."""
+        if self.size == 0:
+            return
+        if self.size > self._mapped_size:
+            # the segment grew since it was mapped
+            if self._mmap is not None:
+                self._mmap.close()
+            self._mmap = mmap.mmap(self._log.fileno(), self.size, access=mmap.ACCESS_READ)
+            self._mapped_size = self.size
+        data = self._mmap
+        i = bisect.bisect_right(self._index_ids, start) - 1
+        pos = self._index_positions[i] if i >= 0 else 0
+        while pos < self.size:
+            _, log_id, count, _, codec, producer_length, message_length = RECORD_HEADER.unpack_from(data, pos)
+            if log_id >= end:
+                break
+            message_start = pos + RECORD_HEADER.size + producer_length
+            pos = message_start + message_length
+            if log_id + count > start:
+                batch = decode_batch(CODECS[codec], count, data[message_start:pos])
+                first = max(start - log_id, 0)
+                kept = batch[first:end - log_id]
+                messages.extend(kept)
+                if ids is not None:
+                    ids.extend(range(log_id + first, log_id + first + len(kept)))
+
+    def close(self) -> None:
+        """Close the files of the segment."""
+        if self._mmap is not None:
+            self._mmap.close()
+        self._log.close()
+        self._index.close()
+
+    def last_modified(self) -> float:
+        """Return the time of the last write to the segment."""
+        return os.fstat(self._log.fileno()).st_mtime
+
+    def delete(self) -> None:
+        """Close the segment and remove its files."""
+        self.close()
+        os.remove(self._log.name)
+        os.remove(self._index.name)
+
+
+class PartitionLog:
+    """
+    The log of a partition, stored as a directory of segments. The active
+    (last) segment is rolled once it grows over max_segment_bytes.
+    """
+
+    def __init__(self, directory: str, max_segment_bytes: int, index_interval: int, fsync: bool) -> None:
+        self._directory = directory
+        self._max_segment_bytes = max_segment_bytes
+        self._index_interval = index_interval
+        self._fsync = fsync
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        base_offsets = sorted(
+            int(file_name[:-len(".log")])
+            for file_name in os.listdir(directory)
+            if file_name.endswith(".log")
+        )
+        self._segments = [self._open_segment(base_offset) for base_offset in base_offsets]
+        self._base_offsets = base_offsets
+
+    def _open_segment(self, base_offset: int) -> Segment:
+        return Segment(self._directory, base_offset, self._index_interval, self._fsync)
+
+    def get_length(self) -> int:
+        """Return one past the id of the last log stored in the partition."""
+        with self._lock:
+            if len(self._segments) == 0:
+                return 0
+            return self._segments[-1].next_offset
+
+    def append(self, records: List[Record]) -> Optional[Tuple[Segment, Optional[SegmentMark]]]:
+        """Append the records (in id order) to the active segment. Return
+        the segment written to and its mark before the append (None if the
+        segment was opened for these records), to undo the append with
+        rollback."""
+        if len(records) == 0:
+            return None
+        with self._lock:
+            if len(self._segments) == 0 or self._segments[-1].size >= self._max_segment_bytes:
+                segment = self._open_segment(records[0][0])
+                self._segments.append(segment)
+                self._base_offsets.append(records[0][0])
+                try:
+                    segment.append(records)
+                except Exception:
+                    self._drop_segment(segment)
+                    raise
+                return segment, None
+            segment = self._segments[-1]
+            mark = segment.mark()
+            segment.append(records)
+            return segment, mark
+
+    def _drop_segment(self, segment: Segment) -> None:
+        i = self._segments.index(segment)
+        self._segments.pop(i)
+        self._base_offsets.pop(i)
+        segment.delete()
+
+    def rollback(self, appended: Optional[Tuple[Segment, Optional[SegmentMark]]]) -> None:
+        """Undo an append, given what append returned."""
+        if appended is None:
+            return
+        segment, mark = appended
+        with self._lock:
+            if mark is None:
+                self._drop_segment(segment)
+            else:
+                segment.rollback(mark)
+
+    def read(self, start: int, end: int, ids: Optional[List[int]] = None) -> List[bytes]:
+        """Return the messages of the logs with ids in [start, end) in order,
+        adding their ids to ids if given."""
+        messages: List[bytes] = []
+        with self._lock:
+            i = max(bisect.bisect_right(self._base_offsets, start) - 1, 0)
+            while i < len(self._segments) and self._base_offsets[i] < end:
+                self._segments[i].read(start, end, messages, ids)
+                i += 1
+        return messages
+
+    def find_offset_by_time(self, start: int, end: int, timestamp: float) -> int:
+        """Return the base offset of the first segment written to at or after
+        timestamp (or end if there is none), at least start."""
+        with self._lock:
+            for base_offset, segment in zip(self._base_offsets, self._segments):
+                if segment.last_modified() >= timestamp:
+                    return max(start, min(base_offset, end))
+        return end
+
+    def find_offset_by_bytes(self, start: int, end: int, max_bytes: int) -> int:
+        """Return the base offset of the oldest segment to keep so that the
+        segments from it on hold at most max_bytes, at least start. The
+        active segment is always kept."""
+        with self._lock:
+            total = 0
+            for i in range(len(self._segments) - 1, -1, -1):
+                total += self._segments[i].size
+                if total > max_bytes:
+                    if i == len(self._segments) - 1:
+                        return max(start, min(self._base_offsets[i], end))
+                    return max(start, min(self._base_offsets[i + 1], end))
+        return start
+
+    def delete_before(self, offset: int) -> int:
+        """Delete the segments holding only logs before offset, except the
+        active segment. Return the number of logs deleted."""
+        deleted = 0
+        with self._lock:
+            while len(self._segments) > 1 and self._base_offsets[1] <= offset:
+                deleted += self._base_offsets[1] - self._base_offsets[0]
+                self._segments.pop(0).delete()
+                self._base_offsets.pop(0)
+        return deleted
+
+    def close(self) -> None:
+        """Close all segments of the partition."""
+        with self._lock:
+            for segment in self._segments:
+                segment.close()
+
+
+class SegmentLogStorage(LogStorage):
+    """
+    Stores the log of every partition as append-only segment files with a
+    sparse offset index, read through mmap. The state of every partition is
+    rebuilt from its files when it is first used after a restart.
+    """
+
+    def __init__(self, directory: str, max_segment_bytes: int, index_interval: int, fsync: bool) -> None:
+        self._directory = directory
+        self._max_segment_bytes = max_segment_bytes
+        self._index_interval = index_interval
+        self._fsync = fsync
+        self._lock = threading.Lock()
+        self._partitions: Dict[Tuple[str, int], PartitionLog] = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, topic_name: str, partition_index: int) -> str:
+        return os.path.join(self._directory, f"{quote(topic_name, safe='')}-{partition_index}")
+
+    def _partition(self, topic_name: str, partition_index: int) -> PartitionLog:
+        """Return the log of the partition, loading it from disk if needed."""
+        with self._lock:
+            key = (topic_name, partition_index)
+            if key not in self._partitions:
+                self._partitions[key] = PartitionLog(
+                    self._path(topic_name, partition_index),
+                    self._max_segment_bytes,
+                    self._index_interval,
+                    self._fsync,
+                )
+            return self._partitions[key]
+
+    def add_partition(self, topic_name: str, partition_index: int) -> None:
+        """Create the directory of a new partition. Files left over from a
+        partition of the same name that no longer exists are removed."""
+        with self._lock:
+            key = (topic_name, partition_index)
+            if key in self._partitions:
+                self._partitions.pop(key).close()
+            shutil.rmtree(self._path(topic_name, partition_index), ignore_errors=True)
+        self._partition(topic_name, partition_index)
+
+    def get_length(self, topic_name: str, partition_index: int) -> int:
+        """Return one past the id of the last log stored in the partition."""
+        return self._partition(topic_name, partition_index).get_length()
+
+    def append(self, rows: List[Dict[str, Any]]) -> None:
+        """Append the logs to the segments of their partitions. The logs are
+        written one partition at a time, if a partition fails the partitions
+        written before it are rolled back, so that no log of the rows is
+        stored."""
+        records: Dict[Tuple[str, int], List[Record]] = {}
+        for row in rows:
+            records.setdefault((row["topic_name"], row["partition_index"]), []).append(
+                (row["id"], row["count"], row["codec"], row["timestamp"], row["producer_id"], row["message"])
+            )
+        appended = []
+        try:
+            for (topic_name, partition_index), partition_records in records.items():
+                partition = self._partition(topic_name, partition_index)
+                appended.append((partition, partition.append(partition_records)))
+        except Exception:
+            for partition, partition_appended in reversed(appended):
+                partition.rollback(partition_appended)
+            raise
+
+    def read(
+        self, topic_name: str, partition_index: int, start: int, end: int, ids: Optional[List[int]] = None
+    ) -> List[bytes]:
+        """Return the messages of the logs with ids in [start, end) in order,
+        adding their ids to ids if given."""
+        return self._partition(topic_name, partition_index).read(start, end, ids)
+
+    def find_offset_by_time(
+        self, topic_name: str, partition_index: int, start: int, end: int, timestamp: float
+    ) -> int:
+        """Return the base offset of the first segment of the partition
+        written to at or after timestamp, or end if there is none. Retention
+        is applied to whole segments."""
+        return self._partition(topic_name, partition_index).find_offset_by_time(start, end, timestamp)
+
+    def find_offset_by_bytes(
+        self, topic_name: str, partition_index: int, start: int, end: int, max_bytes: int
+    ) -> int:
+        """Return the base offset of the oldest segment of the partition to
+        keep so that the partition holds at most max_bytes of segments."""
+        return self._partition(topic_name, partition_index).find_offset_by_bytes(start, end, max_bytes)
+
+    def delete_before(self, topic_name: str, partition_index: int, offset: int) -> int:
+        """Delete the whole segments of the partition before offset."""
+        return self._partition(topic_name, partition_index).delete_before(offset)
+
+    def close(self) -> None:
+        """Close the files of all partitions."""
+        with self._lock:
+            for partition in self._partitions.values():
+                partition.close()
+            self._partitions = {}
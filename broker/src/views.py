@@ -1,8 +1,25 @@
-from flask import make_response, request, jsonify
+import json
+
+from flask import Response, make_response, request, jsonify, stream_with_context
 from flask_expects_json import expects_json
 from jsonschema import ValidationError
 
-from src import app, master_queue, expects_json
+from src import app, db, master_queue, expects_json
+from src.compression import check_batch, from_bytes, to_bytes
+from src.json_validator import is_trusted_hop
+from src.schemas import (
+    RETENTION_KEYS,
+    TOPIC_SCHEMA,
+    CONSUMER_REGISTER_SCHEMA,
+    PRODUCER_REGISTER_SCHEMA,
+    MAP_VERSION_SCHEMA,
+    PRODUCE_SCHEMA,
+    PRODUCE_BATCH_SCHEMA,
+    CONSUME_SCHEMA,
+    STREAM_SCHEMA,
+    STREAM_CREDITS_SCHEMA,
+    SIZE_SCHEMA,
+)
 
 
 @app.errorhandler(400)
@@ -25,13 +42,7 @@ def index():
 
 
 @app.route(rule="/topics", methods=["POST"])
-@expects_json(
-    {
-        "type": "object",
-        "properties": {"name": {"type": "string"}, "partition_index": {"type": "number"}},
-        "required": ["name","partition_index"],
-    }
-)
+@expects_json(TOPIC_SCHEMA)
 def topics():
     """Return all the topics or add a topic."""
 
@@ -39,8 +50,9 @@ def topics():
     if request.method == "POST":
         topic_name = request.get_json()["name"]
         partition_index = request.get_json()["partition_index"]
+        retention = {key: request.get_json()[key] for key in RETENTION_KEYS if key in request.get_json()}
     try:
-        master_queue.add_topic(topic_name, partition_index)
+        master_queue.add_topic(topic_name, partition_index, retention)
         return make_response(
             jsonify(
                 {
@@ -54,13 +66,7 @@ def topics():
         raise e
 
 @app.route(rule="/consumer/register", methods=["POST"])
-@expects_json(
-    {
-        "type": "object",
-        "properties": {"topic": {"type": "string"}, "consumer_id":{"type":"string"},"partition_index":{"type":"number"}},
-        "required": ["topic","consumer_id","partition_index"],
-    }
-)
+@expects_json(CONSUMER_REGISTER_SCHEMA)
 def register_consumer():
     """Register a consumer for a topic."""
     topic_name = request.get_json()["topic"]
@@ -75,25 +81,71 @@ def register_consumer():
     except Exception as e:
         raise
 
+@app.route(rule="/producer/register", methods=["POST"])
+@expects_json(PRODUCER_REGISTER_SCHEMA)
+def register_producer():
+    """Register a producer for a topic, so that it may produce to the
+    partition directly."""
+    try:
+        master_queue.add_producer(
+            request.get_json()["topic"], request.get_json()["partition_index"], request.get_json()["producer_id"]
+        )
+        return make_response(
+            jsonify({"status": "success"}),
+            200,
+        )
+    except Exception as e:
+        raise
+
+
+@app.route(rule="/metadata/version", methods=["POST"])
+@expects_json(MAP_VERSION_SCHEMA)
+def map_version():
+    """Record the version of the partition map of the primary manager."""
+    master_queue.set_map_version(request.get_json()["map_version"])
+    return make_response(
+        jsonify({"status": "success"}),
+        200,
+    )
+
+
+def direct_produce_failure(topic_name, partition_index, producer_id):
+    """Return the failure response of a produce sent straight by a client
+    that the broker rejects, None if it is not rejected. Produces forwarded
+    by the primary manager carry the trusted hop token and were checked by
+    it, every other produce must carry the version of its partition map."""
+    if is_trusted_hop(request.headers, app.config["TRUSTED_HOP_TOKEN"]):
+        return None
+    rejection = master_queue.check_direct_produce(
+        topic_name, partition_index, producer_id, request.get_json().get("map_version")
+    )
+    if rejection is None:
+        return None
+    status_code, message = rejection
+    return make_response(
+        jsonify({"status": "failure", "message": message, "map_version": master_queue.get_map_version()}),
+        status_code,
+    )
+
+
 @app.route(rule="/producer/produce", methods=["POST"])
-@expects_json(
-    {
-        "type": "object",
-        "properties": {
-            "topic": {"type": "string"},
-            "producer_id": {"type": "string"},
-            "message": {"type": "string"},
-            "partition_index":{"type":"number"}
-        },
-        "required": ["topic", "producer_id", "message","partition_index"],
-    }
-)
+@expects_json(PRODUCE_SCHEMA)
 def produce():
     """Add a log to a topic."""
     topic_name = request.get_json()["topic"]
     producer_id = request.get_json()["producer_id"]
-    message = request.get_json()["message"]
+    encoding = request.get_json().get("encoding", "utf-8")
     partition_index = request.get_json()["partition_index"]
+    rejected = direct_produce_failure(topic_name, partition_index, producer_id)
+    if rejected is not None:
+        return rejected
+    try:
+        message = to_bytes(request.get_json()["message"], encoding)
+    except Exception:
+        return make_response(
+            jsonify({"status": "failure", "message": f"Message is not valid {encoding}."}),
+            400,
+        )
     try:
         master_queue.add_log(topic_name, partition_index,producer_id, message)
         return make_response(
@@ -104,29 +156,106 @@ def produce():
         raise
 
 
+@app.route(rule="/producer/produce_batch", methods=["POST"])
+@expects_json(PRODUCE_BATCH_SCHEMA)
+def produce_batch():
+    """Add a batch of logs to a partition of a topic. The batch is either a
+    list of messages or a payload of messages compressed as a unit, which
+    is stored without being decompressed."""
+    topic_name = request.get_json()["topic"]
+    producer_id = request.get_json()["producer_id"]
+    encoding = request.get_json().get("encoding", "utf-8")
+    partition_index = request.get_json()["partition_index"]
+    rejected = direct_produce_failure(topic_name, partition_index, producer_id)
+    if rejected is not None:
+        return rejected
+    try:
+        if "messages" in request.get_json():
+            messages = [to_bytes(message, encoding) for message in request.get_json()["messages"]]
+        else:
+            payload = to_bytes(request.get_json()["payload"], "base64")
+    except Exception:
+        return make_response(
+            jsonify({"status": "failure", "message": "Batch is not validly encoded."}),
+            400,
+        )
+    if "messages" not in request.get_json():
+        try:
+            check_batch(request.get_json()["codec"], request.get_json()["count"], payload)
+        except Exception as e:
+            return make_response(
+                jsonify({"status": "failure", "message": str(e)}),
+                400,
+            )
+    try:
+        if "messages" in request.get_json():
+            offsets = master_queue.add_logs(topic_name, partition_index, producer_id, messages)
+        else:
+            offsets = master_queue.add_compressed_logs(
+                topic_name,
+                partition_index,
+                producer_id,
+                request.get_json()["codec"],
+                payload,
+                request.get_json()["count"],
+            )
+        return make_response(
+            jsonify({"status": "success", "offsets": offsets}),
+            200,
+        )
+    except Exception as e:
+        raise
+
+
 @app.route(rule="/consumer/consume", methods=["GET"])
-@expects_json(
-    {
-        "type": "object",
-        "properties": {
-            "topic": {"type": "string"},
-            "consumer_id": {"type": "string"},
-            "partition_index": {"type": "number"}
-        },
-        "required": ["topic", "consumer_id", "partition_index"],
-    }
-)
+@expects_json(CONSUME_SCHEMA)
 def consume():
-    """Consume a log from a topic."""
+    """Consume a log (or a batch of logs) from a topic, optionally waiting
+    for new logs."""
     topic_name = request.get_json()["topic"]
     consumer_id = request.get_json()["consumer_id"]
     partition_index = request.get_json()["partition_index"]
+    max_messages = request.get_json().get("max_messages")
+    max_bytes = request.get_json().get("max_bytes")
+    encoding = request.get_json().get("encoding", "utf-8")
+    # long poll: wait for new logs if none are available
+    wait_ms = min(request.get_json().get("wait_ms", 0), app.config["CONSUME_MAX_WAIT_MS"])
     try:
-        log = master_queue.get_log(topic_name, partition_index, consumer_id)
-        if log is not None:
-            return make_response(
-                jsonify({"status": "success", "message": log, "partition_read": partition_index}), 200
+        if max_messages is None and max_bytes is None:
+            log = master_queue.get_log(topic_name, partition_index, consumer_id, wait_ms)
+            if log is not None:
+                return make_response(
+                    jsonify(
+                        {
+                            "status": "success",
+                            "message": from_bytes(log, encoding),
+                            "partition_read": partition_index,
+                        }
+                    ),
+                    200,
+                )
+        else:
+            if max_messages is None:
+                max_messages = app.config["CONSUME_MAX_MESSAGES"]
+            logs = master_queue.get_logs(
+                topic_name,
+                partition_index,
+                consumer_id,
+                min(max_messages, app.config["CONSUME_MAX_MESSAGES"]),
+                max_bytes,
+                wait_ms,
             )
+            if len(logs) > 0:
+                return make_response(
+                    jsonify(
+                        {
+                            "status": "success",
+                            "messages": [from_bytes(log, encoding) for log in logs],
+                            "partition_read": partition_index,
+                        }
+                    ),
+                    200,
+                )
         return make_response(
             jsonify(
                 {"status": "failure", "message": "No logs available to pull."}
@@ -140,18 +269,82 @@ def consume():
         )
 
 
+@app.route(rule="/consumer/stream", methods=["GET"])
+@expects_json(STREAM_SCHEMA)
+def stream():
+    """Push the logs of a partition to a consumer as server-sent events.
+
+    The first event carries the id of the stream, used to grant more
+    credits. Every following event carries a batch of logs and the offset
+    of the first one, the consumer offset is advanced once per batch.
+    """
+    topic_name = request.get_json()["topic"]
+    consumer_id = request.get_json()["consumer_id"]
+    partition_index = request.get_json()["partition_index"]
+    credits = request.get_json().get("credits", app.config["CONSUME_STREAM_CREDITS"])
+    batch_size = min(
+        request.get_json().get("batch_size", app.config["CONSUME_MAX_MESSAGES"]),
+        app.config["CONSUME_MAX_MESSAGES"],
+    )
+    encoding = request.get_json().get("encoding", "utf-8")
+    heartbeat_ms = app.config["CONSUME_STREAM_HEARTBEAT_MS"]
+    try:
+        consumer_stream = master_queue.open_stream(topic_name, partition_index, consumer_id, credits)
+    except Exception as e:
+        return make_response(
+            jsonify({"status": "failure", "message": str(e)}),
+            400,
+        )
+
+    def events():
+        try:
+            yield f"event: open\ndata: {json.dumps({'stream_id': consumer_stream.stream_id})}\n\n"
+            while True:
+                count = consumer_stream.take_credits(batch_size, heartbeat_ms / 1000)
+                offset, logs = (0, [])
+                if count > 0:
+                    offset, logs = master_queue.consume_logs(
+                        topic_name, partition_index, consumer_id, count, wait_ms=heartbeat_ms
+                    )
+                    consumer_stream.add_credits(count - len(logs))
+                    # do not hold a database connection while the stream idles
+                    db.session.close()
+                if len(logs) == 0:
+                    # lets both sides notice a broken connection
+                    yield ": heartbeat\n\n"
+                    continue
+                data = json.dumps(
+                    {"offset": offset, "messages": [from_bytes(log, encoding) for log in logs]}
+                )
+                yield f"id: {offset + len(logs)}\ndata: {data}\n\n"
+        finally:
+            master_queue.close_stream(consumer_stream.stream_id)
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route(rule="/consumer/stream/credits", methods=["POST"])
+@expects_json(STREAM_CREDITS_SCHEMA)
+def stream_credits():
+    """Grant credits to an open stream."""
+    stream_id = request.get_json()["stream_id"]
+    credits = request.get_json()["credits"]
+    try:
+        master_queue.add_stream_credits(stream_id, credits)
+        return make_response(jsonify({"status": "success"}), 200)
+    except Exception as e:
+        return make_response(
+            jsonify({"status": "failure", "message": str(e)}),
+            400,
+        )
+
+
 @app.route(rule="/size", methods=["GET"])
-@expects_json(
-    {
-        "type": "object",
-        "properties": {
-            "topic": {"type": "string"},
-            "consumer_id": {"type": "string"},
-            "partition_index": {"type": "number"}
-        },
-        "required": ["topic", "consumer_id"],
-    }
-)
+@expects_json(SIZE_SCHEMA)
 def size():
     """Return the number of log messages in the requested topic for this consumer."""
     topic_name = request.get_json()["topic"]
@@ -165,4 +358,11 @@ def size():
         sizes = master_queue.get_size(consumer_id, topic_name, partition_index)
         return make_response(jsonify({"status": "success", "sizes": sizes}), 200)
     except Exception as e:
-        raise
\ No newline at end of file
+        raise
+
+@app.route(rule="/metrics", methods=["GET"])
+def metrics():
+    """Return the internal metrics of the broker."""
+    return make_response(
+        jsonify({"status": "success", "metrics": master_queue.get_metrics()}), 200
+    )
@@ -0,0 +1,111 @@
+"""
+Wire formats of the request and response bodies.
+
+Bodies are either JSON or msgpack. A request picks its format with its
+Content-Type, a response is sent in msgpack only when the Accept header of
+the request prefers it over JSON. JSON is encoded with orjson when it is
+installed. Both libraries are optional: without msgpack, msgpack bodies
+are rejected, and without orjson the standard library is used.
+"""
+
+import json
+from typing import Any
+
+from flask import Request, request
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.exceptions import BadRequest, UnsupportedMediaType
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_MIMETYPE = "application/json"
+MSGPACK_MIMETYPE = "application/msgpack"
+
+
+def dumps(obj: Any, mimetype: str = JSON_MIMETYPE, default=None) -> bytes:
+    """Encode obj in the format of mimetype."""
+    if mimetype == MSGPACK_MIMETYPE:
+        if msgpack is None:
+            raise UnsupportedMediaType("msgpack is not supported.")
+        return msgpack.packb(obj, default=default)
+    if orjson is not None:
+        return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=default).encode()
+
+
+def loads(data: bytes, mimetype: str = JSON_MIMETYPE) -> Any:
+    """Decode data in the format of mimetype."""
+    if mimetype == MSGPACK_MIMETYPE:
+        if msgpack is None:
+            raise UnsupportedMediaType("msgpack is not supported.")
+        return msgpack.unpackb(data, raw=False)
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def preferred_mimetype(accept: MIMEAccept) -> str:
+    """Return the format of a response to a request with the given Accept
+    header."""
+    if msgpack is not None and accept.quality(MSGPACK_MIMETYPE) > accept.quality(JSON_MIMETYPE):
+        return MSGPACK_MIMETYPE
+    return JSON_MIMETYPE
+
+
+def response_mimetype() -> str:
+    """Return the format of the response to the current request."""
+    return preferred_mimetype(request.accept_mimetypes)
+
+
+class WireJSONProvider(DefaultJSONProvider):
+    """
+    JSON provider of the app: jsonify responses are negotiated between
+    JSON and msgpack, and JSON is handled by orjson when available.
+    """
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if orjson is None or len(kwargs) > 0:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj, default=self.default).decode()
+
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        if orjson is None or len(kwargs) > 0:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        mimetype = response_mimetype()
+        return self._app.response_class(
+            dumps(obj, mimetype, default=self.default), mimetype=mimetype
+        )
+
+
+class WireRequest(Request):
+    """
+    Request whose get_json also decodes msgpack bodies, so that views and
+    expects_json handle both formats alike.
+    """
+
+    def get_json(self, force: bool = False, silent: bool = False, cache: bool = True) -> Any:
+        if self.mimetype != MSGPACK_MIMETYPE:
+            return super().get_json(force=force, silent=silent, cache=cache)
+        if "_msgpack_body" in self.__dict__:
+            return self.__dict__["_msgpack_body"]
+        try:
+            data = loads(self.get_data(cache=cache), MSGPACK_MIMETYPE)
+        except Exception:
+            if silent:
+                return None
+            raise BadRequest("Failed to decode msgpack body.")
+        if cache:
+            self.__dict__["_msgpack_body"] = data
+        return data
@@ -0,0 +1,36 @@
+import base64
+import struct
+import zlib
+from typing import List, Union
+
+# length of a message in a framed batch
+MESSAGE_LENGTH = struct.Struct(">I")
+
+
+def to_bytes(message: Union[str, bytes]) -> bytes:
+    """
+    Return the body of a message, text is encoded in utf-8.
+    """
+    return message if isinstance(message, bytes) else message.encode()
+
+
+def compress_batch(messages: List[Union[str, bytes]], codec: str) -> str:
+    """
+    Frame the messages (each one prefixed by its length), compress the
+    frame with the codec ("zlib", "zstd" or "lz4") and return it in base64,
+    as sent to the broker.
+    """
+    frame = b"".join(
+        MESSAGE_LENGTH.pack(len(body)) + body for body in map(to_bytes, messages)
+    )
+    if codec == "zlib":
+        payload = zlib.compress(frame)
+    elif codec == "zstd":
+        import zstandard
+        payload = zstandard.ZstdCompressor().compress(frame)
+    elif codec == "lz4":
+        import lz4.frame
+        payload = lz4.frame.compress(frame)
+    else:
+        raise ValueError(f"Unknown codec '{codec}'.")
+    return base64.b64encode(payload).decode()
@@ -1,3 +1,4 @@
+import base64
 import requests
 import aiohttp
 from urllib.parse import urljoin
@@ -5,6 +6,7 @@ from typing import Dict, Tuple, List, Any
 
 from .routes import Routes
 from .async_requests import AsyncRequests
+from .wire import check_wire_format, read_body, request_kwargs
 
 
 class Consumer:
@@ -14,13 +16,19 @@ class Consumer:
     address: str - the address of the broker
     port: int - the port of the broker
     protocol: str - the protocol to use (currently only http is supported)
+    wire_format: str - the format of the request and response bodies,
+        "json" or "msgpack" (needs the msgpack package)
     """
 
     def __init__(
-        self, address: str, port: int, protocol: str = "http"
+        self, address: str, port: int, protocol: str = "http", wire_format: str = "json"
     ) -> None:
+        check_wire_format(wire_format)
         self.broker = protocol + "://" + address + ":" + str(port)
+        self.wire_format = wire_format
         self.topics: Dict[str, str] = {}
+        # the consumer group joined for a topic
+        self.groups: Dict[str, str] = {}
         self.async_requestor = AsyncRequests()
 
     async def _register(
@@ -33,9 +41,9 @@ class Consumer:
             try:
                 url = urljoin(self.broker, Routes.register_consumer)
                 json_data: Dict[str, str] = {"topic": topic_name}
-                async with session.post(url, json=json_data) as response:
+                async with session.post(url, **request_kwargs(json_data, self.wire_format)) as response:
                     response_status = response.status
-                    response_json = await response.json()
+                    response_json = await read_body(response)
                     if response_status == 200:
                         consumer_id = response_json["consumer_id"]
                         self.topics[topic_name] = consumer_id
@@ -48,6 +56,79 @@ class Consumer:
                 return False, str(e)
         return False, "Topic already registered."
 
+    async def _group_request(
+        self, session: aiohttp.client.ClientSession, route: str, json_data: Dict[str, str]
+    ) -> Tuple[bool, Any]:
+        """
+        Send a request about a consumer group, return its response on success.
+        """
+        try:
+            url = urljoin(self.broker, route)
+            async with session.post(url, **request_kwargs(json_data, self.wire_format)) as response:
+                response_status = response.status
+                response_json = await read_body(response)
+                if response_status == 200:
+                    return True, response_json
+                elif response_status == 400:
+                    return False, response_json["message"]
+                else:
+                    return False, await response.text()
+        except Exception as e:
+            return False, str(e)
+
+    async def _join_group(
+        self, session: aiohttp.client.ClientSession, topic_name: str, group_name: str
+    ) -> Tuple[bool, Any]:
+        """
+        Join a consumer group of a topic if not already registered.
+        """
+        if topic_name in self.topics:
+            return False, "Topic already registered."
+        success, response_json = await self._group_request(
+            session, Routes.join_group, {"topic": topic_name, "group": group_name}
+        )
+        if not success:
+            return False, response_json
+        self.topics[topic_name] = response_json["consumer_id"]
+        self.groups[topic_name] = group_name
+        return True, response_json["partitions"]
+
+    async def _group_heartbeat(
+        self, session: aiohttp.client.ClientSession, topic_name: str
+    ) -> Tuple[bool, Any]:
+        """
+        Keep the membership of the consumer group of a topic alive.
+        """
+        if topic_name not in self.groups:
+            return False, "Not a member of a consumer group of the topic."
+        success, response_json = await self._group_request(
+            session,
+            Routes.group_heartbeat,
+            {"topic": topic_name, "group": self.groups[topic_name], "consumer_id": self.topics[topic_name]},
+        )
+        if not success:
+            return False, response_json
+        return True, response_json["partitions"]
+
+    async def _leave_group(
+        self, session: aiohttp.client.ClientSession, topic_name: str
+    ) -> Tuple[bool, Any]:
+        """
+        Leave the consumer group of a topic.
+        """
+        if topic_name not in self.groups:
+            return False, "Not a member of a consumer group of the topic."
+        success, response_json = await self._group_request(
+            session,
+            Routes.leave_group,
+            {"topic": topic_name, "group": self.groups[topic_name], "consumer_id": self.topics[topic_name]},
+        )
+        if not success:
+            return False, response_json
+        self.topics.pop(topic_name)
+        self.groups.pop(topic_name)
+        return True, "Left the consumer group."
+
     async def _consume(
         self, session: aiohttp.client.ClientSession, topic_name: str, partition_index: int = None
     ) -> Tuple[bool, str]:
@@ -66,9 +147,9 @@ class Consumer:
                 }
                 if partition_index is not None:
                     json_data["partition_index"] = partition_index
-                async with session.get(url, json=json_data) as response:
+                async with session.get(url, **request_kwargs(json_data, self.wire_format)) as response:
                     response_status = response.status
-                    response_json = await response.json()
+                    response_json = await read_body(response)
                     if response_status == 200:
                         status = response_json["status"]
                         return status == "success", response_json["message"]
@@ -80,6 +161,57 @@ class Consumer:
                 return False, str(e)
         return False, "Topic not registered."
 
+    async def _consume_batch(
+        self,
+        session: aiohttp.client.ClientSession,
+        topic_name: str,
+        max_messages: int,
+        max_bytes: int = None,
+        partition_index: int = None,
+        wait_ms: int = None,
+        binary: bool = False,
+    ) -> Tuple[bool, Any]:
+        """
+        Consume up to `max_messages` messages from a given partition of a
+        topic in a single request. If no partition is specified, any partition
+        can be chosen arbitrarily. If `wait_ms` is given, the broker waits up
+        to that long for new messages when none are available. If `binary`
+        is set, the messages are returned as bytes.
+        Return (success, list of log messages)
+        """
+        if topic_name in self.topics:
+            try:
+                url = urljoin(self.broker, Routes.consume_message)
+                json_data: Dict[str, Any] = {
+                    "topic": topic_name,
+                    "consumer_id": self.topics[topic_name],
+                    "max_messages": max_messages,
+                }
+                if max_bytes is not None:
+                    json_data["max_bytes"] = max_bytes
+                if partition_index is not None:
+                    json_data["partition_index"] = partition_index
+                if wait_ms is not None:
+                    json_data["wait_ms"] = wait_ms
+                if binary:
+                    json_data["encoding"] = "base64"
+                async with session.get(url, **request_kwargs(json_data, self.wire_format)) as response:
+                    response_status = response.status
+                    response_json = await read_body(response)
+                    if response_status == 200:
+                        if response_json["status"] == "success":
+                            if binary:
+                                return True, [base64.b64decode(message) for message in response_json["messages"]]
+                            return True, response_json["messages"]
+                        return False, response_json["message"]
+                    elif response_status == 400:
+                        return False, response_json["message"]
+                    else:
+                        return False, await response.text()
+            except Exception as e:
+                return False, str(e)
+        return False, "Topic not registered."
+
     async def _get_queue_length(
         self, session: aiohttp.client.ClientSession, topic_name: str, partition_index: int = None 
     ) -> Tuple[bool, List[Dict[str,int]]]:
@@ -97,9 +229,9 @@ class Consumer:
                 }
                 if partition_index is not None:
                     json_data["partition_index"] = partition_index
-                async with session.get(url, json=json_data) as response:
+                async with session.get(url, **request_kwargs(json_data, self.wire_format)) as response:
                     response_status = response.status
-                    response_json = await response.json()
+                    response_json = await read_body(response)
                     if response_status == 200:
                         return True, response_json["sizes"]
                     elif response_status == 400:
@@ -190,6 +322,82 @@ class Consumer:
         """
         return self.consume_multiple_from_partition(1, topic_name, partition_index)[0]
 
+    def consume_batch(
+        self,
+        topic_name: str,
+        max_messages: int,
+        max_bytes: int = None,
+        wait_ms: int = None,
+        binary: bool = False,
+    ) -> Tuple[bool, Any]:
+        """
+        Consume up to `max_messages` messages from any partition of a topic
+        in a single request. Messages are returned in order of the partition
+        they were read from.
+
+        Params:
+            topic_name - the name of the topic to consume from
+            max_messages - the maximum number of messages to consume
+            max_bytes - (optional) soft limit on the total size of the messages
+            wait_ms - (optional) how long to wait for new messages if none are available
+            binary - (optional) return the messages as bytes
+
+        Returns:
+            Tuple of (success, messages).
+            If `success` is True:
+                `messages` is the list of messages retrieved from the topic
+            Otherwise, it is an error message.
+        """
+        return self.async_requestor.run(
+            self._consume_batch,
+            [{
+                "topic_name": topic_name,
+                "max_messages": max_messages,
+                "max_bytes": max_bytes,
+                "wait_ms": wait_ms,
+                "binary": binary,
+            }]
+        )[0]
+
+    def consume_batch_from_partition(
+        self,
+        topic_name: str,
+        partition_index: int,
+        max_messages: int,
+        max_bytes: int = None,
+        wait_ms: int = None,
+        binary: bool = False,
+    ) -> Tuple[bool, Any]:
+        """
+        Consume up to `max_messages` messages from a given partition of a
+        topic in a single request, in order.
+
+        Params:
+            topic_name - the name of the topic to consume from
+            partition_index - the partition of the topic to consume from
+            max_messages - the maximum number of messages to consume
+            max_bytes - (optional) soft limit on the total size of the messages
+            wait_ms - (optional) how long to wait for new messages if none are available
+            binary - (optional) return the messages as bytes
+
+        Returns:
+            Tuple of (success, messages).
+            If `success` is True:
+                `messages` is the list of messages retrieved from the partition
+            Otherwise, it is an error message.
+        """
+        return self.async_requestor.run(
+            self._consume_batch,
+            [{
+                "topic_name": topic_name,
+                "max_messages": max_messages,
+                "max_bytes": max_bytes,
+                "partition_index": partition_index,
+                "wait_ms": wait_ms,
+                "binary": binary,
+            }]
+        )[0]
+
     def register(self, topic_name: str) -> Tuple[bool, str]:
         """
         Register a topic to consume from. 
@@ -204,6 +412,60 @@ class Consumer:
             self._register, [{"topic_name": topic_name}]
         )[0]
 
+    def join_group(self, topic_name: str, group_name: str) -> Tuple[bool, Any]:
+        """
+        Join a consumer group of a topic, instead of registering to it. The
+        members of a group share the partitions of the topic, and every
+        message is consumed by one member only.
+
+        Params:
+            topic_name - the name of the topic to consume from
+            group_name - the name of the group, created by its first member
+
+        Returns:
+            Tuple of (success, partitions).
+            If `success` is True:
+                The list of the partitions assigned to this consumer.
+            Otherwise, it is an error message.
+        """
+        return self.async_requestor.run(
+            self._join_group, [{"topic_name": topic_name, "group_name": group_name}]
+        )[0]
+
+    def heartbeat(self, topic_name: str) -> Tuple[bool, Any]:
+        """
+        Keep the membership of the consumer group of a topic alive. Members
+        that do not send a heartbeat within the session timeout of the
+        manager are removed from their group.
+
+        Params:
+            topic_name - the name of the topic of the group
+
+        Returns:
+            Tuple of (success, partitions).
+            If `success` is True:
+                The list of the partitions currently assigned to this consumer.
+            Otherwise, it is an error message.
+        """
+        return self.async_requestor.run(
+            self._group_heartbeat, [{"topic_name": topic_name}]
+        )[0]
+
+    def leave_group(self, topic_name: str) -> Tuple[bool, str]:
+        """
+        Leave the consumer group of a topic, its partitions are assigned to
+        the other members.
+
+        Params:
+            topic_name - the name of the topic of the group
+
+        Returns:
+            Tuple of (success, message).
+        """
+        return self.async_requestor.run(
+            self._leave_group, [{"topic_name": topic_name}]
+        )[0]
+
     def get_queue_length(self, topic_name: str) -> Tuple[bool, List[Dict[str,int]]]:
         """
         Get the length of all the queues (partitions) of a topic. 
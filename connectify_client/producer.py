@@ -1,10 +1,13 @@
+import base64
 import requests
 import aiohttp
 from urllib.parse import urljoin
-from typing import Dict, Tuple, List
+from typing import Any, Dict, Tuple, List, Union
 
 from .routes import Routes
 from .async_requests import AsyncRequests
+from .wire import check_wire_format, read_body, request_kwargs
+from .compression import compress_batch, to_bytes
 
 
 class Producer:
@@ -14,14 +17,39 @@ class Producer:
     address: str - the address of the broker
     port: int - the port of the broker
     protocol: str - the protocol to use (currently only http is supported)
+    wire_format: str - the format of the request and response bodies,
+        "json" or "msgpack" (needs the msgpack package)
+    direct: bool - send the produce requests straight to the broker of the
+        partition, using the partition map of the topic fetched from the
+        manager (the brokers must be reachable from the producer)
+    broker_port: int - the port of the brokers, for direct produces
+    broker_addresses: Dict[str, str] - (optional) the address to reach each
+        broker host at, for direct produces
     """
 
     def __init__(
-        self, address: str, port: int, protocol: str = "http"
+        self,
+        address: str,
+        port: int,
+        protocol: str = "http",
+        wire_format: str = "json",
+        direct: bool = False,
+        broker_port: int = 5000,
+        broker_addresses: Dict[str, str] = None,
     ) -> None:
+        check_wire_format(wire_format)
         self.broker = protocol + "://" + address + ":" + str(port)
+        self.wire_format = wire_format
         self.topics: Dict[str, str] = {}
         self.async_requestor = AsyncRequests()
+        self.protocol = protocol
+        self.direct = direct
+        self.broker_port = broker_port
+        self.broker_addresses = broker_addresses or {}
+        # partition map of every topic produced to directly, and the next
+        # partition to produce to
+        self.partition_maps: Dict[str, Dict[str, Any]] = {}
+        self.next_partitions: Dict[str, int] = {}
 
     async def _register(
         self, session: aiohttp.client.ClientSession, topic_name: str
@@ -33,9 +61,9 @@ class Producer:
             try:
                 url = urljoin(self.broker, Routes.register_producer)
                 json_data: Dict[str, str] = {"topic": topic_name}
-                async with session.post(url, json=json_data) as response:
+                async with session.post(url, **request_kwargs(json_data, self.wire_format)) as response:
                     response_status = response.status
-                    response_json = await response.json()
+                    response_json = await read_body(response)
                     if response_status == 200:
                         producer_id = response_json["producer_id"]
                         self.topics[topic_name] = producer_id
@@ -48,6 +76,73 @@ class Producer:
                 return False, str(e)
         return False, "Topic already registered."
 
+    async def _fetch_partition_map(
+        self, session: aiohttp.client.ClientSession, topic_name: str
+    ) -> None:
+        """
+        Fetch the partition map of a topic from the manager.
+        """
+        url = urljoin(self.broker, Routes.metadata)
+        async with session.get(url, **request_kwargs({"topic": topic_name}, self.wire_format)) as response:
+            response_status = response.status
+            response_json = await read_body(response)
+        if response_status != 200:
+            raise Exception(response_json["message"])
+        self.partition_maps[topic_name] = response_json
+
+    def _direct_partition(self, topic_name: str, partition_index: int = None) -> int:
+        """
+        Return the partition to produce to directly. If no partition is
+        provided, it is chosen in a round-robin manner over the partitions
+        on active brokers.
+        """
+        partitions = self.partition_maps[topic_name]["partitions"]
+        if partition_index is not None:
+            if partition_index >= len(partitions):
+                raise Exception("Invalid Partition Number.")
+            return partition_index
+        for _ in range(len(partitions)):
+            index = self.next_partitions.get(topic_name, 0) % len(partitions)
+            self.next_partitions[topic_name] = index + 1
+            if partitions[index]["active"]:
+                return index
+        raise Exception("All brokers are inactive.")
+
+    async def _post_direct(
+        self,
+        session: aiohttp.client.ClientSession,
+        route: str,
+        topic_name: str,
+        json_data: Dict[str, Any],
+        partition_index: int = None,
+    ) -> Tuple[int, Any]:
+        """
+        Send a produce request straight to the broker of the partition. The
+        partition map of the topic is fetched on first use, and again when
+        the broker rejects it as stale (409) or cannot be reached.
+        Return (status, body) of the response.
+        """
+        for attempt in range(2):
+            if attempt > 0 or topic_name not in self.partition_maps:
+                await self._fetch_partition_map(session, topic_name)
+            partition_map = self.partition_maps[topic_name]
+            index = self._direct_partition(topic_name, partition_index)
+            broker_host = partition_map["partitions"][index]["broker_host"]
+            address = self.broker_addresses.get(broker_host, broker_host)
+            url = f"{self.protocol}://{address}:{self.broker_port}{route}"
+            json_data = dict(json_data, partition_index=index, map_version=partition_map["map_version"])
+            try:
+                async with session.post(url, **request_kwargs(json_data, self.wire_format)) as response:
+                    response_status = response.status
+                    response_json = await read_body(response)
+            except aiohttp.ClientConnectionError:
+                # the broker may have moved, the next produce fetches the map
+                self.partition_maps.pop(topic_name, None)
+                raise
+            if response_status != 409:
+                break
+        return response_status, response_json
+
     async def _produce(
         self,
         session: aiohttp.client.ClientSession,
@@ -67,11 +162,18 @@ class Producer:
                     "producer_id": self.topics[topic_name],
                     "message": message,
                 }
+                if self.direct:
+                    response_status, response_json = await self._post_direct(
+                        session, Routes.produce_message, topic_name, json_data, partition_index
+                    )
+                    if response_status == 200:
+                        return True, "Message produced."
+                    return False, response_json["message"]
                 if partition_index is not None:
                     json_data["partition_index"] = partition_index
-                async with session.post(url, json=json_data) as response:
+                async with session.post(url, **request_kwargs(json_data, self.wire_format)) as response:
                     response_status = response.status
-                    response_json = await response.json()
+                    response_json = await read_body(response)
                     if response_status == 200:
                         return True, "Message produced."
                     elif response_status == 400:
@@ -82,6 +184,61 @@ class Producer:
                 return False, str(e)
         return False, "Topic not registered."
 
+    async def _produce_batch(
+        self,
+        session: aiohttp.client.ClientSession,
+        messages: List[Union[str, bytes]],
+        topic_name: str,
+        partition_index: int = None,
+        codec: str = None,
+    ) -> Tuple[bool, Any]:
+        """
+        Produce a batch of messages to a given partition of a topic in a
+        single request. If no partition is provided, partition will be
+        chosen in a round-robin manner. With a codec, the batch is
+        compressed as a unit.
+        Return (success, offsets of the messages)
+        """
+        if topic_name in self.topics:
+            try:
+                url = urljoin(self.broker, Routes.produce_batch)
+                json_data: Dict[str, Any] = {
+                    "topic": topic_name,
+                    "producer_id": self.topics[topic_name],
+                }
+                if codec is not None:
+                    json_data["codec"] = codec
+                    json_data["payload"] = compress_batch(messages, codec)
+                    json_data["count"] = len(messages)
+                elif any(isinstance(message, bytes) for message in messages):
+                    json_data["encoding"] = "base64"
+                    json_data["messages"] = [
+                        base64.b64encode(to_bytes(message)).decode() for message in messages
+                    ]
+                else:
+                    json_data["messages"] = messages
+                if self.direct:
+                    response_status, response_json = await self._post_direct(
+                        session, Routes.produce_batch, topic_name, json_data, partition_index
+                    )
+                    if response_status == 200:
+                        return True, response_json["offsets"]
+                    return False, response_json["message"]
+                if partition_index is not None:
+                    json_data["partition_index"] = partition_index
+                async with session.post(url, **request_kwargs(json_data, self.wire_format)) as response:
+                    response_status = response.status
+                    response_json = await read_body(response)
+                    if response_status == 200:
+                        return True, response_json["offsets"]
+                    elif response_status == 400:
+                        return False, response_json["message"]
+                    else:
+                        return False, await response.text()
+            except Exception as e:
+                return False, str(e)
+        return False, "Topic not registered."
+
     def register(self, topic_name: str) -> Tuple[bool, str]:
         """
         Register a topic to produce to.
@@ -219,6 +376,58 @@ class Producer:
             ]
         )
 
+    def produce_batch(
+        self, messages: List[Union[str, bytes]], topic_name: str, codec: str = None
+    ) -> Tuple[bool, Any]:
+        """
+        Produce a batch of messages to a topic in a single request. The
+        messages are stored in order in one partition.
+
+        Params:
+            messages - the list of messages to produce, text or bytes
+            topic_name - the name of the topic to produce to
+            codec - (optional) "zlib", "zstd" or "lz4" to compress the batch as a unit
+
+        Returns:
+            Tuple of (success, offsets).
+            If `success` is True:
+                `offsets` is the list of offsets of the messages
+            Otherwise, it is an error message.
+        """
+        return self.async_requestor.run(
+            self._produce_batch,
+            [{"messages": messages, "topic_name": topic_name, "codec": codec}]
+        )[0]
+
+    def produce_batch_to_partition(
+        self, messages: List[Union[str, bytes]], topic_name: str, partition_index: int, codec: str = None
+    ) -> Tuple[bool, Any]:
+        """
+        Produce a batch of messages to a given partition of a topic in a
+        single request, in order.
+
+        Params:
+            messages - the list of messages to produce, text or bytes
+            topic_name - the name of the topic to produce to
+            partition_index - the partition to produce to
+            codec - (optional) "zlib", "zstd" or "lz4" to compress the batch as a unit
+
+        Returns:
+            Tuple of (success, offsets).
+            If `success` is True:
+                `offsets` is the list of offsets of the messages
+            Otherwise, it is an error message.
+        """
+        return self.async_requestor.run(
+            self._produce_batch,
+            [{
+                "messages": messages,
+                "topic_name": topic_name,
+                "partition_index": partition_index,
+                "codec": codec,
+            }]
+        )[0]
+
     def close(self) -> None:
         """
         Close the producer.
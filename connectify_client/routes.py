@@ -1,6 +1,11 @@
 class Routes:
     register_consumer: str = "/consumer/register"
+    join_group: str = "/consumer/group/join"
+    group_heartbeat: str = "/consumer/group/heartbeat"
+    leave_group: str = "/consumer/group/leave"
     register_producer: str = "/producer/register"
+    metadata: str = "/metadata"
     produce_message: str = "/producer/produce"
+    produce_batch: str = "/producer/produce_batch"
     consume_message: str = "/consumer/consume"
     size: str = "/size"
\ No newline at end of file
@@ -0,0 +1,50 @@
+import json
+from typing import Any, Dict
+
+import aiohttp
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_MIMETYPE = "application/json"
+MSGPACK_MIMETYPE = "application/msgpack"
+
+WIRE_FORMATS = ("json", "msgpack")
+
+
+def check_wire_format(wire_format: str) -> None:
+    """
+    Raise if the wire format is unknown or needs a missing package.
+    """
+    if wire_format not in WIRE_FORMATS:
+        raise Exception(f"Unknown wire format '{wire_format}'.")
+    if wire_format == "msgpack" and msgpack is None:
+        raise Exception("Wire format 'msgpack' needs the msgpack package.")
+
+
+def request_kwargs(json_data: Dict[str, Any], wire_format: str) -> Dict[str, Any]:
+    """
+    Return the arguments of an aiohttp request sending json_data in the
+    wire format, and asking for responses in the same format.
+    """
+    if wire_format == "msgpack":
+        return {
+            "data": msgpack.packb(json_data),
+            "headers": {
+                "Content-Type": MSGPACK_MIMETYPE,
+                "Accept": f"{MSGPACK_MIMETYPE}, {JSON_MIMETYPE};q=0.5",
+            },
+        }
+    return {"json": json_data}
+
+
+async def read_body(response: aiohttp.ClientResponse) -> Any:
+    """
+    Decode the body of a response, JSON or msgpack by its Content-Type.
+    """
+    body = await response.read()
+    if response.content_type == MSGPACK_MIMETYPE:
+        return msgpack.unpackb(body, raw=False)
+    return json.loads(body)
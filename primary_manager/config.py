@@ -1,5 +1,50 @@
+import os
+
 class Config:
     """Base config."""
+    # shared secret sent to the brokers in the X-Trusted-Hop header of the
+    # requests forwarded to them, so that they skip validating what the
+    # manager already validated (empty to let the brokers validate)
+    TRUSTED_HOP_TOKEN = os.environ.get("TRUSTED_HOP_TOKEN", "")
+    # keep-alive connections to the brokers: connect and read timeouts of
+    # every request, idle connections kept per broker and number of
+    # brokers with a pool
+    BROKER_CONNECT_TIMEOUT_MS = float(os.environ.get("BROKER_CONNECT_TIMEOUT_MS", 1000))
+    BROKER_READ_TIMEOUT_MS = float(os.environ.get("BROKER_READ_TIMEOUT_MS", 10000))
+    BROKER_POOL_MAXSIZE = int(os.environ.get("BROKER_POOL_MAXSIZE", 32))
+    BROKER_POOL_HOSTS = int(os.environ.get("BROKER_POOL_HOSTS", 16))
+    # produces of a producer to a partition are collected for up to
+    # PRODUCE_LINGER_MS (0 forwards every produce on its own), or until
+    # PRODUCE_BATCH_SIZE messages or PRODUCE_BATCH_MAX_BYTES are waiting,
+    # and forwarded to the broker as one batch, by up to PRODUCE_SENDERS
+    # threads at once. A produce fails if its batch is not acknowledged
+    # within PRODUCE_TIMEOUT_MS.
+    PRODUCE_LINGER_MS = float(os.environ.get("PRODUCE_LINGER_MS", 5))
+    PRODUCE_BATCH_SIZE = int(os.environ.get("PRODUCE_BATCH_SIZE", 500))
+    PRODUCE_BATCH_MAX_BYTES = int(os.environ.get("PRODUCE_BATCH_MAX_BYTES", 1024 * 1024))
+    PRODUCE_SENDERS = int(os.environ.get("PRODUCE_SENDERS", 16))
+    PRODUCE_TIMEOUT_MS = float(os.environ.get("PRODUCE_TIMEOUT_MS", 30000))
+    # updates sent to the read only managers: timeout of every attempt, and
+    # number of retries (backing off exponentially from
+    # SYNC_RETRY_BACKOFF_MS) when a manager cannot be reached, times out or
+    # fails with a server error
+    SYNC_TIMEOUT_MS = float(os.environ.get("SYNC_TIMEOUT_MS", 2000))
+    SYNC_RETRIES = int(os.environ.get("SYNC_RETRIES", 2))
+    SYNC_RETRY_BACKOFF_MS = float(os.environ.get("SYNC_RETRY_BACKOFF_MS", 100))
+    # partitions of new topics go to the brokers with the lowest weighted
+    # sum of their partitions, produce and consume rates and stored logs
+    # (each relative to the mean over the brokers). The rates come from the
+    # broker metrics, read every PLACEMENT_METRICS_INTERVAL_MS and smoothed
+    # with PLACEMENT_RATE_SMOOTHING (1 keeps only the latest sample)
+    PLACEMENT_PARTITION_WEIGHT = float(os.environ.get("PLACEMENT_PARTITION_WEIGHT", 1))
+    PLACEMENT_PRODUCE_WEIGHT = float(os.environ.get("PLACEMENT_PRODUCE_WEIGHT", 1))
+    PLACEMENT_CONSUME_WEIGHT = float(os.environ.get("PLACEMENT_CONSUME_WEIGHT", 0.5))
+    PLACEMENT_STORAGE_WEIGHT = float(os.environ.get("PLACEMENT_STORAGE_WEIGHT", 0.5))
+    PLACEMENT_RATE_SMOOTHING = float(os.environ.get("PLACEMENT_RATE_SMOOTHING", 0.5))
+    PLACEMENT_METRICS_INTERVAL_MS = float(os.environ.get("PLACEMENT_METRICS_INTERVAL_MS", 10000))
+    # members of a consumer group without a heartbeat for this long are
+    # removed from the group and their partitions reassigned
+    CONSUMER_GROUP_SESSION_TIMEOUT_MS = int(os.environ.get("CONSUMER_GROUP_SESSION_TIMEOUT_MS", 30000))
 
 
 class ProdConfig(Config):
@@ -4,3 +4,6 @@ from db_models.producers import Producer as ProducerDB
 from db_models.topics import Topic as TopicDB
 from db_models.brokers import Broker as BrokerDB
 from db_models.request_logs import RequestLog as RequestLogDB
+
+from db_models.consumer_groups import ConsumerGroup as ConsumerGroupDB
+from db_models.group_members import GroupMember as GroupMemberDB
\ No newline at end of file
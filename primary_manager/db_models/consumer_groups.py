@@ -0,0 +1,15 @@
+from src import db
+
+
+class ConsumerGroup(db.Model):
+    __tablename__ = "consumer_group"
+    # the offsets of the group are kept by the brokers under this id
+    id = db.Column(db.String(32), primary_key=True, index=True)
+    name = db.Column(db.String(256), nullable=False)
+    topic_name = db.Column(
+        db.String(256), db.ForeignKey("topic.name"), nullable=False
+    )
+    generation = db.Column(db.Integer, nullable=False, default=0)
+    __table_args__ = (
+        db.UniqueConstraint("name", "topic_name", name="group_name_constraint"),
+    )
@@ -3,15 +3,35 @@ from flask_sqlalchemy import SQLAlchemy
 import requests
 
 from src.json_validator import expects_json
-from src.async_requests import AsyncRequests
-from src.sync_utils import sync_broker_metadata
-from time import sleep
+from src.wire import WireJSONProvider, WireRequest
+from src.broker_client import BrokerClient
+from src.produce_accumulator import ProduceAccumulator
+from src.async_requests import AsyncLoop
+from src.sync_utils import sync_broker_metadata, submit_broker_metadata, async_loop
+from time import sleep, monotonic
 import config
 import os
 import threading
 
 app = Flask(__name__)
+app.request_class = WireRequest
+app.json = WireJSONProvider(app)
 app.config.from_object(config.DevConfig)
+broker_client = BrokerClient(
+    app.config["BROKER_CONNECT_TIMEOUT_MS"],
+    app.config["BROKER_READ_TIMEOUT_MS"],
+    app.config["BROKER_POOL_MAXSIZE"],
+    app.config["BROKER_POOL_HOSTS"],
+)
+produce_accumulator = ProduceAccumulator(
+    broker_client,
+    app.config["TRUSTED_HOP_TOKEN"],
+    app.config["PRODUCE_LINGER_MS"],
+    app.config["PRODUCE_BATCH_SIZE"],
+    app.config["PRODUCE_BATCH_MAX_BYTES"],
+    app.config["PRODUCE_SENDERS"],
+    app.config["PRODUCE_TIMEOUT_MS"],
+)
 
 db = SQLAlchemy(app)
 from db_models import *
@@ -22,12 +42,27 @@ data_manager = DataManager()
 
 def health_check():
     with app.app_context():
+        load_read_at = None
         while True:
             brokers = data_manager.get_brokers()
+            # read the load of the brokers every PLACEMENT_METRICS_INTERVAL_MS
+            read_load = (
+                load_read_at is None
+                or (monotonic() - load_read_at) * 1000 >= app.config["PLACEMENT_METRICS_INTERVAL_MS"]
+            )
+            if read_load:
+                load_read_at = monotonic()
             for broker in brokers:
                 try:
-                    response = requests.get(f"http://{broker}:5000/")
+                    response = broker_client.get(broker, "/")
                     response.raise_for_status()
+                    # brokers reject the direct produces of clients with an
+                    # older partition map
+                    broker_client.post(
+                        broker, "/metadata/version", json={"map_version": data_manager.get_map_version()}
+                    ).raise_for_status()
+                    if read_load:
+                        read_broker_load(broker)
 
                     app.logger.info(f"Resetting broker health of {broker}.")
                     old_health = data_manager.reset_broker_health(broker)
@@ -53,9 +88,32 @@ def health_check():
             # check every 1 second
             sleep(1)
 
+def read_broker_load(broker):
+    """Record the load of a broker from its metrics, for the placement of
+    new partitions."""
+    try:
+        response = broker_client.get(broker, "/metrics")
+        response.raise_for_status()
+        data_manager.record_broker_load(broker, response.json()["metrics"]["load"])
+    except Exception as e:
+        app.logger.warning(f"Unable to read the load of broker {broker}: {e}")
+
+def group_session_check():
+    with app.app_context():
+        while True:
+            try:
+                data_manager.expire_group_members(app.config["CONSUMER_GROUP_SESSION_TIMEOUT_MS"])
+            except Exception as e:
+                app.logger.warning(f"Unable to expire consumer group members: {e}")
+            # check every 1 second
+            sleep(1)
+
 from src import views
 
 with app.app_context():
+    print("\033[94mStarting async loop...\033[0m")
+    async_loop.start()
+
     if app.config["TESTING"]:
         print("\033[94mTesting mode detected \033[0m")
         db.drop_all()
@@ -76,6 +134,12 @@ with app.app_context():
     print("\033[94mStarting health check manager...\033[0m")
     threading.Thread(target=health_check).start()
 
+    print("\033[94mStarting produce accumulator...\033[0m")
+    produce_accumulator.start()
+
+    print("\033[94mStarting consumer group session check...\033[0m")
+    threading.Thread(target=group_session_check, daemon=True).start()
+
     # print the master queue for debugging purposes
     if app.config["FLASK_ENV"] == "development":
         print("Active brokers in manager:")
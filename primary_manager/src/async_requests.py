@@ -1,17 +1,23 @@
 import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, TypeVar
+
 import aiohttp
-import json
-from typing import TypeVar, Callable, List, Any, Dict, Awaitable
 
 T = TypeVar("T")
 
 
-class AsyncRequests:
-    """Class for making parallel async requests to a server"""
+class AsyncLoop:
+    """
+    An asyncio event loop running in its own thread, with one aiohttp
+    session shared by every coroutine submitted to it, so that requests
+    reuse the loop and the open connections instead of setting them up on
+    every call.
+    """
 
     def __init__(
         self,
-        parallel_requests: int = 100,
         limit_per_host: int = 100,
         limit: int = 0,
         ttl_dns_cache: int = 300,
@@ -19,62 +25,33 @@ class AsyncRequests:
         self.limit_per_host = limit_per_host
         self.limit = limit
         self.ttl_dns_cache = ttl_dns_cache
-        self.semaphore = asyncio.Semaphore(parallel_requests)
-
-    async def gather_with_concurrency(
-        self,
-        func: Callable[..., Awaitable[T]],
-        reqs: List[Dict[str, Any]],
-        resp_dict: Dict[int, T],
-        session: aiohttp.client.ClientSession,
-    ) -> None:
-        n = len(reqs)
-        async def get(
-            id: int, session: aiohttp.client.ClientSession, **kwargs
-        ) -> None:
-            async with self.semaphore:
-                resp_dict[id] = await func(session, **kwargs)
-
-        await asyncio.gather(
-            *(
-                get(id, session, **kwargs)
-                for id, kwargs in enumerate(reqs)
-            )
-        )
-
-    async def _run(
-        self, 
-        func: Callable[..., Awaitable[T]], 
-        reqs: List[Dict[str, Any]], 
-        resp_dict: Dict[int, T],
-        loop: asyncio.AbstractEventLoop
-    ) -> None:
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name="async-loop", daemon=True)
+        self._started = threading.Event()
+        self._session: aiohttp.ClientSession = None
+
+    def start(self) -> None:
+        """Start the loop thread and wait until the session is open."""
+        self._thread.start()
+        self._started.wait()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._open_session())
+        self._started.set()
+        self._loop.run_forever()
+
+    async def _open_session(self) -> None:
         conn = aiohttp.TCPConnector(
             limit_per_host=self.limit_per_host,
             limit=self.limit,
             ttl_dns_cache=self.ttl_dns_cache,
-            loop=loop,
         )
-
-        async with aiohttp.ClientSession(connector=conn, loop=loop) as session:
-            await self.gather_with_concurrency(func, reqs, resp_dict, session)
-        
-        conn.close()
-    
-    def run(
-        self, 
-        func: Callable[..., Awaitable[T]], 
-        reqs: List[Dict[str, Any]]
-    ) -> List[T]:
-        resp_dict: Dict[int, T] = {}
-
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-
-        loop.run_until_complete(
-            self._run(func, reqs, resp_dict, loop)
-        )
-
-        loop.close()
-
-        return [resp_dict[id] for id in range(len(reqs))]
+        self._session = aiohttp.ClientSession(connector=conn)
+
+    def submit(self, func: Callable[..., Awaitable[T]], *args: Any, **kwargs: Any) -> "Future[T]":
+        """Run func(session, *args, **kwargs) on the loop and return a future
+        of its result."""
+        if not self._started.is_set():
+            raise Exception("Async loop is not started.")
+        return asyncio.run_coroutine_threadsafe(func(self._session, *args, **kwargs), self._loop)
@@ -1,2 +1,4 @@
 from src.models.topics import Topic
+from src.models.consumer_group import ConsumerGroup
+from src.models.placement import PlacementEngine
 from src.models.data_manager import DataManager
@@ -0,0 +1,102 @@
+import threading
+import time
+from typing import Dict, List, Tuple
+
+
+class ConsumerGroup:
+    """
+    A consumer group shares the partitions of a topic between its members.
+
+    Every partition is assigned to exactly one member, round-robin over the
+    members ordered by id, so that no log is delivered to two members. The
+    group is rebalanced whenever a member joins, leaves or misses its
+    heartbeats, and every rebalance starts a new generation. The offsets of
+    the group are kept by the brokers under the id of the group.
+    """
+
+    def __init__(self, group_id: str, name: str, topic_name: str, partition_count: int, generation: int = 0):
+        self._lock = threading.Lock()
+        self._id = group_id
+        self._name = name
+        self._topic_name = topic_name
+        self._partition_count = partition_count
+        self._generation = generation
+        # last heartbeat of every member
+        self._members: Dict[str, float] = {}
+        self._assignment: Dict[str, List[int]] = {}
+
+    def get_id(self) -> str:
+        return self._id
+
+    def get_name(self) -> str:
+        return self._name
+
+    def get_topic_name(self) -> str:
+        return self._topic_name
+
+    def get_generation(self) -> int:
+        with self._lock:
+            return self._generation
+
+    def snapshot(self) -> Tuple[int, Dict[str, List[int]]]:
+        """Return the generation and the partitions of every member."""
+        with self._lock:
+            return self._generation, {
+                member_id: list(partitions) for member_id, partitions in self._assignment.items()
+            }
+
+    def get_partitions(self, member_id: str) -> List[int]:
+        """Return the partitions assigned to the member."""
+        with self._lock:
+            if member_id not in self._members:
+                raise Exception("Consumer is not a member of the group.")
+            return list(self._assignment[member_id])
+
+    def restore(self, assignment: Dict[str, List[int]]) -> None:
+        """Restore the members and their partitions, as last persisted."""
+        with self._lock:
+            now = time.monotonic()
+            for member_id, partitions in assignment.items():
+                self._members[member_id] = now
+                self._assignment[member_id] = list(partitions)
+
+    def join(self, member_id: str) -> None:
+        """Add a member and rebalance the group."""
+        with self._lock:
+            self._members[member_id] = time.monotonic()
+            self._rebalance()
+
+    def leave(self, member_id: str) -> None:
+        """Remove a member and rebalance the group."""
+        with self._lock:
+            if member_id not in self._members:
+                raise Exception("Consumer is not a member of the group.")
+            del self._members[member_id]
+            self._rebalance()
+
+    def heartbeat(self, member_id: str) -> None:
+        """Record that the member is alive."""
+        with self._lock:
+            if member_id not in self._members:
+                raise Exception("Consumer is not a member of the group.")
+            self._members[member_id] = time.monotonic()
+
+    def expire(self, timeout_ms: float) -> List[str]:
+        """Remove the members without a heartbeat for timeout_ms, rebalance
+        the group if any, and return them."""
+        with self._lock:
+            deadline = time.monotonic() - timeout_ms / 1000
+            expired = [member_id for member_id, seen in self._members.items() if seen < deadline]
+            for member_id in expired:
+                del self._members[member_id]
+            if len(expired) > 0:
+                self._rebalance()
+            return expired
+
+    def _rebalance(self) -> None:
+        members = sorted(self._members.keys())
+        self._assignment = {member_id: [] for member_id in members}
+        if len(members) > 0:
+            for partition_index in range(self._partition_count):
+                self._assignment[members[partition_index % len(members)]].append(partition_index)
+        self._generation += 1
@@ -2,12 +2,12 @@ import threading
 from typing import Dict, List, Any, Tuple
 import uuid
 import time
-import requests
 import os
 
-from src.models import Topic
-from src import db, app
+from src.models import Topic, ConsumerGroup, PlacementEngine
+from src import db, app, broker_client
 from src import TopicDB, BrokerDB, ProducerDB, PartitionDB, ConsumerDB, RequestLogDB
+from src import ConsumerGroupDB, GroupMemberDB
 from src import sync_broker_metadata
 
 class DataManager:
@@ -24,6 +24,25 @@ class DataManager:
         # increment by 1, when counter reaches -3, mark broker
         # as inactive
         self._broker_health : Dict[str, int] = {}
+        # consumer groups by topic name and group name
+        self._groups: Dict[Tuple[str, str], ConsumerGroup] = {}
+        # id and creation lock of the groups being registered on the
+        # brokers. A group whose registration failed keeps its id, so that
+        # the next join retries the registration of the same id.
+        self._pending_groups: Dict[Tuple[str, str], Tuple[str, threading.Lock]] = {}
+        # serializes the publication of the group assignments
+        self._groups_lock = threading.Lock()
+        # version of the partition map served to the producers, changed
+        # whenever a broker is added, removed, activated or deactivated. It
+        # starts from the clock so that it keeps growing across restarts.
+        self._map_version = int(time.time() * 1000)
+        self._placement = PlacementEngine(
+            app.config["PLACEMENT_PARTITION_WEIGHT"],
+            app.config["PLACEMENT_PRODUCE_WEIGHT"],
+            app.config["PLACEMENT_CONSUME_WEIGHT"],
+            app.config["PLACEMENT_STORAGE_WEIGHT"],
+            app.config["PLACEMENT_RATE_SMOOTHING"],
+        )
 
 
     def init_from_db(self) -> None:
@@ -54,6 +73,16 @@ class DataManager:
                 self._active_brokers[partition.broker_host]+=1
             else :
                 self._inactive_brokers[partition.broker_host]+=1
+
+        groups = ConsumerGroupDB.query.all()
+        for group in groups:
+            consumer_group = ConsumerGroup(
+                group.id, group.name, group.topic_name,
+                self._topics[group.topic_name].get_partition_count(), group.generation
+            )
+            members = GroupMemberDB.query.filter_by(group_id=group.id).all()
+            consumer_group.restore({member.id: member.partitions for member in members})
+            self._groups[(group.topic_name, group.name)] = consumer_group
     
     def get_brokers(self) -> List[str]:
         """Return the complete list of brokers."""
@@ -93,7 +122,7 @@ class DataManager:
         app.logger.info(f"Playing requests for broker: {broker_name}")
         pending_requests = RequestLogDB.query.filter_by(broker_name=broker_name).order_by(RequestLogDB.id).all()
         for request in pending_requests:
-            requests.post(request.endpoint, json=request.json_data)
+            broker_client.request_url("POST", request.endpoint, json=request.json_data)
             db.session.delete(request)
         db.session.commit()
 
@@ -103,24 +132,45 @@ class DataManager:
             return topic_name in self._topics
     
     def add_topic_and_return(self, topic_name: str, num_partitions: int = 2) -> List[str]:
-        broker_hosts = []
-        # choosing [broker] with minimum number of partitions
+        """Add a topic with its partitions placed on the least loaded active
+        brokers, and return the broker of every partition."""
         with self._lock:
             if topic_name in self._topics:
                 raise Exception("Topic already exists.")
-            self._topics[topic_name] = Topic(topic_name, num_partitions)
-            for i in range(num_partitions) : 
-                min_partition_broker = min(self._active_brokers, key=self._active_brokers.get)
-                self._active_brokers[min_partition_broker]+=1
-                broker_hosts.append(min_partition_broker)
-                self._topics[topic_name].append_broker(broker_hosts[i])
+            broker_hosts = self._placement.place(self._active_brokers, num_partitions)
+            topic = Topic(topic_name, num_partitions)
+            for broker_host in broker_hosts:
+                self._active_brokers[broker_host] += 1
+                topic.append_broker(broker_host)
+            self._topics[topic_name] = topic
+        # written outside the lock, in a single transaction
+        try:
             db.session.add(TopicDB(name=topic_name, partitions = num_partitions))
+            db.session.flush()
+            db.session.add_all([
+                PartitionDB(ind=index, topic_name = topic_name, broker_host = broker_host)
+                for index, broker_host in enumerate(broker_hosts)
+            ])
             db.session.commit()
-            for index in range(num_partitions) : 
-                db.session.add(PartitionDB(ind=index,topic_name = topic_name, broker_host = broker_hosts[index]))
-                db.session.commit()
+        except Exception:
+            db.session.rollback()
+            with self._lock:
+                self._topics.pop(topic_name)
+                for broker_host in broker_hosts:
+                    if broker_host in self._active_brokers:
+                        self._active_brokers[broker_host] -= 1
+                    elif broker_host in self._inactive_brokers:
+                        self._inactive_brokers[broker_host] -= 1
+            raise
         return broker_hosts
-        
+
+    def record_broker_load(self, broker_host: str, load: Dict[str, int]) -> None:
+        """Update the load of a broker used to place new partitions."""
+        self._placement.record_load(broker_host, load)
+
+    def get_broker_loads(self) -> Dict[str, Dict[str, float]]:
+        return self._placement.get_stats()
+
     def add_producer(self, topic_name: str) -> List[str]:
         """Add a producer to the topic and return its id and #partitions"""
         producer_id = str(uuid.uuid4().hex)
@@ -145,6 +195,111 @@ class DataManager:
 
         return [consumer_id, self._topics[topic_name].get_partition_count()]
     
+    def _register_group_on_brokers(self, topic_name: str, group_id: str) -> None:
+        """Register the id of a consumer group on the broker of every
+        partition of the topic, which keep the offsets of the group under
+        it, queueing the registration for the inactive brokers. Raise if a
+        broker refused it. The brokers ignore the registrations of an id
+        they know already, so that it may be retried."""
+        broker_hosts = self.get_broker_list_for_topic(topic_name)
+        for i in range(len(broker_hosts)):
+            partition_data = {"topic": topic_name, "consumer_id": group_id, "partition_index": i}
+            response = None
+            if self.broker_is_active(broker_hosts[i]):
+                try:
+                    response = broker_client.post(broker_hosts[i], "/consumer/register", json = partition_data)
+                except Exception:
+                    pass
+            if response is None:
+                app.logger.warning(f"Unable to send /consumer/register of topic {topic_name} to broker {broker_hosts[i]}, queueing for later")
+                self.queue_request(broker_hosts[i], broker_client.url(broker_hosts[i], "/consumer/register"), partition_data)
+            elif response.status_code != 200:
+                raise Exception(f"Unable to register consumer group on broker {broker_hosts[i]}.")
+
+    def join_group(self, topic_name: str, group_name: str) -> Tuple[ConsumerGroup, str]:
+        """Add a member to a consumer group of the topic, creating the group
+        if needed. Return the group and the id of the member."""
+        if not self._contains(topic_name):
+            raise Exception("Topic does not exist.")
+        key = (topic_name, group_name)
+        with self._lock:
+            group = self._groups.get(key)
+            if group is None:
+                group_id, creation_lock = self._pending_groups.setdefault(
+                    key, (str(uuid.uuid4().hex), threading.Lock())
+                )
+        if group is None:
+            # the brokers are contacted without holding self._lock, joins of
+            # the same new group wait on its creation lock
+            with creation_lock:
+                with self._lock:
+                    group = self._groups.get(key)
+                if group is None:
+                    # the group is only published once every broker has its
+                    # id, on failure the id stays pending for the next join
+                    self._register_group_on_brokers(topic_name, group_id)
+                    try:
+                        db.session.add(ConsumerGroupDB(id=group_id, name=group_name, topic_name=topic_name, generation=0))
+                        db.session.commit()
+                    except Exception:
+                        db.session.rollback()
+                        raise
+                    group = ConsumerGroup(
+                        group_id, group_name, topic_name, self._topics[topic_name].get_partition_count()
+                    )
+                    with self._lock:
+                        self._groups[key] = group
+                        self._pending_groups.pop(key)
+        member_id = str(uuid.uuid4().hex)
+        group.join(member_id)
+        self._publish_group(group)
+        return group, member_id
+
+    def get_group(self, topic_name: str, group_name: str) -> ConsumerGroup:
+        """Return a consumer group of the topic."""
+        with self._lock:
+            if (topic_name, group_name) not in self._groups:
+                raise Exception("Consumer group does not exist.")
+            return self._groups[(topic_name, group_name)]
+
+    def leave_group(self, topic_name: str, group_name: str, member_id: str) -> None:
+        """Remove a member from a consumer group."""
+        group = self.get_group(topic_name, group_name)
+        group.leave(member_id)
+        self._publish_group(group)
+
+    def expire_group_members(self, timeout_ms: float) -> None:
+        """Remove the members of every group that missed their heartbeats."""
+        with self._lock:
+            groups = list(self._groups.values())
+        for group in groups:
+            expired = group.expire(timeout_ms)
+            if len(expired) > 0:
+                app.logger.info(
+                    f"Consumers {expired} timed out of group {group.get_name()} of topic {group.get_topic_name()}."
+                )
+                self._publish_group(group)
+
+    def _publish_group(self, group: ConsumerGroup) -> None:
+        """Persist the assignment of the group and send it to the read only
+        managers."""
+        with self._groups_lock:
+            generation, assignment = group.snapshot()
+            ConsumerGroupDB.query.filter_by(id=group.get_id()).update({"generation": generation})
+            GroupMemberDB.query.filter_by(group_id=group.get_id()).delete()
+            for member_id, partitions in assignment.items():
+                db.session.add(GroupMemberDB(id=member_id, group_id=group.get_id(), partitions=partitions))
+            db.session.commit()
+            sync_broker_metadata(
+                "/sync/consumer/group",
+                {
+                    "topic": group.get_topic_name(),
+                    "group_id": group.get_id(),
+                    "generation": generation,
+                    "assignment": assignment,
+                }
+            )
+
     def get_broker_host(self, topic_name: str, producer_id: str, partition_number : int = None) -> Tuple[str,int]:
         """Add a log to the topic if producer is registered with topic."""
         if not self._contains(topic_name):
@@ -170,6 +325,34 @@ class DataManager:
             else:
                 raise Exception("Broker is inactive.")
     
+    def _bump_map_version(self) -> None:
+        """Change the version of the partition map, with the lock held."""
+        self._map_version = max(int(time.time() * 1000), self._map_version + 1)
+
+    def get_map_version(self) -> int:
+        with self._lock:
+            return self._map_version
+
+    def get_partition_map(self, topic_name: str) -> Tuple[int, List[Dict[str, Any]]]:
+        """Return the version of the partition map and the broker of every
+        partition of the topic, with whether the broker is active."""
+        if not self._contains(topic_name):
+            raise Exception("Topic does not exist.")
+        broker_hosts = self._topics[topic_name].get_broker_list()
+        with self._lock:
+            return self._map_version, [
+                {
+                    "partition_index": partition_index,
+                    "broker_host": broker_host,
+                    "active": broker_host in self._active_brokers,
+                }
+                for partition_index, broker_host in enumerate(broker_hosts)
+            ]
+
+    def get_partition_count(self, topic_name: str) -> int:
+        """Return the number of partitions of the topic."""
+        return self._topics[topic_name].get_partition_count()
+
     def get_broker_list_for_topic(self, topic_name:str) -> List[str]:
         return self._topics[topic_name].get_broker_list()
     
@@ -181,6 +364,7 @@ class DataManager:
             self._broker_health[broker_host] = 0
             db.session.add(BrokerDB(name = broker_host,status = 1))
             db.session.commit()
+            self._bump_map_version()
     
     def remove_broker(self, broker_host) -> None: 
         with self._lock:
@@ -191,8 +375,10 @@ class DataManager:
             else :
                 self._inactive_brokers.pop(broker_host)
             self._broker_health.pop(broker_host)
+            self._placement.forget(broker_host)
             BrokerDB.query.filter_by(name = broker_host).delete()
             db.session.commit()
+            self._bump_map_version()
     
     def activate_broker(self, broker_host) -> None: 
         with self._lock:
@@ -220,6 +406,7 @@ class DataManager:
             broker = BrokerDB.query.filter_by(name = broker_host).first()
             broker.status = 1
             db.session.commit()
+            self._bump_map_version()
 
     def deactivate_broker(self, broker_host) -> None: 
         with self._lock:
@@ -245,3 +432,4 @@ class DataManager:
             broker = BrokerDB.query.filter_by(name = broker_host).first()
             broker.status = 0
             db.session.commit()
+            self._bump_map_version()
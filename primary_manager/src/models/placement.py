@@ -0,0 +1,115 @@
+import heapq
+import threading
+import time
+from typing import Dict, List, Tuple
+
+# load counters reported by the brokers under "load" of /metrics
+_RATES = ("produced_logs", "consumed_logs")
+
+
+class PlacementEngine:
+    """
+    Places the partitions of new topics on the least loaded brokers.
+
+    The load of a broker is a weighted sum of its number of partitions, its
+    recent produce and consume rates (logs per second) and the number of
+    logs it stores. Every term is divided by its mean over the brokers, so
+    that the weights compare terms of different units. The rates are
+    smoothed over the samples of the broker metrics. Partitions are placed
+    one at a time on the broker at the top of a heap of scores, whose score
+    then grows by one more partition.
+    """
+
+    def __init__(
+        self,
+        partition_weight: float,
+        produce_weight: float,
+        consume_weight: float,
+        storage_weight: float,
+        smoothing: float,
+    ) -> None:
+        self._lock = threading.Lock()
+        self._weights = {
+            "partitions": partition_weight,
+            "produced_logs": produce_weight,
+            "consumed_logs": consume_weight,
+            "stored_logs": storage_weight,
+        }
+        self._smoothing = smoothing
+        # last load sample of every broker and when it was taken
+        self._samples: Dict[str, Tuple[float, Dict[str, int]]] = {}
+        # smoothed rates and stored logs of every broker
+        self._loads: Dict[str, Dict[str, float]] = {}
+
+    def record_load(self, broker_host: str, load: Dict[str, int]) -> None:
+        """Update the load of a broker from the counters of its metrics."""
+        now = time.monotonic()
+        with self._lock:
+            broker_load = self._loads.setdefault(
+                broker_host, {"produced_logs": 0.0, "consumed_logs": 0.0, "stored_logs": 0.0}
+            )
+            broker_load["stored_logs"] = load["stored_logs"]
+            previous = self._samples.get(broker_host)
+            self._samples[broker_host] = (now, load)
+            if previous is None or now <= previous[0]:
+                return
+            for name in _RATES:
+                # counters restart from 0 with the broker, skip that sample
+                if load[name] < previous[1][name]:
+                    continue
+                rate = (load[name] - previous[1][name]) / (now - previous[0])
+                broker_load[name] += self._smoothing * (rate - broker_load[name])
+
+    def forget(self, broker_host: str) -> None:
+        """Drop the load of a removed broker."""
+        with self._lock:
+            self._samples.pop(broker_host, None)
+            self._loads.pop(broker_host, None)
+
+    def place(self, partition_counts: Dict[str, int], num_partitions: int) -> List[str]:
+        """Return the broker of every partition of a new topic, given the
+        number of partitions of every candidate broker."""
+        if len(partition_counts) == 0:
+            raise Exception("No active brokers.")
+        with self._lock:
+            terms = {
+                broker_host: {
+                    "partitions": float(count),
+                    **self._loads.get(broker_host, {}),
+                }
+                for broker_host, count in partition_counts.items()
+            }
+        means = {
+            name: sum(broker_terms.get(name, 0.0) for broker_terms in terms.values()) / len(terms)
+            for name in self._weights
+        }
+        # the mean number of partitions once the topic is placed, which is
+        # never 0
+        means["partitions"] = (
+            sum(partition_counts.values()) + num_partitions
+        ) / len(partition_counts)
+
+        def score(broker_terms: Dict[str, float]) -> float:
+            return sum(
+                weight * broker_terms.get(name, 0.0) / means[name]
+                for name, weight in self._weights.items()
+                if means[name] > 0
+            )
+
+        heap = [
+            (score(broker_terms), partition_counts[broker_host], broker_host)
+            for broker_host, broker_terms in terms.items()
+        ]
+        heapq.heapify(heap)
+        broker_hosts = []
+        for _ in range(num_partitions):
+            broker_score, count, broker_host = heapq.heappop(heap)
+            broker_hosts.append(broker_host)
+            partition_score = self._weights["partitions"] / means["partitions"]
+            heapq.heappush(heap, (broker_score + partition_score, count + 1, broker_host))
+        return broker_hosts
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """Return the smoothed load of every broker."""
+        with self._lock:
+            return {broker_host: dict(load) for broker_host, load in self._loads.items()}
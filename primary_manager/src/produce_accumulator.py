@@ -0,0 +1,222 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from typing import Dict, List, Tuple
+
+from src.broker_client import BrokerClient
+from src.wire import JSON_MIMETYPE, MSGPACK_MIMETYPE, msgpack, load_response, send_kwargs
+
+# (broker_host, topic_name, partition_index, producer_id, encoding)
+BatchKey = Tuple[str, str, int, str, str]
+
+
+class _Batch:
+    """Messages waiting to be forwarded together, and the futures of the
+    requests that produced them."""
+
+    def __init__(self, deadline: float) -> None:
+        self.deadline = deadline
+        self.messages: List[str] = []
+        self.futures: List[Future] = []
+        self.size = 0
+
+
+class ProduceAccumulator:
+    """
+    Batches the produces forwarded by the manager to the brokers.
+
+    The produces of a producer to the same partition (with the same
+    encoding, the broker keeps one producer per batch) are collected for up
+    to linger_ms, or until batch_size messages or batch_max_bytes are
+    waiting, and forwarded as one /producer/produce_batch. Request threads
+    block on a future resolved with the offset of their message once the
+    broker acknowledged the batch, for up to timeout_ms. Full batches are
+    sent right away, the others by a flusher thread when their linger
+    expires. Batches are sent by senders threads, each key always by the
+    same one.
+    """
+
+    def __init__(
+        self,
+        broker_client: BrokerClient,
+        trusted_hop_token: str,
+        linger_ms: float,
+        batch_size: int,
+        batch_max_bytes: int,
+        senders: int,
+        timeout_ms: float,
+    ) -> None:
+        self._broker_client = broker_client
+        self._trusted_hop_token = trusted_hop_token
+        self._mimetype = MSGPACK_MIMETYPE if msgpack is not None else JSON_MIMETYPE
+        self._linger = linger_ms / 1000
+        self._batch_size = batch_size
+        self._batch_max_bytes = batch_max_bytes
+        self._timeout = timeout_ms / 1000
+        self._condition = threading.Condition()
+        # batches being collected, in the order they were opened, which is
+        # also the order of their deadlines
+        self._batches: Dict[BatchKey, _Batch] = {}
+        # batches of a key always go through the same sender, so that they
+        # reach the broker in order
+        self._senders = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"produce-sender-{index}")
+            for index in range(senders)
+        ]
+        self._thread = threading.Thread(target=self._run, name="produce-flusher", daemon=True)
+        self._stats_lock = threading.Lock()
+        self._batches_sent = 0
+        self._messages = 0
+        self._failed_batches = 0
+        self._max_batch_size = 0
+        self._send_seconds = 0.0
+        self._max_send_seconds = 0.0
+
+    def start(self) -> None:
+        """Start the flusher thread."""
+        self._thread.start()
+
+    def append(
+        self,
+        broker_host: str,
+        topic_name: str,
+        partition_index: int,
+        producer_id: str,
+        message: str,
+        encoding: str = "utf-8",
+    ) -> int:
+        """Add a message to the batch of its partition and block until the
+        broker acknowledged it. Return the offset of the message."""
+        future = self.submit(broker_host, topic_name, partition_index, producer_id, message, encoding)
+        try:
+            return future.result(self._timeout)
+        except TimeoutError:
+            raise Exception(f"Timed out producing message on broker {broker_host}")
+
+    def submit(
+        self,
+        broker_host: str,
+        topic_name: str,
+        partition_index: int,
+        producer_id: str,
+        message: str,
+        encoding: str = "utf-8",
+    ) -> Future:
+        """Add a message to the batch of its partition and return a future
+        resolved with its offset once the broker acknowledged it."""
+        key = (broker_host, topic_name, partition_index, producer_id, encoding)
+        future: Future = Future()
+        ready = []
+        with self._condition:
+            batch = self._batches.get(key)
+            if batch is not None and batch.size + len(message) > self._batch_max_bytes:
+                ready.append((key, self._batches.pop(key)))
+                batch = None
+            if batch is None:
+                batch = _Batch(time.monotonic() + self._linger)
+                self._batches[key] = batch
+                self._condition.notify()
+            batch.messages.append(message)
+            batch.futures.append(future)
+            batch.size += len(message)
+            if len(batch.messages) >= self._batch_size:
+                ready.append((key, self._batches.pop(key)))
+        for key, batch in ready:
+            self._dispatch(key, batch)
+        return future
+
+    def _expired_batches(self) -> List[Tuple[BatchKey, _Batch]]:
+        """Block until the linger of the oldest batch expires, then remove
+        and return the expired batches."""
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                expired = []
+                for key, batch in self._batches.items():
+                    if batch.deadline > now:
+                        break
+                    expired.append(key)
+                if len(expired) > 0:
+                    return [(key, self._batches.pop(key)) for key in expired]
+                if len(self._batches) == 0:
+                    self._condition.wait()
+                else:
+                    self._condition.wait(next(iter(self._batches.values())).deadline - now)
+
+    def _run(self) -> None:
+        while True:
+            for key, batch in self._expired_batches():
+                self._dispatch(key, batch)
+
+    def _dispatch(self, key: BatchKey, batch: _Batch) -> None:
+        self._senders[hash(key) % len(self._senders)].submit(self._send, key, batch)
+
+    def _send(self, key: BatchKey, batch: _Batch) -> None:
+        """Forward a batch to its broker and resolve the futures of its
+        messages."""
+        broker_host, topic_name, partition_index, producer_id, encoding = key
+        started = time.monotonic()
+        error = None
+        try:
+            response = self._broker_client.post(
+                broker_host,
+                "/producer/produce_batch",
+                **send_kwargs(
+                    {
+                        "topic": topic_name,
+                        "producer_id": producer_id,
+                        "partition_index": partition_index,
+                        "encoding": encoding,
+                        "messages": batch.messages,
+                    },
+                    self._mimetype,
+                    self._trusted_hop_token,
+                ),
+            )
+            response_json = load_response(response)
+            if response_json["status"] != "success":
+                error = Exception(response_json["message"])
+            elif len(response_json["offsets"]) != len(batch.futures):
+                error = Exception(f"Unable to produce message on broker {broker_host}")
+            else:
+                for future, offset in zip(batch.futures, response_json["offsets"]):
+                    future.set_result(offset)
+        except Exception as e:
+            error = Exception(f"Unable to produce message on broker {broker_host}")
+        finally:
+            # no request thread is left waiting on a message of the batch
+            for future in batch.futures:
+                if not future.done():
+                    future.set_exception(error or Exception(f"Unable to produce message on broker {broker_host}"))
+        self._record(len(batch.messages), time.monotonic() - started, failed=error is not None)
+
+    def _record(self, batch_size: int, send_seconds: float, failed: bool = False) -> None:
+        """Record the size and latency of a forwarded batch."""
+        with self._stats_lock:
+            self._batches_sent += 1
+            self._messages += batch_size
+            if failed:
+                self._failed_batches += 1
+            self._max_batch_size = max(self._max_batch_size, batch_size)
+            self._send_seconds += send_seconds
+            self._max_send_seconds = max(self._max_send_seconds, send_seconds)
+
+    def get_stats(self) -> Dict[str, float]:
+        """Return the batch size and latency statistics."""
+        with self._condition:
+            pending = sum(len(batch.messages) for batch in self._batches.values())
+        with self._stats_lock:
+            batches = max(self._batches_sent, 1)
+            return {
+                "linger_ms": self._linger * 1000,
+                "batch_size": self._batch_size,
+                "batch_max_bytes": self._batch_max_bytes,
+                "pending": pending,
+                "batches": self._batches_sent,
+                "failed_batches": self._failed_batches,
+                "messages": self._messages,
+                "avg_batch_size": self._messages / batches,
+                "max_batch_size": self._max_batch_size,
+                "avg_send_ms": self._send_seconds / batches * 1000,
+                "max_send_ms": self._max_send_seconds * 1000,
+            }
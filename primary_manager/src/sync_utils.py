@@ -1,40 +1,79 @@
-import requests
+import asyncio
 import aiohttp
 import os
-from typing import Dict, Any
+from concurrent.futures import Future
+from typing import Dict, Any, List, Tuple
 
-from src import AsyncRequests
+from flask import current_app
 
+from src import AsyncLoop
 
-async_request_handler = AsyncRequests()
+
+async_loop = AsyncLoop()
 
 async def _sync_broker_metadata(
-    session: aiohttp.client.ClientSession, 
-    route: str, 
+    session: aiohttp.client.ClientSession,
+    route: str,
     read_manager_index: int,
     project_name: str,
-    json_data: Dict[str, Any]
-):
+    json_data: Dict[str, Any],
+    timeout_ms: float,
+    retries: int,
+    retry_backoff_ms: float,
+) -> Tuple[int, Any]:
+    """Send the update to a read only manager, retrying up to retries times
+    when it cannot be reached, times out or fails with a server error."""
     url = f"http://{project_name}-readonly_manager-{read_manager_index+1}:5000{route}"
-    async with session.post(url, json=json_data) as response:
-        response_status = response.status
-        response_json = await response.json()
-        return response_status, response_json
+    timeout = aiohttp.ClientTimeout(total=timeout_ms / 1000)
+    for attempt in range(retries + 1):
+        if attempt > 0:
+            await asyncio.sleep(retry_backoff_ms / 1000 * 2 ** (attempt - 1))
+        try:
+            async with session.post(url, json=json_data, timeout=timeout) as response:
+                response_status = response.status
+                if response_status >= 500:
+                    continue
+                response_json = await response.json()
+                return response_status, response_json
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            continue
+    raise Exception(f"Unable to sync {route} to read only manager {read_manager_index+1}.")
 
-def sync_broker_metadata(
-    route: str, 
+async def _sync_all(
+    session: aiohttp.client.ClientSession,
+    route: str,
+    json_data: Dict[str, Any],
+    read_only_count: int,
+    **kwargs: Any
+) -> List[Tuple[int, Any]]:
+    return await asyncio.gather(
+        *(
+            _sync_broker_metadata(session, route, read_manager_index, json_data=json_data, **kwargs)
+            for read_manager_index in range(read_only_count)
+        )
+    )
+
+def submit_broker_metadata(
+    route: str,
     json_data: Dict[str, Any]
-):
-    read_only_count = int(os.environ["READ_REPLICAS"])
-    project_name = os.environ["COMPOSE_PROJECT_NAME"]
-    async_request_handler.run(
-        _sync_broker_metadata, 
-        [
-            {
-                "route": route, 
-                "json_data": json_data, 
-                "read_manager_index": read_manager_index,
-                "project_name": project_name
-            } for read_manager_index in range(read_only_count)
-        ]
+) -> "Future[List[Tuple[int, Any]]]":
+    """Send the update to every read only manager on the async loop and
+    return a future of their (status, response) once all of them answered."""
+    return async_loop.submit(
+        _sync_all,
+        route,
+        json_data,
+        int(os.environ["READ_REPLICAS"]),
+        project_name=os.environ["COMPOSE_PROJECT_NAME"],
+        timeout_ms=current_app.config["SYNC_TIMEOUT_MS"],
+        retries=current_app.config["SYNC_RETRIES"],
+        retry_backoff_ms=current_app.config["SYNC_RETRY_BACKOFF_MS"],
     )
+
+def sync_broker_metadata(
+    route: str,
+    json_data: Dict[str, Any]
+) -> List[Tuple[int, Any]]:
+    """Send the update to every read only manager and wait until all of them
+    answered, so that the update is visible on the read path."""
+    return submit_broker_metadata(route, json_data).result()
@@ -1,8 +1,11 @@
+import base64
+
 from flask import make_response, request, jsonify
 from flask_expects_json import expects_json
 from jsonschema import ValidationError
 
-from src import app, expects_json, data_manager, os, RequestLogDB, sync_broker_metadata
+from src import app, expects_json, data_manager, os, RequestLogDB, sync_broker_metadata, broker_client, produce_accumulator
+from src.wire import forward_kwargs, load_response
 import requests
 
 @app.errorhandler(400)
@@ -22,7 +25,13 @@ def bad_request(error):
 @expects_json(
     {
         "type": "object",
-        "properties": {"name": {"type": "string"},"number_of_partitions":{"type":"number"}},
+        "properties": {
+            "name": {"type": "string"},
+            "number_of_partitions":{"type":"number"},
+            "retention_ms": {"type": "integer", "minimum": 1},
+            "retention_bytes": {"type": "integer", "minimum": 1},
+            "retention_messages": {"type": "integer", "minimum": 1},
+        },
         "required": ["name"],
     }
 )
@@ -32,6 +41,12 @@ def topics(): # HEALTHCHECK
     # If method is POST add a topic
     if request.method == "POST":
         topic_name = request.get_json()["name"]
+        # the retention of the topic is enforced by the brokers
+        retention = {
+            key: request.get_json()[key]
+            for key in ("retention_ms", "retention_bytes", "retention_messages")
+            if key in request.get_json()
+        }
         try:
             broker_hosts = []
             # add default none arg to data manager funcs
@@ -42,13 +57,13 @@ def topics(): # HEALTHCHECK
             for i in range(len(broker_hosts)):
                 if data_manager.broker_is_active(broker_hosts[i]):
                     try:
-                        response = requests.post("http://"+broker_hosts[i]+":5000/topics",json = {"name":topic_name,"partition_index":i})
+                        response = broker_client.post(broker_hosts[i], "/topics", json = {"name":topic_name,"partition_index":i, **retention})
                     except Exception as e:
                         app.logger.info(f"Unable to create topic {topic_name} on broker {broker_hosts[i]}, queueing for later")
-                        data_manager.queue_request(broker_hosts[i], "http://"+broker_hosts[i]+":5000/topics", {"name":topic_name,"partition_index":i})
+                        data_manager.queue_request(broker_hosts[i], broker_client.url(broker_hosts[i], "/topics"), {"name":topic_name,"partition_index":i, **retention})
                 else:
                     app.logger.info(f"Unable to create topic {topic_name} on broker {broker_hosts[i]}, queueing for later")
-                    data_manager.queue_request(broker_hosts[i], "http://"+broker_hosts[i]+":5000/topics", {"name":topic_name,"partition_index":i})                
+                    data_manager.queue_request(broker_hosts[i], broker_client.url(broker_hosts[i], "/topics"), {"name":topic_name,"partition_index":i, **retention})                
             
             # send updates to read only managers
             # read_only_count = int(os.environ["READ_REPLICAS"])
@@ -106,6 +121,7 @@ def register_producer():
         if not data_manager._contains(topic_name):
             requests.post("http://primary:5000/topics",json = {"name":topic_name}) 
         producer_id,partition_count = data_manager.add_producer(topic_name)
+        register_on_brokers(topic_name, "/producer/register", {"topic":topic_name,"producer_id":producer_id})
         return make_response(
             jsonify({
                 "status": "success", 
@@ -118,6 +134,27 @@ def register_producer():
             jsonify({"status": "failure", "message": str(e)}), 400
         )
 
+def register_on_brokers(topic_name, route, json_data):
+    """Send a registration on the topic to the broker of every partition,
+    with the index of the partition, queueing it for the inactive brokers."""
+    broker_hosts = data_manager.get_broker_list_for_topic(topic_name)
+    for i in range(len(broker_hosts)):
+        partition_data = dict(json_data, partition_index=i)
+        if data_manager.broker_is_active(broker_hosts[i]):
+            try:
+                response = broker_client.post(broker_hosts[i], route, json = partition_data)
+            except Exception as e:
+                app.logger.warning(f"Unable to send {route} of topic {topic_name} to broker {broker_hosts[i]}, queueing for later")
+                data_manager.queue_request(broker_hosts[i], broker_client.url(broker_hosts[i], route), partition_data)
+        else:
+            app.logger.warning(f"Unable to send {route} of topic {topic_name} to broker {broker_hosts[i]}, queueing for later")
+            data_manager.queue_request(broker_hosts[i], broker_client.url(broker_hosts[i], route), partition_data)
+
+def register_consumer_on_brokers(topic_name, consumer_id):
+    """Register a consumer id on the broker of every partition of the topic,
+    queueing the registration for the inactive brokers."""
+    register_on_brokers(topic_name, "/consumer/register", {"topic":topic_name,"consumer_id":consumer_id})
+
 @app.route(rule="/consumer/register", methods=["POST"])
 @expects_json(
     {
@@ -132,17 +169,7 @@ def register_consumer(): # HEALTHCHECK
 
     try:
         consumer_id,partition_count = data_manager.add_consumer(topic_name)
-        broker_hosts = data_manager.get_broker_list_for_topic(topic_name)
-        for i in range(len(broker_hosts)):
-            if data_manager.broker_is_active(broker_hosts[i]):
-                try:
-                    response = requests.post("http://"+broker_hosts[i]+":5000/consumer/register",json = {"topic":topic_name,"consumer_id":consumer_id,"partition_index":i})
-                except Exception as e:
-                    app.logger.warning(f"Unable to register consumer {consumer_id} on broker {broker_hosts[i]}, queueing for later")
-                    data_manager.queue_request(broker_hosts[i], "http://"+broker_hosts[i]+":5000/consumer/register", {"topic":topic_name,"consumer_id":consumer_id,"partition_index":i})
-            else:
-                app.logger.warning(f"Unable to register consumer {consumer_id} on broker {broker_hosts[i]}, queueing for later")
-                data_manager.queue_request(broker_hosts[i], "http://"+broker_hosts[i]+":5000/consumer/register", {"topic":topic_name,"consumer_id":consumer_id,"partition_index":i})
+        register_consumer_on_brokers(topic_name, consumer_id)
         # read_only_count = int(os.environ["READ_REPLICAS"])
         # project_name = os.environ["COMPOSE_PROJECT_NAME"]
         # for i in range(read_only_count): #async
@@ -171,6 +198,116 @@ def register_consumer(): # HEALTHCHECK
         )
 
 
+@app.route(rule="/consumer/group/join", methods=["POST"])
+@expects_json(
+    {
+        "type": "object",
+        "properties": {"topic": {"type": "string"}, "group": {"type": "string"}},
+        "required": ["topic", "group"],
+    }
+)
+def join_group():
+    """Add a consumer to a consumer group of a topic and return the
+    partitions assigned to it."""
+    topic_name = request.get_json()["topic"]
+    group_name = request.get_json()["group"]
+    try:
+        group, member_id = data_manager.join_group(topic_name, group_name)
+        return make_response(
+            jsonify({
+                "status": "success",
+                "consumer_id": member_id,
+                "generation": group.get_generation(),
+                "partitions": group.get_partitions(member_id),
+                "partition_count": data_manager.get_partition_count(topic_name)}),
+            200,
+        )
+    except Exception as e:
+        return make_response(
+            jsonify({"status": "failure", "message": str(e)}), 400
+        )
+
+@app.route(rule="/consumer/group/heartbeat", methods=["POST"])
+@expects_json(
+    {
+        "type": "object",
+        "properties": {
+            "topic": {"type": "string"},
+            "group": {"type": "string"},
+            "consumer_id": {"type": "string"},
+        },
+        "required": ["topic", "group", "consumer_id"],
+    }
+)
+def group_heartbeat():
+    """Keep a member of a consumer group alive and return the partitions
+    currently assigned to it."""
+    consumer_id = request.get_json()["consumer_id"]
+    try:
+        group = data_manager.get_group(request.get_json()["topic"], request.get_json()["group"])
+        group.heartbeat(consumer_id)
+        return make_response(
+            jsonify({
+                "status": "success",
+                "generation": group.get_generation(),
+                "partitions": group.get_partitions(consumer_id)}),
+            200,
+        )
+    except Exception as e:
+        return make_response(
+            jsonify({"status": "failure", "message": str(e)}), 400
+        )
+
+@app.route(rule="/consumer/group/leave", methods=["POST"])
+@expects_json(
+    {
+        "type": "object",
+        "properties": {
+            "topic": {"type": "string"},
+            "group": {"type": "string"},
+            "consumer_id": {"type": "string"},
+        },
+        "required": ["topic", "group", "consumer_id"],
+    }
+)
+def leave_group():
+    """Remove a member from a consumer group, its partitions are assigned to
+    the other members."""
+    try:
+        data_manager.leave_group(
+            request.get_json()["topic"], request.get_json()["group"], request.get_json()["consumer_id"]
+        )
+        return make_response(jsonify({"status": "success"}), 200)
+    except Exception as e:
+        return make_response(
+            jsonify({"status": "failure", "message": str(e)}), 400
+        )
+
+
+@app.route(rule="/metadata", methods=["GET"])
+@expects_json(
+    {
+        "type": "object",
+        "properties": {"topic": {"type": "string"}},
+        "required": ["topic"],
+    }
+)
+def metadata():
+    """Return the broker of every partition of a topic and the version of
+    the partition map, for producers sending their logs to the brokers
+    directly."""
+    topic_name = request.get_json()["topic"]
+    try:
+        map_version, partitions = data_manager.get_partition_map(topic_name)
+        return make_response(
+            jsonify({"status": "success", "map_version": map_version, "partitions": partitions}),
+            200,
+        )
+    except Exception as e:
+        return make_response(
+            jsonify({"status": "failure", "message": str(e)}), 400
+        )
+
 @app.route(rule="/producer/produce", methods=["POST"])
 @expects_json(
     {
@@ -179,6 +316,7 @@ def register_consumer(): # HEALTHCHECK
             "topic": {"type": "string"},
             "producer_id": {"type": "string"},
             "message": {"type": "string"},
+            "encoding": {"type": "string", "enum": ["utf-8", "base64"]},
             "partition_index": {"type":"number"},
         },
         "required": ["topic", "producer_id", "message"],
@@ -188,21 +326,36 @@ def produce(): # HEALTHCHECK
     """Add a log to a topic."""
     topic_name = request.get_json()["topic"]
     producer_id = request.get_json()["producer_id"]
-    message = request.get_json()["message"]
     try:
         partition_index = None
         if "partition_index" in request.get_json():
             partition_index = request.get_json()["partition_index"]
         
         broker_host, partition_index = data_manager.get_broker_host(topic_name, producer_id, partition_index)
+        if app.config["PRODUCE_LINGER_MS"] > 0:
+            encoding = request.get_json().get("encoding", "utf-8")
+            message = request.get_json()["message"]
+            # a bad message would fail the whole batch it is forwarded in
+            if encoding == "base64":
+                try:
+                    base64.b64decode(message, validate=True)
+                except Exception:
+                    raise Exception("Message is not valid base64.")
+            produce_accumulator.append(broker_host, topic_name, partition_index, producer_id, message, encoding)
+            return make_response(
+                jsonify({"status": "success"}),
+                200,
+            )
         try:
-            response = requests.post(
-                "http://"+broker_host+":5000/producer/produce",
-                json = {
-                    "topic":topic_name, 
-                    "producer_id":producer_id,
-                    "message":message,
-                    "partition_index":partition_index})
+            # the body is forwarded as it is when it names the partition
+            response = broker_client.post(
+                broker_host, "/producer/produce",
+                **forward_kwargs(
+                    None
+                    if "partition_index" in request.get_json()
+                    else dict(request.get_json(), partition_index=partition_index)
+                ),
+            )
         except Exception as e:
             raise Exception(f"Unable to produce message on broker {broker_host}")
         
@@ -216,6 +369,63 @@ def produce(): # HEALTHCHECK
         )
 
 
+@app.route(rule="/producer/produce_batch", methods=["POST"])
+@expects_json(
+    {
+        "type": "object",
+        "properties": {
+            "topic": {"type": "string"},
+            "producer_id": {"type": "string"},
+            "messages": {"type": "array", "items": {"type": "string"}, "minItems": 1},
+            "encoding": {"type": "string", "enum": ["utf-8", "base64"]},
+            "codec": {"type": "string", "enum": ["zlib", "zstd", "lz4"]},
+            "payload": {"type": "string"},
+            "count": {"type": "integer", "minimum": 1},
+            "partition_index": {"type":"number"},
+        },
+        "required": ["topic", "producer_id"],
+        "oneOf": [
+            {"required": ["messages"]},
+            {"required": ["codec", "payload", "count"]},
+        ],
+    }
+)
+def produce_batch():
+    """Add a batch of logs to a partition of a topic. Compressed batches
+    are forwarded to the broker as they are."""
+    topic_name = request.get_json()["topic"]
+    producer_id = request.get_json()["producer_id"]
+    try:
+        partition_index = None
+        if "partition_index" in request.get_json():
+            partition_index = request.get_json()["partition_index"]
+
+        broker_host, partition_index = data_manager.get_broker_host(topic_name, producer_id, partition_index)
+        try:
+            response = broker_client.post(
+                broker_host, "/producer/produce_batch",
+                **forward_kwargs(
+                    None
+                    if "partition_index" in request.get_json()
+                    else dict(request.get_json(), partition_index=partition_index)
+                ),
+            )
+            response_json = load_response(response)
+        except Exception as e:
+            raise Exception(f"Unable to produce messages on broker {broker_host}")
+        if response_json["status"] != "success":
+            raise Exception(response_json["message"])
+
+        return make_response(
+            jsonify({"status": "success", "offsets": response_json["offsets"], "partition_index": partition_index}),
+            200,
+        )
+    except Exception as e:
+        return make_response(
+            jsonify({"status": "failure", "message": str(e)}), 400
+        )
+
+
 @app.route(rule="/admin/broker/add", methods=["POST"])
 @expects_json(
     {
@@ -356,3 +566,19 @@ def deactivate_broker():
             jsonify({"status": "failure", "message": str(e)}), 400
         )
     return make_response(jsonify({"status": "success",}),200,)
+
+@app.route(rule="/metrics", methods=["GET"])
+def metrics():
+    """Return the statistics of the connections to the brokers, of the
+    produce accumulator and the load of the brokers."""
+    return make_response(
+        jsonify({
+            "status": "success",
+            "metrics": {
+                "broker_client": broker_client.get_stats(),
+                "produce_accumulator": produce_accumulator.get_stats(),
+                "broker_loads": data_manager.get_broker_loads(),
+            },
+        }),
+        200,
+    )
@@ -2,6 +2,17 @@ import os
 
 class Config:
     """Base config."""
+    # shared secret sent to the brokers in the X-Trusted-Hop header of the
+    # requests forwarded to them, so that they skip validating what the
+    # manager already validated (empty to let the brokers validate)
+    TRUSTED_HOP_TOKEN = os.environ.get("TRUSTED_HOP_TOKEN", "")
+    # keep-alive connections to the brokers: connect and read timeouts of
+    # every request, idle connections kept per broker and number of
+    # brokers with a pool
+    BROKER_CONNECT_TIMEOUT_MS = float(os.environ.get("BROKER_CONNECT_TIMEOUT_MS", 1000))
+    BROKER_READ_TIMEOUT_MS = float(os.environ.get("BROKER_READ_TIMEOUT_MS", 10000))
+    BROKER_POOL_MAXSIZE = int(os.environ.get("BROKER_POOL_MAXSIZE", 32))
+    BROKER_POOL_HOSTS = int(os.environ.get("BROKER_POOL_HOSTS", 16))
 
 db_name = os.environ["DB_NAME"]
 
@@ -1,4 +1,6 @@
 from db_models.brokers import Broker as BrokerDB
 from db_models.topics import Topic as TopicDB
 from db_models.partitions import Partition as PartitionDB
-from db_models.consumers import Consumer as ConsumerDB
\ No newline at end of file
+from db_models.consumers import Consumer as ConsumerDB
+from db_models.consumer_groups import ConsumerGroup as ConsumerGroupDB
+from db_models.group_members import GroupMember as GroupMemberDB
\ No newline at end of file
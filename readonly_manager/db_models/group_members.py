@@ -0,0 +1,11 @@
+from src import db
+
+
+class GroupMember(db.Model):
+    __tablename__ = "group_member"
+    id = db.Column(db.String(32), primary_key=True, index=True)
+    group_id = db.Column(
+        db.String(32), db.ForeignKey("consumer_group.id"), nullable=False
+    )
+    # the partition indices assigned to the member
+    partitions = db.Column(db.JSON, nullable=False)
@@ -2,12 +2,22 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 
 from src.json_validator import expects_json
+from src.wire import WireJSONProvider, WireRequest
+from src.broker_client import BrokerClient
 import config
 import os
 import requests
 
 app = Flask(__name__)
+app.request_class = WireRequest
+app.json = WireJSONProvider(app)
 app.config.from_object(config.DevConfig)
+broker_client = BrokerClient(
+    app.config["BROKER_CONNECT_TIMEOUT_MS"],
+    app.config["BROKER_READ_TIMEOUT_MS"],
+    app.config["BROKER_POOL_MAXSIZE"],
+    app.config["BROKER_POOL_HOSTS"],
+)
 db = SQLAlchemy(app)
 from db_models import *
 
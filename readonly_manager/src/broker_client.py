@@ -0,0 +1,102 @@
+import threading
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+BROKER_PORT = 5000
+
+
+class BrokerClient:
+    """
+    HTTP client of the brokers, shared by every thread of the manager.
+
+    Connections are kept alive in a pool per broker host (at most
+    pool_maxsize idle connections each, for up to pool_hosts hosts), so that
+    forwarded requests do not open a new TCP connection each. Every request
+    is bounded by the connect and read timeouts. Requests waiting on the
+    broker (long-polling consumes) get their wait added to the read timeout,
+    and streamed responses have no read timeout.
+    """
+
+    def __init__(
+        self,
+        connect_timeout_ms: float,
+        read_timeout_ms: float,
+        pool_maxsize: int,
+        pool_hosts: int,
+    ) -> None:
+        self._connect_timeout = connect_timeout_ms / 1000
+        self._read_timeout = read_timeout_ms / 1000
+        self._adapter = HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_maxsize)
+        self._session = requests.Session()
+        self._session.mount("http://", self._adapter)
+        self._lock = threading.Lock()
+        # requests sent, and the ones that failed or timed out
+        self._counts = {"requests": 0, "errors": 0, "timeouts": 0}
+
+    def url(self, broker_host: str, route: str) -> str:
+        """Return the url of a route of a broker."""
+        return f"http://{broker_host}:{BROKER_PORT}{route}"
+
+    def request(self, method: str, broker_host: str, route: str, **kwargs: Any) -> requests.Response:
+        """Send a request to a route of a broker, kwargs are passed on to
+        request_url."""
+        return self.request_url(method, self.url(broker_host, route), **kwargs)
+
+    def request_url(
+        self, method: str, url: str, wait_ms: float = 0, stream: bool = False, **kwargs: Any
+    ) -> requests.Response:
+        """Send a request to the url of a broker route, waiting up to wait_ms
+        more than the read timeout. kwargs are passed on to requests."""
+        read_timeout: Optional[float] = None
+        if not stream:
+            read_timeout = self._read_timeout + wait_ms / 1000
+        self._count("requests")
+        try:
+            return self._session.request(
+                method,
+                url,
+                timeout=(self._connect_timeout, read_timeout),
+                stream=stream,
+                **kwargs,
+            )
+        except requests.exceptions.Timeout:
+            self._count("timeouts")
+            raise
+        except requests.exceptions.RequestException:
+            self._count("errors")
+            raise
+
+    def get(self, broker_host: str, route: str, **kwargs: Any) -> requests.Response:
+        return self.request("GET", broker_host, route, **kwargs)
+
+    def post(self, broker_host: str, route: str, **kwargs: Any) -> requests.Response:
+        return self.request("POST", broker_host, route, **kwargs)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counts[name] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return the request counts and the state of the pool of every
+        broker host."""
+        pools = {}
+        container = self._adapter.poolmanager.pools
+        for key in list(container.keys()):
+            pool = container.get(key)
+            if pool is None:
+                continue
+            pools[f"{pool.host}:{pool.port}"] = {
+                # connections opened since the pool was created
+                "connections_opened": pool.num_connections,
+                "requests": pool.num_requests,
+                "idle_connections": pool.pool.qsize() if pool.pool is not None else 0,
+            }
+        with self._lock:
+            return {
+                "connect_timeout_ms": self._connect_timeout * 1000,
+                "read_timeout_ms": self._read_timeout * 1000,
+                **self._counts,
+                "pools": pools,
+            }
@@ -3,14 +3,131 @@
 Modified implementation of flask-expects-json under MIT license
 https://pypi.org/project/flask-expects-json/
 
+Validators are compiled once per route, when the route is declared. Flat
+schemas (objects of scalar properties, arrays of strings, enums, bounds,
+required keys and oneOf between sets of required keys) are first checked by
+a hand-rolled validator. Only the bodies it rejects, and the schemas it does
+not cover, go through jsonschema. Requests carrying the TRUSTED_HOP_TOKEN of
+the app in their TRUSTED_HOP_HEADER come from another service that already
+validated them, and are not validated again.
+
 """
 
+import hmac
 from functools import wraps
-from typing import Iterable
+from typing import Any, Callable, Dict, Iterable, Optional
 
 from flask import request, g, abort, current_app
 
-from jsonschema import validate, ValidationError, FormatChecker
+from jsonschema import ValidationError, FormatChecker
+from jsonschema.exceptions import best_match
+from jsonschema.validators import validator_for
+
+TRUSTED_HOP_HEADER = "X-Trusted-Hop"
+
+_TYPE_CHECKS: Dict[str, Callable[[Any], bool]] = {
+    "string": lambda value: isinstance(value, str),
+    "integer": lambda value: isinstance(value, int) and not isinstance(value, bool),
+    "number": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    "boolean": lambda value: isinstance(value, bool),
+    "object": lambda value: isinstance(value, dict),
+}
+_PROPERTY_KEYWORDS = {"type", "enum", "minimum", "items", "minItems"}
+_SCHEMA_KEYWORDS = {"type", "properties", "required", "oneOf"}
+
+
+def _fast_property_check(schema: Dict[str, Any]) -> Optional[Callable[[Any], bool]]:
+    """Return a check of a value against a flat property schema, or None if
+    the schema is not flat."""
+    if not set(schema.keys()) <= _PROPERTY_KEYWORDS:
+        return None
+    checks = []
+    if schema.get("type") == "array":
+        if schema.get("items") != {"type": "string"}:
+            return None
+        min_items = schema.get("minItems", 0)
+        checks.append(
+            lambda value: isinstance(value, list)
+            and len(value) >= min_items
+            and all(isinstance(item, str) for item in value)
+        )
+    elif "type" in schema:
+        if schema["type"] not in _TYPE_CHECKS or "items" in schema or "minItems" in schema:
+            return None
+        checks.append(_TYPE_CHECKS[schema["type"]])
+    if "enum" in schema:
+        enum = schema["enum"]
+        if not all(isinstance(item, str) for item in enum):
+            return None
+        enum = frozenset(enum)
+        checks.append(lambda value: isinstance(value, str) and value in enum)
+    if "minimum" in schema:
+        minimum = schema["minimum"]
+        checks.append(
+            lambda value: isinstance(value, (int, float)) and not isinstance(value, bool) and value >= minimum
+        )
+    return lambda value: all(check(value) for check in checks)
+
+
+def _fast_check(schema: Dict[str, Any]) -> Optional[Callable[[Any], bool]]:
+    """Return a check of a body against a flat object schema, or None if the
+    schema is not flat. The check may reject valid bodies (integral floats
+    for "integer", for instance) but never accepts an invalid one."""
+    if schema.get("type") != "object" or not set(schema.keys()) <= _SCHEMA_KEYWORDS:
+        return None
+    properties = []
+    for name, property_schema in schema.get("properties", {}).items():
+        check = _fast_property_check(property_schema)
+        if check is None:
+            return None
+        properties.append((name, check))
+    required = tuple(schema.get("required", ()))
+    one_of = []
+    for option in schema.get("oneOf", ()):
+        if set(option.keys()) != {"required"}:
+            return None
+        one_of.append(tuple(option["required"]))
+
+    def check(data: Any) -> bool:
+        if not isinstance(data, dict):
+            return False
+        for name in required:
+            if name not in data:
+                return False
+        for name, check_property in properties:
+            if name in data and not check_property(data[name]):
+                return False
+        if len(one_of) > 0:
+            matches = sum(all(name in data for name in option) for option in one_of)
+            if matches != 1:
+                return False
+        return True
+
+    return check
+
+
+def compile_validator(schema: Dict[str, Any], format_checker: Optional[FormatChecker] = None):
+    """Check schema and return a function validating a body against it,
+    which returns the best matching error or None."""
+    cls = validator_for(schema)
+    cls.check_schema(schema)
+    validator = cls(schema, format_checker=format_checker)
+    fast_check = _fast_check(schema) if format_checker is None else None
+
+    def validate(data: Any) -> Optional[ValidationError]:
+        if fast_check is not None and fast_check(data):
+            return None
+        return best_match(validator.iter_errors(data))
+
+    return validate
+
+
+def is_trusted_hop(headers: Any, token: str) -> bool:
+    """Return whether a request with the given headers carries the trusted
+    hop token (an empty token trusts no request)."""
+    if not token:
+        return False
+    return hmac.compare_digest(headers.get(TRUSTED_HOP_HEADER, ""), token)
 
 
 def expects_json(schema=None, ignore_for=None, check_formats=False):
@@ -22,6 +139,18 @@ def expects_json(schema=None, ignore_for=None, check_formats=False):
                 'Methods should be wrapped in an iterable. i.e. ignore_for=["GET"]'
             )
 
+    format_checker = None
+
+    if check_formats:
+        if isinstance(check_formats, bool):
+            format_checker = FormatChecker()
+        elif isinstance(check_formats, Iterable):
+            format_checker = FormatChecker(check_formats)
+        else:
+            raise TypeError("check_formats must be bool or iterable")
+
+    validate = compile_validator(schema, format_checker)
+
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
@@ -38,20 +167,10 @@ def expects_json(schema=None, ignore_for=None, check_formats=False):
                     ),
                 )
 
-            format_checker = None
-
-            if check_formats:
-                if isinstance(check_formats, Iterable):
-                    format_checker = FormatChecker(check_formats)
-                elif isinstance(check_formats, bool):
-                    format_checker = FormatChecker()
-                else:
-                    return abort(400, "check_format must be bool or iterable")
-
-            try:
-                validate(data, schema, format_checker=format_checker)
-            except ValidationError as e:
-                return abort(400, e)
+            if not is_trusted_hop(request.headers, current_app.config.get("TRUSTED_HOP_TOKEN", "")):
+                error = validate(data)
+                if error is not None:
+                    return abort(400, error)
 
             g.data = data
 
@@ -62,4 +181,4 @@ def expects_json(schema=None, ignore_for=None, check_formats=False):
 
         return decorated_function
 
-    return decorator
\ No newline at end of file
+    return decorator
@@ -4,7 +4,7 @@ from datetime import datetime
 import random
 
 from src.models import Broker, Topic
-from src import BrokerDB, TopicDB, PartitionDB, ConsumerDB
+from src import BrokerDB, TopicDB, PartitionDB, ConsumerDB, ConsumerGroupDB, GroupMemberDB
 
 class ReadonlyManager:
     """
@@ -61,6 +61,13 @@ class ReadonlyManager:
             consumers = ConsumerDB.query.filter_by(topic_name=topic.name).all()
             for consumer in consumers:
                 self._topics[topic.name].add_consumer(consumer.id)
+            # Populate the members of the consumer groups of this topic
+            groups = ConsumerGroupDB.query.filter_by(topic_name=topic.name).all()
+            for group in groups:
+                members = GroupMemberDB.query.filter_by(group_id=group.id).all()
+                self._topics[topic.name].set_group(
+                    group.id, group.generation, {member.id: member.partitions for member in members}
+                )
 
     def get_broker(self, topic_name: str, partition_number: int) -> Broker:
         """
@@ -92,6 +99,36 @@ class ReadonlyManager:
         """
         return self._topics[topic_name].get_and_increment_next_partition(consumer_id)
 
+    def get_readable_partitions(self, topic_name: str, consumer_id: str, first_partition: int) -> List[int]:
+        """
+        Return the partitions the consumer may read, in the order to try them
+        starting from first_partition: the partitions assigned to it for a
+        member of a consumer group, every partition otherwise.
+        """
+        member = self._topics[topic_name].get_group_member(consumer_id)
+        if member is None:
+            partitions = list(range(self.get_partition_count(topic_name)))
+        else:
+            partitions = member[1]
+        if first_partition in partitions:
+            start = partitions.index(first_partition)
+            partitions = partitions[start:] + partitions[:start]
+        return partitions
+
+    def get_offset_id(self, topic_name: str, consumer_id: str) -> str:
+        """
+        Return the id under which the brokers keep the offsets of the
+        consumer: the id of its group for a member of a consumer group.
+        """
+        member = self._topics[topic_name].get_group_member(consumer_id)
+        return consumer_id if member is None else member[0]
+
+    def set_group(self, topic_name: str, group_id: str, generation: int, assignment: Dict[str, List[int]]) -> None:
+        """Update the members of a consumer group and their partitions."""
+        if not self.has_topic(topic_name):
+            raise Exception("Topic does not exist.")
+        self._topics[topic_name].set_group(group_id, generation, assignment)
+
     # def round_robin_turn_counter_increment(self) -> None:
     #     """
     #     Increment the round robin turn counter by 1 modulo number of brokers
@@ -131,6 +168,9 @@ class ReadonlyManager:
             raise Exception("Invalid partition number.")
         if not self.is_registered(consumer_id, topic_name):
             raise Exception("Consumer not registered with topic.")
+        member = self._topics[topic_name].get_group_member(consumer_id)
+        if partition_number is not None and member is not None and partition_number not in member[1]:
+            raise Exception("Partition not assigned to the consumer.")
     
     def add_consumer_to_topic(self,topic_name : str, consumer_id : str) -> None:
         with self._lock:
@@ -1,6 +1,6 @@
 import random
 import threading
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 
 class Topic:
     def __init__(self, topic_name: str, partition_count: int):
@@ -8,6 +8,11 @@ class Topic:
         self._topic_name = topic_name
         self._consumers_to_next_ptn: Dict[str,int] = {}
         self._partition_count = partition_count
+        # members of the consumer groups of the topic, with their group id
+        # and assigned partitions, and the generation of every group
+        self._group_members: Dict[str, Tuple[str, List[int]]] = {}
+        self._group_generations: Dict[str, int] = {}
+        self._group_turns: Dict[str, int] = {}
 
     def get_topic_name(self) -> str:
         """Return the name of the topic."""
@@ -18,8 +23,8 @@ class Topic:
         return list(self._consumers_to_next_ptn.keys())
 
     def contains(self, consumer_id: str) -> bool:
-        """Check if the consumer is registered."""
-        return consumer_id in self._consumers_to_next_ptn.keys()
+        """Check if the consumer is registered, on its own or in a group."""
+        return consumer_id in self._consumers_to_next_ptn.keys() or consumer_id in self._group_members
 
     def add_consumer(self, consumer_id: str) -> None:
         """Add a consumer to the list of registered consumers."""
@@ -35,9 +40,36 @@ class Topic:
     def get_and_increment_next_partition(self, consumer_id: str) -> int:
         next_partition = -1
         with self._lock:
+            if consumer_id in self._group_members:
+                # members of a group only read their own partitions
+                partitions = self._group_members[consumer_id][1]
+                if len(partitions) == 0:
+                    raise Exception("No partitions assigned to the consumer.")
+                turn = self._group_turns.get(consumer_id, 0)
+                self._group_turns[consumer_id] = turn + 1
+                return partitions[turn % len(partitions)]
             next_partition = self._consumers_to_next_ptn[consumer_id]
             self._consumers_to_next_ptn[consumer_id] = (self._consumers_to_next_ptn[consumer_id] + 1) % self._partition_count
         return next_partition
+
+    def set_group(self, group_id: str, generation: int, assignment: Dict[str, List[int]]) -> None:
+        """Replace the members of a consumer group and their partitions,
+        unless the assignment is older than the known one."""
+        with self._lock:
+            if generation <= self._group_generations.get(group_id, -1):
+                return
+            self._group_generations[group_id] = generation
+            for member_id in [m for m, (g, _) in self._group_members.items() if g == group_id]:
+                del self._group_members[member_id]
+                self._group_turns.pop(member_id, None)
+            for member_id, partitions in assignment.items():
+                self._group_members[member_id] = (group_id, sorted(partitions))
+
+    def get_group_member(self, consumer_id: str) -> Optional[Tuple[str, List[int]]]:
+        """Return the group id and the partitions of a member of a consumer
+        group, None for other consumers."""
+        with self._lock:
+            return self._group_members.get(consumer_id)
     
     def __str__(self) -> str:
         return "topic_name:%s, consumers_to_next_ptn:%s, partition_count:%d" %(
@@ -1,9 +1,10 @@
-from flask import make_response, request, jsonify
+from flask import Response, make_response, request, jsonify, stream_with_context
 from flask_expects_json import expects_json
 from jsonschema import ValidationError
 import logging
 
-from src import app, ro_manager, requests, expects_json
+from src import app, ro_manager, broker_client, expects_json
+from src.wire import forward_kwargs, load_response
 
 
 @app.errorhandler(400)
@@ -19,6 +20,15 @@ def bad_request(error):
     # handle other bad request errors
     return error
 
+def group_offsets_body(topic_name, consumer_id):
+    """Return the request body naming the group of a member of a consumer
+    group, whose offsets the brokers keep, or None to forward the body as
+    it is for other consumers."""
+    offset_id = ro_manager.get_offset_id(topic_name, consumer_id)
+    if offset_id == consumer_id:
+        return None
+    return dict(request.get_json(), consumer_id=offset_id)
+
 @app.route(rule="/topics", methods=["GET"])
 def topics():
     """Return all the topics or add a topic."""
@@ -41,6 +51,11 @@ def topics():
             "topic": {"type": "string"},
             "partition_index": {"type": "number"},
             "consumer_id": {"type": "string"},
+            "max_messages": {"type": "integer", "minimum": 1},
+            "max_bytes": {"type": "integer", "minimum": 1},
+            "wait_ms": {"type": "integer", "minimum": 0},
+            # forwarded to the broker, "base64" for binary bodies
+            "encoding": {"type": "string", "enum": ["utf-8", "base64"]},
         },
         "required": ["topic", "consumer_id"],
     }
@@ -64,33 +79,44 @@ def consume(): # HEALTHCHECK
     except Exception as e:
         try:
             ro_manager.is_request_valid(topic_name, consumer_id)
+            partition_index = ro_manager.find_best_partition(topic_name, consumer_id)
         except Exception as e:
             return make_response(
                 jsonify({"status": "failure", "message": str(e)}), 400
             )
-        partition_index = ro_manager.find_best_partition(topic_name, consumer_id)
 
     try:
-        num_tries = 0
-        response = None
+        response_json = None
         success = False
         found_active_broker = False
-        num_partitions = ro_manager.get_partition_count(topic_name)
+        # Members of a consumer group only read the partitions assigned to
+        # them, and the brokers keep their offsets under the id of the group
+        partitions = [partition_index]
+        if not read_from_given_partition:
+            partitions = ro_manager.get_readable_partitions(topic_name, consumer_id, partition_index)
+        request.get_json()["consumer_id"] = ro_manager.get_offset_id(topic_name, consumer_id)
+        # When any partition may be read, every partition is tried once
+        # without waiting, and only the first one is long polled afterwards
+        wait_ms = request.get_json().pop("wait_ms", 0)
+        first_partition_index = partition_index
         # Try all brokers once, and infer no logs to read only if all brokers say so
-        while num_tries < num_partitions:
+        for partition_index in partitions:
             broker_host = ro_manager.get_broker_host(topic_name, partition_index)[0]
             # Add partition_index to the request data
             json_data = request.get_json()
             json_data["partition_index"] = partition_index
+            if read_from_given_partition:
+                json_data["wait_ms"] = wait_ms
             # Forward this request to a broker, wait for a response
             if ro_manager.broker_is_active(broker_host):
                 try:
-                    response = requests.get(
-                        url = "http://"+broker_host+":5000/consumer/consume",
-                        json = json_data
-                    )
+                    response_json = load_response(broker_client.get(
+                        broker_host, "/consumer/consume",
+                        wait_ms = json_data.get("wait_ms", 0),
+                        **forward_kwargs(json_data)
+                    ))
                     # Check response received from broker, if success, then exit loop
-                    if(response.json()["status"] == "success"):
+                    if(response_json["status"] == "success"):
                         success = True
                         found_active_broker = True
                         break
@@ -98,16 +124,31 @@ def consume(): # HEALTHCHECK
                 except Exception as e:
                     # Broker is not active, try next broker
                     pass
-            num_tries += 1
-            partition_index = (partition_index + 1) % num_partitions
-            # If consumer wanted to read from given partition only, then exit loop
-            if read_from_given_partition == True and num_tries == 1:
-                break
+        if not success and not read_from_given_partition and wait_ms > 0:
+            broker_host = ro_manager.get_broker_host(topic_name, first_partition_index)[0]
+            json_data = request.get_json()
+            json_data["partition_index"] = first_partition_index
+            json_data["wait_ms"] = wait_ms
+            if ro_manager.broker_is_active(broker_host):
+                try:
+                    response_json = load_response(broker_client.get(
+                        broker_host, "/consumer/consume",
+                        wait_ms = json_data.get("wait_ms", 0),
+                        **forward_kwargs(json_data)
+                    ))
+                    success = response_json["status"] == "success"
+                    found_active_broker = True
+                except Exception as e:
+                    pass
         # Reply to consumer
         if found_active_broker:
-            response_dict = {"status": response.json()["status"], "message": response.json()["message"]}
+            response_dict = {"status": response_json["status"]}
+            # single consumes carry "message", batched consumes carry "messages"
+            for key in ("message", "messages"):
+                if key in response_json:
+                    response_dict[key] = response_json[key]
             if success:
-                response_dict["partition_read"] = response.json()["partition_read"] 
+                response_dict["partition_read"] = response_json["partition_read"] 
             return make_response(
                 jsonify(response_dict), 200
             )
@@ -120,6 +161,90 @@ def consume(): # HEALTHCHECK
             jsonify({"status": "failure", "message": str(e)}), 400
         )
 
+@app.route(rule="/consumer/stream", methods=["GET"])
+@expects_json(
+    {
+        "type": "object",
+        "properties": {
+            "topic": {"type": "string"},
+            "partition_index": {"type": "number"},
+            "consumer_id": {"type": "string"},
+            "credits": {"type": "integer", "minimum": 0},
+            "batch_size": {"type": "integer", "minimum": 1},
+            "encoding": {"type": "string", "enum": ["utf-8", "base64"]},
+        },
+        "required": ["topic", "consumer_id", "partition_index"],
+    }
+)
+def stream():
+    """Sanity check and relay a stream of logs from the broker holding the
+    partition."""
+    topic_name = request.get_json()["topic"]
+    consumer_id = request.get_json()["consumer_id"]
+    try:
+        partition_index = int(request.get_json()["partition_index"])
+        ro_manager.is_request_valid(topic_name, consumer_id, partition_index)
+        broker_host = ro_manager.get_broker_host(topic_name, partition_index)[0]
+        if not ro_manager.broker_is_active(broker_host):
+            raise Exception("No active brokers found")
+        response = broker_client.get(
+            broker_host, "/consumer/stream",
+            stream = True,
+            **forward_kwargs(group_offsets_body(topic_name, consumer_id)),
+        )
+    except Exception as e:
+        return make_response(
+            jsonify({"status": "failure", "message": str(e)}), 400
+        )
+    if response.status_code != 200:
+        return make_response(jsonify(load_response(response)), response.status_code)
+
+    def relay():
+        try:
+            for chunk in response.iter_content(chunk_size=None):
+                yield chunk
+        finally:
+            response.close()
+
+    return Response(
+        stream_with_context(relay()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.route(rule="/consumer/stream/credits", methods=["POST"])
+@expects_json(
+    {
+        "type": "object",
+        "properties": {
+            "topic": {"type": "string"},
+            "partition_index": {"type": "number"},
+            "stream_id": {"type": "string"},
+            "credits": {"type": "integer", "minimum": 1},
+        },
+        "required": ["topic", "partition_index", "stream_id", "credits"],
+    }
+)
+def stream_credits():
+    """Forward credits granted to a stream to the broker holding it."""
+    topic_name = request.get_json()["topic"]
+    try:
+        partition_index = int(request.get_json()["partition_index"])
+        if not ro_manager.has_topic(topic_name):
+            raise Exception("Topic does not exist.")
+        broker_host = ro_manager.get_broker_host(topic_name, partition_index)[0]
+        # the broker ignores the topic and partition, the body is forwarded
+        # as it is
+        response = broker_client.post(
+            broker_host, "/consumer/stream/credits",
+            **forward_kwargs(),
+        )
+        return make_response(jsonify(load_response(response)), response.status_code)
+    except Exception as e:
+        return make_response(
+            jsonify({"status": "failure", "message": str(e)}), 400
+        )
+
 @app.route(rule="/size", methods=["GET"])
 @expects_json(
     {
@@ -163,11 +288,11 @@ def size(): # HEALTHCHECK
             # Forward this request to the broker, wait for a response
             if ro_manager.broker_is_active(broker_host):
                 try:
-                    response = requests.get(
-                        url = "http://"+broker_host+":5000/size",
-                        json = request.get_json()
+                    response = broker_client.get(
+                        broker_host, "/size",
+                        **forward_kwargs(group_offsets_body(topic_name, consumer_id))
                     )
-                    sizes.extend(list(response.json()["sizes"]))
+                    sizes.extend(list(load_response(response)["sizes"]))
                     success = True
                 except Exception as e:
                     pass
@@ -242,6 +367,35 @@ def sync_register_consumer():
     except Exception as e:
         raise
 
+@app.route(rule="/sync/consumer/group", methods=["POST"])
+@expects_json(
+    {
+        "type": "object",
+        "properties": {
+            "topic": {"type": "string"},
+            "group_id": {"type": "string"},
+            "generation": {"type": "integer"},
+            "assignment": {"type": "object"},
+        },
+        "required": ["topic", "group_id", "generation", "assignment"],
+    }
+)
+def sync_consumer_group():
+    """Update the members of a consumer group and their partitions in loaded
+    memory"""
+    try:
+        ro_manager.set_group(
+            request.get_json()["topic"],
+            request.get_json()["group_id"],
+            request.get_json()["generation"],
+            request.get_json()["assignment"],
+        )
+    except Exception as e:
+        return make_response(
+            jsonify({"status": "failure", "message": str(e)}), 400
+        )
+    return make_response(jsonify({"status": "success",}),200,)
+
 @app.route(rule="/sync/broker/add", methods=["POST"])
 @expects_json(
     {
@@ -327,4 +481,12 @@ def deactivate_broker():
         return make_response(
             jsonify({"status": "failure", "message": str(e)}), 400
         )
-    return make_response(jsonify({"status": "success",}),200,)
\ No newline at end of file
+    return make_response(jsonify({"status": "success",}),200,)
+
+@app.route(rule="/metrics", methods=["GET"])
+def metrics():
+    """Return the statistics of the connections to the brokers."""
+    return make_response(
+        jsonify({"status": "success", "metrics": {"broker_client": broker_client.get_stats()}}),
+        200,
+    )
@@ -0,0 +1,148 @@
+"""
+Wire formats of the request and response bodies.
+
+Bodies are either JSON or msgpack. A request picks its format with its
+Content-Type, a response is sent in msgpack only when the Accept header of
+the request prefers it over JSON. JSON is encoded with orjson when it is
+installed. Both libraries are optional: without msgpack, msgpack bodies
+are rejected, and without orjson the standard library is used. Requests
+are forwarded to the brokers in the format they were received in, as the
+original body whenever the manager does not change it.
+"""
+
+import json
+from typing import Any, Dict
+
+from flask import Request, current_app, request
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.exceptions import BadRequest, UnsupportedMediaType
+
+from src.json_validator import TRUSTED_HOP_HEADER
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_MIMETYPE = "application/json"
+MSGPACK_MIMETYPE = "application/msgpack"
+
+
+def dumps(obj: Any, mimetype: str = JSON_MIMETYPE, default=None) -> bytes:
+    """Encode obj in the format of mimetype."""
+    if mimetype == MSGPACK_MIMETYPE:
+        if msgpack is None:
+            raise UnsupportedMediaType("msgpack is not supported.")
+        return msgpack.packb(obj, default=default)
+    if orjson is not None:
+        return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=default).encode()
+
+
+def loads(data: bytes, mimetype: str = JSON_MIMETYPE) -> Any:
+    """Decode data in the format of mimetype."""
+    if mimetype == MSGPACK_MIMETYPE:
+        if msgpack is None:
+            raise UnsupportedMediaType("msgpack is not supported.")
+        return msgpack.unpackb(data, raw=False)
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def preferred_mimetype(accept: MIMEAccept) -> str:
+    """Return the format of a response to a request with the given Accept
+    header."""
+    if msgpack is not None and accept.quality(MSGPACK_MIMETYPE) > accept.quality(JSON_MIMETYPE):
+        return MSGPACK_MIMETYPE
+    return JSON_MIMETYPE
+
+
+def response_mimetype() -> str:
+    """Return the format of the response to the current request."""
+    return preferred_mimetype(request.accept_mimetypes)
+
+
+class WireJSONProvider(DefaultJSONProvider):
+    """
+    JSON provider of the app: jsonify responses are negotiated between
+    JSON and msgpack, and JSON is handled by orjson when available.
+    """
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if orjson is None or len(kwargs) > 0:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj, default=self.default).decode()
+
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        if orjson is None or len(kwargs) > 0:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        mimetype = response_mimetype()
+        return self._app.response_class(
+            dumps(obj, mimetype, default=self.default), mimetype=mimetype
+        )
+
+
+class WireRequest(Request):
+    """
+    Request whose get_json also decodes msgpack bodies, so that views and
+    expects_json handle both formats alike.
+    """
+
+    def get_json(self, force: bool = False, silent: bool = False, cache: bool = True) -> Any:
+        if self.mimetype != MSGPACK_MIMETYPE:
+            return super().get_json(force=force, silent=silent, cache=cache)
+        if "_msgpack_body" in self.__dict__:
+            return self.__dict__["_msgpack_body"]
+        try:
+            data = loads(self.get_data(cache=cache), MSGPACK_MIMETYPE)
+        except Exception:
+            if silent:
+                return None
+            raise BadRequest("Failed to decode msgpack body.")
+        if cache:
+            self.__dict__["_msgpack_body"] = data
+        return data
+
+
+def forward_kwargs(data: Any = None) -> Dict[str, Any]:
+    """Return the arguments of requests forwarding the current request to a
+    broker in its own format: the original body when data is None,
+    otherwise data encoded like it. The broker is asked for msgpack
+    responses, to be read with load_response, and is told the request was
+    validated when the manager has a TRUSTED_HOP_TOKEN."""
+    mimetype = MSGPACK_MIMETYPE if request.mimetype == MSGPACK_MIMETYPE else JSON_MIMETYPE
+    body = request.get_data(cache=True) if data is None else dumps(data, mimetype)
+    return {"data": body, "headers": _broker_headers(mimetype, current_app.config["TRUSTED_HOP_TOKEN"])}
+
+
+def send_kwargs(data: Any, mimetype: str, trusted_hop_token: str) -> Dict[str, Any]:
+    """Return the arguments of requests sending data to a broker in the
+    given format, outside of any request of the manager. The request is
+    marked validated with the trusted hop token, if any."""
+    return {"data": dumps(data, mimetype), "headers": _broker_headers(mimetype, trusted_hop_token)}
+
+
+def _broker_headers(mimetype: str, trusted_hop_token: str) -> Dict[str, str]:
+    headers = {"Content-Type": mimetype}
+    if trusted_hop_token:
+        headers[TRUSTED_HOP_HEADER] = trusted_hop_token
+    if msgpack is not None:
+        headers["Accept"] = f"{MSGPACK_MIMETYPE}, {JSON_MIMETYPE};q=0.5"
+    return headers
+
+
+def load_response(response: Any) -> Any:
+    """Decode the body of a response received by requests."""
+    mimetype = response.headers.get("Content-Type", JSON_MIMETYPE).split(";")[0].strip()
+    return loads(response.content, mimetype)